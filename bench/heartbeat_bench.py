@@ -0,0 +1,385 @@
+"""
+Load generator and benchmark scenarios for the Avanguard heartbeat server.
+
+The server runs in this process on localhost, with probes around heartbeat handling and
+offline detection. Simulated clients run in separate worker processes so that they do
+not compete with the server for its event loop. Results are printed, or written with
+--output, as JSON so that runs of different versions can be compared.
+
+Scenarios:
+    steady   N hosts send heartbeats at a fixed rate for a fixed duration.
+    storm    N hosts all connect and send their first heartbeat at the same moment.
+    outage   N hosts run steadily, then a whole site stops; measures detection latency.
+    memory   Measures the memory used per tracked host by the server's host state.
+
+Examples:
+    python bench/heartbeat_bench.py steady --hosts 2000 --rate 1 --duration 10 --transport stream
+    python bench/heartbeat_bench.py outage --hosts 1000 --threshold 2 --output outage.json
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from array import array
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, SRC_DIR)
+
+BENCH_KEY = 'benchmark-key'
+os.environ.setdefault('SERVER_PORT', '0')
+os.environ.setdefault('OFFLINE_THRESHOLD', '60')
+os.environ.setdefault('SECRET_KEY', BENCH_KEY)
+os.environ.setdefault('LOG_SAMPLE_INTERVAL', '60')
+
+from protocol import decode_binary_heartbeat, encode_binary_heartbeat, encode_frame  # noqa: E402
+
+START_DELAY = 1.5
+probes = None
+
+
+def percentile(values, fraction: float) -> float:
+    """
+    Returns the value below which `fraction` of the values fall, or 0.0 if there are none.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def make_heartbeat(host_id: str, sequence: int, wire: str, key: bytes) -> bytes:
+    """
+    Builds a heartbeat the way client.generate_heartbeat does, for an arbitrary host.
+    """
+    if wire == 'binary':
+        return encode_binary_heartbeat(host_id.encode(), time.time_ns(), sequence, key)
+    message = f'heartbeat:{host_id}:{time.time()}'.encode()
+    return message + b':' + hmac.new(key, message, hashlib.sha256).hexdigest().encode()
+
+
+# Load generator, run in worker processes
+
+async def simulate_client(host_id: str, port: int, args: dict, counters: dict, udp_socket) -> None:
+    interval = 1.0 / args['rate']
+    key = args['key'].encode()
+    start_at = args['start_at'] + (zlib.crc32(host_id.encode()) % 1000) / 1000 * interval * args['spread']
+    stop_at = args['stop_at'] if host_id in args['stopping'] else args['end_at']
+    writer = None
+    sequence = time.time_ns() // 1000
+    beat = 0
+
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    while True:
+        # Fixed-rate schedule, so a slow send does not shift later heartbeats
+        due = start_at + beat * interval
+        if due >= stop_at or (args['once'] and beat > 0):
+            break
+        await asyncio.sleep(max(0.0, due - time.time()))
+        beat += 1
+        sequence += 1
+        data = make_heartbeat(host_id, sequence, args['wire'], key)
+        try:
+            if args['transport'] == 'udp':
+                udp_socket.sendto(data, ('127.0.0.1', port))
+            elif args['transport'] == 'stream':
+                if writer is None:
+                    _, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(encode_frame(data))
+                await writer.drain()
+            else:
+                _, oneshot = await asyncio.open_connection('127.0.0.1', port)
+                oneshot.write(data)
+                await oneshot.drain()
+                oneshot.close()
+            counters['sent'] += 1
+        except OSError:
+            counters['errors'] += 1
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_clients(host_ids, port: int, args: dict) -> dict:
+    counters = {'sent': 0, 'errors': 0}
+    udp_socket = None
+    if args['transport'] == 'udp':
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_socket.setblocking(False)
+    await asyncio.gather(*(simulate_client(host_id, port, args, counters, udp_socket) for host_id in host_ids))
+    if udp_socket is not None:
+        udp_socket.close()
+    return counters
+
+
+def load_worker(host_ids, port: int, args: dict) -> dict:
+    return asyncio.run(run_clients(host_ids, port, args))
+
+
+# Server side, run in this process
+
+def load_server():
+    """
+    Imports the server and installs the probes, once per process.
+    """
+    global probes
+    if probes is not None:
+        return probes
+
+    import server
+    from notifications import NotificationDispatcher
+    from registry import HostRegistry
+
+    class ProbedRegistry(HostRegistry):
+        """
+        A host registry that records how late each offline detection fired, by host.
+        """
+        __slots__ = ('detections',)
+
+        def __init__(self, default_threshold: int, detector=None) -> None:
+            super().__init__(default_threshold, detector)
+            self.detections = {}
+
+        def mark_offline(self, slot: int) -> None:
+            silence = time.time() - self.last_seen[slot]
+            self.detections[self.names[slot]] = (silence - self.timeout_of(slot), silence)
+            super().mark_offline(slot)
+
+    latencies = array('d')
+    processed = [0, 0.0]
+    accept_heartbeat = server.accept_heartbeat
+    record_heartbeat = server.record_heartbeat
+
+    def probed_accept_heartbeat(data: bytes, address):
+        host_id = accept_heartbeat(data, address)
+        if host_id is not None and server.update_sink is None:
+            if data[:1] == b'h':
+                sent = float(data.rsplit(b':', 2)[1])
+            else:
+                sent = decode_binary_heartbeat(data).timestamp_ns / 1e9
+            latencies.append(time.time() - sent)
+        return host_id
+
+    def probed_record_heartbeat(host_id: str, address) -> None:
+        record_heartbeat(host_id, address)
+        processed[0] += 1
+        processed[1] = time.time()
+
+    server.accept_heartbeat = probed_accept_heartbeat
+    server.record_heartbeat = probed_record_heartbeat
+    server.notifier = NotificationDispatcher([])
+    probes = server, ProbedRegistry, latencies, processed
+    return probes
+
+
+def start_server_workers(args) -> None:
+    """
+    Forks the server's heartbeat workers on free localhost ports. Workers inherit the
+    probes, but latency is only measured when heartbeats are handled in this process.
+    """
+    server = load_server()[0]
+    kind = socket.SOCK_DGRAM if args.transport == 'udp' else socket.SOCK_STREAM
+    with socket.socket(socket.AF_INET, kind) as probe_socket:
+        probe_socket.bind(('127.0.0.1', 0))
+        port = probe_socket.getsockname()[1]
+    server.server_ip = '127.0.0.1'
+    server.server_port = port
+    if args.transport == 'udp':
+        server.udp_port = port
+    server.start_heartbeat_workers(args.server_workers)
+
+
+async def run_load(args, hosts, stopping=(), stop_after: float = None, threshold: int = 60) -> dict:
+    server, ProbedRegistry, latencies, processed = load_server()
+    from phi import PhiAccrualDetector
+    server.registry = ProbedRegistry(threshold, PhiAccrualDetector(args.phi) if args.phi else None)
+    server.alert_aggregator.window = 0
+
+    tcp_server = udp_transport = None
+    if server.worker_connections:
+        port = server.server_port
+        receiver = asyncio.create_task(server.receive_worker_updates())
+    else:
+        tcp_server = await asyncio.start_server(server.process_heartbeat_from_client, '127.0.0.1', 0, backlog=4096)
+        port = tcp_server.sockets[0].getsockname()[1]
+    if args.transport == 'udp' and tcp_server is not None:
+        udp_transport = await server.start_datagram_listener('127.0.0.1', 0)
+        port = udp_transport.get_extra_info('sockname')[1]
+    watchdog = asyncio.create_task(server.monitor_heartbeat_status())
+
+    start_at = time.time() + START_DELAY
+    end_at = start_at + args.duration
+    client_args = {
+        'rate': args.rate, 'key': BENCH_KEY, 'wire': args.wire, 'transport': args.transport,
+        'start_at': start_at, 'end_at': end_at, 'once': args.scenario == 'storm',
+        'spread': 0.0 if args.scenario == 'storm' else 1.0,
+        'stopping': set(stopping), 'stop_at': start_at + (stop_after or args.duration),
+    }
+    shares = [hosts[index::args.workers] for index in range(args.workers)]
+    with multiprocessing.get_context('spawn').Pool(args.workers) as pool:
+        pending = [pool.apply_async(load_worker, (share, port, client_args)) for share in shares if share]
+        loop = asyncio.get_running_loop()
+        reports = [await loop.run_in_executor(None, result.get) for result in pending]
+
+    # Let in-flight heartbeats and pending expiries be processed
+    await asyncio.sleep(args.settle)
+    watchdog.cancel()
+    if tcp_server is not None:
+        tcp_server.close()
+    else:
+        receiver.cancel()
+    if udp_transport is not None:
+        udp_transport.close()
+
+    count, last_processed = processed
+    # Throughput is measured up to the last processed heartbeat, so a storm is rated by
+    # how quickly it was absorbed rather than by the length of the run
+    elapsed = max(last_processed - start_at, 1e-3)
+    measured = bool(latencies)
+    return {
+        'sent': sum(report['sent'] for report in reports),
+        'send_errors': sum(report['errors'] for report in reports),
+        'processed': count,
+        'elapsed_seconds': elapsed,
+        'heartbeats_per_second': count / elapsed,
+        'latency_p50_ms': percentile(latencies, 0.50) * 1000 if measured else None,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1000 if measured else None,
+        'latency_max_ms': max(latencies) * 1000 if measured else None,
+        'tracked_hosts': len(server.registry),
+        'detections': server.registry.detections,
+    }
+
+
+async def scenario_steady(args) -> dict:
+    hosts = [f'bench/host{index}' for index in range(args.hosts)]
+    results = await run_load(args, hosts)
+    results.pop('detections')
+    return results
+
+
+async def scenario_storm(args) -> dict:
+    hosts = [f'bench/host{index}' for index in range(args.hosts)]
+    args.duration = 1.0
+    results = await run_load(args, hosts)
+    results.pop('detections')
+    return results
+
+
+async def scenario_outage(args) -> dict:
+    site_size = max(1, int(args.hosts * args.outage_fraction))
+    hosts = [f'site-a/host{index}' for index in range(args.hosts - site_size)]
+    site = [f'site-b/host{index}' for index in range(site_size)]
+    args.settle = max(args.settle, args.threshold + 2.0)
+    results = await run_load(args, hosts + site, stopping=site, stop_after=args.duration / 2,
+                             threshold=args.threshold)
+    # Hosts of the healthy site also expire once the load stops; only the outage counts
+    detections = [detection for host_id, detection in results.pop('detections').items()
+                  if host_id.startswith('site-b/')]
+    delays = [delay for delay, _ in detections]
+    silences = [silence for _, silence in detections]
+    results.update({
+        'outage_hosts': site_size,
+        'detected': len(detections),
+        'detection_p50_ms': percentile(delays, 0.50) * 1000,
+        'detection_p99_ms': percentile(delays, 0.99) * 1000,
+        'detection_max_ms': max(delays, default=0.0) * 1000,
+        'silence_p50_s': percentile(silences, 0.50),
+        'silence_max_s': max(silences, default=0.0),
+    })
+    return results
+
+
+async def scenario_memory(args) -> dict:
+    from auth import ReplayGuard
+    from registry import HostRegistry
+
+    host_ids = [f'bench/host{index}' for index in range(args.hosts)]
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    registry = HostRegistry(60)
+    replay_guard = ReplayGuard()
+    now = time.time()
+    for sequence, host_id in enumerate(host_ids):
+        registry.touch(host_id, now)
+        replay_guard.accept(host_id, sequence)
+    used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, 'filename'))
+    tracemalloc.stop()
+    return {
+        'tracked_hosts': len(registry),
+        'bytes_total': used,
+        'bytes_per_host': used / max(1, args.hosts),
+    }
+
+
+SCENARIOS = {
+    'steady': scenario_steady,
+    'storm': scenario_storm,
+    'outage': scenario_outage,
+    'memory': scenario_memory,
+}
+
+
+def describe_version() -> str:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=SRC_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Avanguard heartbeat server benchmark')
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--hosts', type=int, default=1000, help='Number of simulated hosts')
+    parser.add_argument('--rate', type=float, default=1.0, help='Heartbeats per second per host')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load')
+    parser.add_argument('--transport', choices=['oneshot', 'stream', 'udp'], default='stream')
+    parser.add_argument('--wire', choices=['text', 'binary'], default='binary')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='Load generator processes')
+    parser.add_argument('--server-workers', type=int, default=0,
+                        help='Run the server with this many SO_REUSEPORT worker processes')
+    parser.add_argument('--threshold', type=int, default=2, help='Offline threshold for the outage scenario')
+    parser.add_argument('--phi', type=float, default=0.0,
+                        help='Detect outages with a phi accrual detector at this threshold')
+    parser.add_argument('--outage-fraction', type=float, default=0.2, help='Share of hosts in the failing site')
+    parser.add_argument('--settle', type=float, default=1.0, help='Seconds to wait for in-flight work')
+    parser.add_argument('--output', help='Write the JSON result to this file')
+    args = parser.parse_args()
+
+    # Keep the server log out of the working tree, but write the result where asked
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    os.chdir(tempfile.mkdtemp(prefix='avanguard-bench-'))
+    if args.server_workers and args.scenario != 'memory':
+        start_server_workers(args)
+    started = time.time()
+    results = asyncio.run(SCENARIOS[args.scenario](args))
+    report = {
+        'scenario': args.scenario,
+        'version': describe_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': started,
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'scenario')},
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Host history benchmark for the Avanguard heartbeat server.
+
+Fills a history store with a year of outages and heartbeats for N hosts, then measures:
+    open     How long loading the history snapshot and mapping the rollups takes.
+    query    How long one uptime query takes for a random host over a random range.
+
+Results are printed, or written with --output, as JSON so that runs of different
+versions can be compared.
+
+Examples:
+    python bench/history_bench.py --hosts 100000 --outages 24
+    python bench/history_bench.py --hosts 10000 --queries 5000 --output history.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, SRC_DIR)
+
+from history import DAY, HistoryStore  # noqa: E402
+from heartbeat_bench import describe_version, percentile  # noqa: E402
+
+YEAR = 365 * DAY
+
+
+def fill(directory: str, hosts: int, outages: int, end: float) -> None:
+    """
+    Records `outages` random outages per host over the year before `end`, and a heartbeat
+    per host every week.
+    """
+    store = HistoryStore(directory)
+    store.open()
+    start = end - YEAR
+    for index in range(hosts):
+        host_id = f'site{index % 100}/host{index}'
+        store.record_up(host_id, start)
+        for outage_start in sorted(random.uniform(start, end) for _ in range(outages)):
+            store.record_down(host_id, outage_start)
+            store.record_up(host_id, outage_start + random.expovariate(1 / 600))
+        for day in range(0, YEAR, DAY * 7):
+            store.record_arrival(host_id, start + day, start + day - 30)
+    # Append the year to the log, then let close fold it into a snapshot as the server would
+    store.write(*store.prepare())
+    store.close()
+
+
+def summarize(values) -> dict:
+    return {
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'max_ms': max(values) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Avanguard host history benchmark')
+    parser.add_argument('--hosts', type=int, default=100000, help='Number of hosts with history')
+    parser.add_argument('--outages', type=int, default=24, help='Outages per host over the year')
+    parser.add_argument('--queries', type=int, default=1000, help='Uptime queries to time')
+    parser.add_argument('--output', help='Write the JSON result to this file')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='avanguard-history-')
+    end = time.time()
+    fill(directory, args.hosts, args.outages, end)
+
+    started = time.perf_counter()
+    store = HistoryStore(directory)
+    store.open()
+    opened = time.perf_counter() - started
+
+    host_ids = list(store.index)
+    timings = []
+    for _ in range(args.queries):
+        host_id = random.choice(host_ids)
+        range_start = random.uniform(end - YEAR, end)
+        started = time.perf_counter()
+        store.uptime(host_id, range_start, random.uniform(range_start, end), now=end)
+        timings.append(time.perf_counter() - started)
+    year_timings = []
+    for _ in range(args.queries):
+        started = time.perf_counter()
+        store.uptime(random.choice(host_ids), end - YEAR, end, now=end)
+        year_timings.append(time.perf_counter() - started)
+    store.close()
+
+    report = {
+        'version': describe_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': time.time(),
+        'parameters': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': {
+            'open_ms': opened * 1000,
+            'snapshot_bytes': os.path.getsize(os.path.join(directory, 'history.bin')),
+            'arrivals_bytes': os.path.getsize(os.path.join(directory, 'arrivals.bin')),
+            'query_random_range': summarize(timings),
+            'query_full_year': summarize(year_timings),
+        },
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
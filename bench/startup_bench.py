@@ -0,0 +1,155 @@
+"""
+Startup-time benchmark for the Avanguard heartbeat server.
+
+Measures, over several fresh interpreter processes:
+    import   How long `import server` takes, and which notification libraries it loads.
+    ready    How long `python src/server.py` takes until its heartbeat port accepts
+             connections, optionally with a saved state of N hosts to restore.
+
+Results are printed, or written with --output, as JSON so that runs of different
+versions can be compared.
+
+Examples:
+    python bench/startup_bench.py --runs 10
+    python bench/startup_bench.py --runs 5 --mode full --state-hosts 100000 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+sys.path.insert(0, SRC_DIR)
+
+from heartbeat_bench import describe_version, percentile  # noqa: E402
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import server
+elapsed = time.perf_counter() - started
+print(json.dumps([elapsed, [name for name in ('telegram', 'pushbullet', 'httpx') if name in sys.modules]]))
+"""
+READY_TIMEOUT = 30.0
+POLL_INTERVAL = 0.002
+
+
+def server_environment(port: int, state_dir: str = None) -> dict:
+    env = dict(os.environ, SERVER_IP='127.0.0.1', SERVER_PORT=str(port), OFFLINE_THRESHOLD='60',
+               SECRET_KEY='benchmark-key', PYTHONPATH=SRC_DIR)
+    for name in ('TELEGRAM_BOT_TOKEN', 'PUSHBULLET_NOTIFICATION', 'NOTIFICATION_CHANNELS', 'METRICS_PORT',
+                 'SERVER_WORKERS', 'STATE_DIR'):
+        env.pop(name, None)
+    if state_dir:
+        env['STATE_DIR'] = state_dir
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as probe_socket:
+        probe_socket.bind(('127.0.0.1', 0))
+        return probe_socket.getsockname()[1]
+
+
+def measure_import() -> tuple:
+    """
+    Imports the server in a fresh interpreter and returns the seconds taken and the
+    notification libraries that were loaded.
+    """
+    result = subprocess.run([sys.executable, '-c', IMPORT_PROBE], env=server_environment(free_port()),
+                            capture_output=True, text=True, check=True)
+    elapsed, modules = json.loads(result.stdout.splitlines()[-1])
+    return elapsed, modules
+
+
+def measure_ready(mode: str, state_dir: str = None) -> float:
+    """
+    Starts the server and returns the seconds until its heartbeat port accepts a connection.
+    """
+    port = free_port()
+    command = [sys.executable, os.path.join(SRC_DIR, 'server.py')] + (['--headless'] if mode == 'headless' else [])
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=server_environment(port, state_dir),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while time.perf_counter() - started < READY_TIMEOUT:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited: {process.stderr.read().decode()}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(POLL_INTERVAL)
+        raise RuntimeError("Server did not start listening in time")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def save_state(directory: str, hosts: int) -> None:
+    from registry import HostRegistry
+    from state import Settings, StateStore
+
+    registry = HostRegistry(60)
+    now = time.time()
+    for index in range(hosts):
+        registry.add(f'site{index % 10}/host{index}', now=now)
+    store = StateStore(directory)
+    store.load()
+    store.save(registry, Settings(60, None, 0))
+
+
+def summarize(values) -> dict:
+    return {
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'min_ms': min(values) * 1000,
+        'max_ms': max(values) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Avanguard server startup benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh processes per measurement')
+    parser.add_argument('--mode', choices=['headless', 'full'], default='headless',
+                        help='Start the server headless, or with its usual services')
+    parser.add_argument('--state-hosts', type=int, default=0,
+                        help='Restore a saved state with this many hosts on every start')
+    parser.add_argument('--output', help='Write the JSON result to this file')
+    args = parser.parse_args()
+
+    # Keep the server log and saved state out of the working tree, but write the result where asked
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    os.chdir(tempfile.mkdtemp(prefix='avanguard-startup-'))
+    state_dir = None
+    if args.state_hosts:
+        state_dir = os.path.abspath('state')
+        save_state(state_dir, args.state_hosts)
+
+    imports = [measure_import() for _ in range(args.runs)]
+    ready = [measure_ready(args.mode, state_dir) for _ in range(args.runs)]
+    report = {
+        'version': describe_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': time.time(),
+        'parameters': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': {
+            'import': dict(summarize([elapsed for elapsed, _ in imports]), notification_modules=imports[0][1]),
+            'ready': summarize(ready),
+        },
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+from ratelimit import TokenBucket
+
+MAX_SOURCES = 100_000
+
+
+class ConnectionLimiter:
+    """
+    Caps the number of heartbeat connections handled at once. A connection that arrives
+    while every slot is taken waits up to `wait` seconds for one, which slows down clients
+    instead of failing them outright; at most `max_waiting` connections wait at a time and
+    any beyond that are refused at once, so the number of open sockets stays bounded at
+    `limit + max_waiting` however many clients connect. A released slot is handed to the
+    longest-waiting connection.
+    """
+
+    def __init__(self, limit: int, wait: float = 1.0, max_waiting: int = None) -> None:
+        self.limit = limit
+        self.wait = wait
+        self.max_waiting = limit if max_waiting is None else max_waiting
+        self.active = 0
+        self.waiters = deque()
+
+    async def acquire(self) -> bool:
+        """
+        Takes a connection slot, waiting for one if needed.
+
+        Returns:
+            bool: True if a slot was taken, False if the connection should be refused.
+        """
+        if self.active < self.limit:
+            self.active += 1
+            return True
+        if len(self.waiters) >= self.max_waiting:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), self.wait)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # The slot was handed over just as the wait ran out
+                return True
+            waiter.cancel()
+            self.waiters.remove(waiter)
+            return False
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release()
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self) -> None:
+        """
+        Returns a slot taken by acquire, handing it to a waiting connection if there is one.
+        """
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+
+class SourceLimiter:
+    """
+    Rate-limits heartbeat traffic per source IP address with a token bucket each, so that
+    a flooding sender is dropped before any HMAC is computed for it. Buckets are kept for
+    the `max_sources` most recently seen addresses; the least recently seen is forgotten
+    first, which bounds memory under a spoofed-source flood.
+    """
+
+    def __init__(self, rate: float, burst: float, max_sources: int = MAX_SOURCES) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_sources = max_sources
+        self.buckets: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+    def allow(self, source: str, now: float = None) -> bool:
+        """
+        Takes one token from the bucket of a source.
+
+        Args:
+            source (str): The source IP address.
+            now (float, optional): The current monotonic time. Defaults to time.monotonic().
+
+        Returns:
+            bool: True if the message may be processed, False if it should be dropped.
+        """
+        if now is None:
+            now = time.monotonic()
+        bucket = self.buckets.get(source)
+        if bucket is None:
+            bucket = self.buckets[source] = TokenBucket(self.rate, self.burst, now)
+            if len(self.buckets) > self.max_sources:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(source)
+        return bucket.consume(1, now)
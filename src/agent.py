@@ -0,0 +1,385 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import argparse
+from typing import List, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from protocol import encode_binary_heartbeat, encode_frame, encode_text_heartbeat, sequence_counter
+from tls import ResumingContext, create_client_context
+
+MAX_JITTER = 0.5
+REQUIRED_SETTINGS = ('SERVER_IP', 'SERVER_PORT', 'SECRET_KEY')
+
+
+class Identity(NamedTuple):
+    """
+    A logical host the agent sends heartbeats for. When `check` is set, heartbeats are
+    only sent while a TCP connection to that (host, port) succeeds, so the server reports
+    the service down when it stops answering.
+    """
+    host_id: str
+    key: bytes
+    check: Optional[Tuple[str, int]] = None
+
+
+def parse_identity(spec: str, default_key: bytes) -> Identity:
+    """
+    Parses an identity of the form `<host_id>[ key=<key>][ check=tcp:<host>:<port>]`.
+
+    Args:
+        spec (str): The identity specification.
+        default_key (bytes): The key used when the specification has none.
+
+    Returns:
+        Identity: The parsed identity.
+
+    Raises:
+        ValueError: If the specification is malformed.
+    """
+    fields = spec.split()
+    if not fields or ':' in fields[0]:
+        raise ValueError(f"Invalid identity {spec!r}")
+    options = dict(field.split('=', 1) for field in fields[1:] if '=' in field)
+    if len(options) != len(fields) - 1 or set(options) - {'key', 'check'}:
+        raise ValueError(f"Invalid identity options in {spec!r}")
+
+    check = None
+    if 'check' in options:
+        scheme, _, target = options['check'].partition(':')
+        host, _, port = target.rpartition(':')
+        if scheme != 'tcp' or not host or not port.isdigit():
+            raise ValueError(f"Invalid check {options['check']!r}, expected tcp:<host>:<port>")
+        check = (host, int(port))
+    key = options['key'].encode() if 'key' in options else default_key
+    return Identity(fields[0], key, check)
+
+
+def load_identities(path: str, default_key: bytes) -> List[Identity]:
+    """
+    Reads one identity per line from a file; blank lines and lines starting with `#` are
+    ignored. See parse_identity for the line format.
+
+    Args:
+        path (str): The path of the identities file.
+        default_key (bytes): The key for identities without one.
+
+    Returns:
+        List[Identity]: The identities in file order.
+    """
+    with open(path, 'r') as identities_file:
+        return [parse_identity(line, default_key) for line in identities_file
+                if line.strip() and not line.lstrip().startswith('#')]
+
+
+class ReconnectBackoff:
+    """
+    Spaces out reconnect attempts with exponential backoff. Each wait is randomised
+    between half and all of the current delay, so agents that lost the server at the same
+    moment do not reconnect in lockstep.
+    """
+    __slots__ = ('initial', 'maximum', 'delay', 'retry_at')
+
+    def __init__(self, initial: float = 1.0, maximum: float = 60.0) -> None:
+        self.initial = initial
+        self.maximum = maximum
+        self.delay = initial
+        self.retry_at = 0.0
+
+    def ready(self, now: float = None) -> bool:
+        """
+        Returns True if a connection attempt may be made now.
+        """
+        return (time.monotonic() if now is None else now) >= self.retry_at
+
+    def failed(self, now: float = None) -> float:
+        """
+        Records a failed attempt and returns the wait before the next one.
+        """
+        wait = self.delay * random.uniform(0.5, 1.0)
+        self.retry_at = (time.monotonic() if now is None else now) + wait
+        self.delay = min(self.delay * 2, self.maximum)
+        return wait
+
+    def reset(self) -> None:
+        """
+        Records a successful attempt.
+        """
+        self.delay = self.initial
+        self.retry_at = 0.0
+
+
+class StreamSender:
+    """
+    Sends the heartbeats of every identity as frames over one shared persistent connection,
+    reconnecting with backoff when it is lost. With a TLS context, the session of the
+    previous connection is resumed on reconnect.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float, backoff: ReconnectBackoff,
+                 ssl: ResumingContext = None) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.backoff = backoff
+        self.ssl = ssl
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()
+
+    async def send(self, data: bytes) -> bool:
+        """
+        Sends one heartbeat.
+
+        Args:
+            data (bytes): The heartbeat message.
+
+        Returns:
+            bool: True if the heartbeat was written, False if it was dropped.
+        """
+        async with self.lock:
+            if self.writer is not None and (self.writer.is_closing() or self.reader.at_eof()):
+                logging.warning("Heartbeat stream closed by the server. Reconnecting...")
+                self.close()
+            if self.writer is None:
+                if not self.backoff.ready():
+                    return False
+                try:
+                    self.reader, self.writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+                except (OSError, asyncio.TimeoutError) as e:
+                    wait = self.backoff.failed()
+                    logging.warning(f"Connection to {self.host}:{self.port} failed: {e!r}. "
+                                    f"Retrying in {wait:.1f}s...")
+                    return False
+                self.backoff.reset()
+                logging.info("Heartbeat stream connected.")
+            try:
+                self.writer.write(encode_frame(data))
+                await asyncio.wait_for(self.writer.drain(), self.timeout)
+                return True
+            except (OSError, asyncio.TimeoutError) as e:
+                logging.warning(f"Heartbeat stream broken: {e!r}. Reconnecting...")
+                self.close()
+                return False
+
+    def close(self) -> None:
+        if self.writer is not None:
+            if self.ssl is not None:
+                self.ssl.remember(self.writer.get_extra_info('ssl_object'))
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class OneshotSender:
+    """
+    Opens a new connection for every heartbeat, backing off while the server is unreachable.
+    With a TLS context, each connection resumes the session of the previous one.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float, backoff: ReconnectBackoff,
+                 ssl: ResumingContext = None) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.backoff = backoff
+        self.ssl = ssl
+
+    async def send(self, data: bytes) -> bool:
+        if not self.backoff.ready():
+            return False
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+            writer.write(data)
+            await asyncio.wait_for(writer.drain(), self.timeout)
+            if self.ssl is not None:
+                # Wait for the server to close the connection, so that the session ticket
+                # it sends after a TLS 1.3 handshake has been received
+                await asyncio.wait_for(reader.read(), self.timeout)
+                self.ssl.remember(writer.get_extra_info('ssl_object'))
+        except (OSError, asyncio.TimeoutError) as e:
+            wait = self.backoff.failed()
+            logging.warning(f"Sending to {self.host}:{self.port} failed: {e!r}. Retrying in {wait:.1f}s...")
+            return False
+        finally:
+            if writer is not None:
+                writer.close()
+        self.backoff.reset()
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class DatagramSender:
+    """
+    Sends every heartbeat as a single UDP datagram from one shared socket.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self.transport = None
+
+    async def send(self, data: bytes) -> bool:
+        try:
+            if self.transport is None:
+                self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                    asyncio.DatagramProtocol, remote_addr=(self.host, self.port))
+            self.transport.sendto(data)
+            return True
+        except OSError as e:
+            logging.warning(f"Socket error: {e}. Retrying...")
+            self.close()
+            return False
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+        self.transport = None
+
+
+async def is_service_up(address: Tuple[str, int], timeout: float) -> bool:
+    """
+    Checks that a local service accepts TCP connections.
+
+    Args:
+        address (Tuple[str, int]): The host and port of the service.
+        timeout (float): The connect timeout in seconds.
+
+    Returns:
+        bool: True if the connection succeeded.
+    """
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(*address), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+async def run_identity(identity: Identity, sender, interval: float, jitter: float = 0.1,
+                       heartbeat_format: str = 'text', timeout: float = 5.0, iterations: int = None) -> int:
+    """
+    Sends heartbeats for one identity on a fixed-rate schedule.
+
+    The schedule starts at a random phase within the first interval and every heartbeat is
+    due at `start + n * interval`, moved by up to `jitter * interval` either way. Because
+    the slots are counted from the start, the time spent sending never shifts later
+    heartbeats; slots missed while the process was suspended are skipped.
+
+    Args:
+        identity (Identity): The identity to send heartbeats for.
+        sender: The StreamSender, OneshotSender or DatagramSender to send with.
+        interval (float): The interval between heartbeats in seconds.
+        jitter (float, optional): The random offset as a fraction of the interval, at most MAX_JITTER.
+        heartbeat_format (str, optional): 'text' or 'binary'.
+        timeout (float, optional): The timeout of service checks in seconds.
+        iterations (int, optional): Number of heartbeat slots to run, for testing. Defaults to None for no limit.
+
+    Returns:
+        int: The number of heartbeats sent.
+    """
+    loop = asyncio.get_running_loop()
+    jitter = min(max(jitter, 0.0), MAX_JITTER) * interval
+    sequence_numbers = sequence_counter()
+    start = loop.time() + random.uniform(0, interval)
+    slot = 0
+    sent = 0
+    while iterations is None or slot < iterations:
+        delay = start + slot * interval + random.uniform(-jitter, jitter) - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if identity.check is None or await is_service_up(identity.check, timeout):
+            if heartbeat_format == 'binary':
+                data = encode_binary_heartbeat(identity.host_id.encode(), time.time_ns(),
+                                               next(sequence_numbers), identity.key)
+            else:
+                data = encode_text_heartbeat(identity.host_id, time.time(), identity.key)
+            if await sender.send(data):
+                sent += 1
+        else:
+            logging.info(f"Service of {identity.host_id} at {identity.check} is not answering, heartbeat skipped.")
+
+        slot = max(slot + 1, int((loop.time() - start) / interval) + 1)
+    return sent
+
+
+async def run_agent(identities: List[Identity], sender, interval: float, jitter: float = 0.1,
+                    heartbeat_format: str = 'text', timeout: float = 5.0) -> None:
+    """
+    Sends heartbeats for every identity concurrently until cancelled.
+
+    Args:
+        identities (List[Identity]): The identities to send heartbeats for.
+        sender: The sender shared by all identities.
+        interval (float): The interval between heartbeats in seconds.
+        jitter (float, optional): The random offset as a fraction of the interval.
+        heartbeat_format (str, optional): 'text' or 'binary'.
+        timeout (float, optional): The timeout of service checks in seconds.
+    """
+    logging.info(f"Agent sending heartbeats for {len(identities)} identities every {interval}s.")
+    try:
+        await asyncio.gather(*(run_identity(identity, sender, interval, jitter, heartbeat_format, timeout)
+                               for identity in identities))
+    finally:
+        sender.close()
+
+
+def initialize_agent() -> None:
+    """
+    Reads the configuration and command-line arguments and runs the agent.
+    """
+    load_dotenv()
+    server_ip = os.getenv('SERVER_IP')
+    server_port = int(os.getenv('SERVER_PORT') or 0)
+    udp_port = int(os.getenv('UDP_PORT') or server_port)
+    secret_key = (os.getenv('SECRET_KEY') or '').encode()
+
+    parser = argparse.ArgumentParser(description='Heartbeat agent for many identities')
+    parser.add_argument('--identity', action='append', default=[],
+                        help='An identity to send heartbeats for: "<host_id> [key=<key>] [check=tcp:<host>:<port>]"')
+    parser.add_argument('--identities-file', default=os.getenv('AGENT_IDENTITIES_FILE'),
+                        help='A file with one identity per line')
+    parser.add_argument('--interval', type=float, default=45, help='Heartbeat interval in seconds')
+    parser.add_argument('--jitter', type=float, default=0.1,
+                        help=f'Random offset of each heartbeat as a fraction of the interval (at most {MAX_JITTER})')
+    parser.add_argument('--transport', choices=['stream', 'oneshot', 'udp'], default='stream',
+                        help='Share one persistent connection, open one per heartbeat, or send UDP datagrams')
+    parser.add_argument('--format', choices=['text', 'binary'], default=os.getenv('HEARTBEAT_FORMAT', 'text'),
+                        help='Heartbeat wire format')
+    parser.add_argument('--timeout', type=float, default=5.0, help='Connect, send and check timeout in seconds')
+    parser.add_argument('--tls', action='store_true', default=bool(os.getenv('HEARTBEAT_TLS')),
+                        help='Connect to the server over TLS (stream and oneshot transports)')
+    args = parser.parse_args()
+    missing = [name for name in REQUIRED_SETTINGS if not os.getenv(name)]
+    if missing:
+        parser.error(f"missing required settings: {', '.join(missing)}")
+
+    logging.basicConfig(filename='agent_log.txt', level=logging.INFO, format='%(asctime)s - %(message)s')
+
+    identities = [parse_identity(spec, secret_key) for spec in args.identity]
+    if args.identities_file:
+        identities += load_identities(args.identities_file, secret_key)
+    if not identities:
+        identities.append(Identity(os.getenv('HOST_ID') or '', secret_key))
+
+    tls_context = create_client_context(os.getenv('TLS_CA_FILE')) if args.tls else None
+    if args.transport == 'udp':
+        sender = DatagramSender(server_ip, udp_port)
+    elif args.transport == 'oneshot':
+        sender = OneshotSender(server_ip, server_port, args.timeout, ReconnectBackoff(), tls_context)
+    else:
+        sender = StreamSender(server_ip, server_port, args.timeout, ReconnectBackoff(), tls_context)
+    try:
+        asyncio.run(run_agent(identities, sender, args.interval, args.jitter, args.format, args.timeout))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    initialize_agent()
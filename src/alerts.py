@@ -0,0 +1,81 @@
+import asyncio
+import ipaddress
+from typing import Callable, Dict, List, Tuple
+
+
+def alert_group_of(host_id: str, address, group_by: str = 'tag') -> str:
+    """
+    Returns the group a host is reported under when several hosts change state together.
+
+    Hosts named `<tag>/<name>` are grouped by tag. With `group_by` set to 'subnet', other
+    hosts are grouped by the /24 (IPv4) or /64 (IPv6) network they send heartbeats from.
+
+    Args:
+        host_id (str): The client identity of the host.
+        address (tuple): The peer address heartbeats arrive from, or None if unknown.
+        group_by (str, optional): 'tag' or 'subnet'. Defaults to 'tag'.
+
+    Returns:
+        str: The group name, or an empty string for the ungrouped hosts.
+    """
+    if '/' in host_id:
+        return host_id.split('/', 1)[0]
+    if group_by == 'subnet' and address:
+        try:
+            ip = ipaddress.ip_address(address[0])
+        except ValueError:
+            return ''
+        prefix = 24 if ip.version == 4 else 64
+        return str(ipaddress.ip_network(f'{ip}/{prefix}', strict=False))
+    return ''
+
+
+class AlertAggregator:
+    """
+    Coalesces host state changes that happen close together. Changes are collected for
+    `window` seconds after the first one, then each (state, group) pair is sent as a single
+    message. A group with only one host keeps the usual per-host message.
+    """
+
+    def __init__(self, send: Callable[[str, str], None], window: float = 10.0, list_limit: int = 20) -> None:
+        self.send = send
+        self.window = window
+        self.list_limit = list_limit
+        self.pending: Dict[Tuple[str, str], List[Tuple[str, str, str, str]]] = {}
+        self._flush_handle = None
+
+    def add(self, state: str, group: str, host_id: str, title: str, body: str, detail: str) -> None:
+        """
+        Queues a host state change for the next digest.
+
+        Args:
+            state (str): The new state of the host, 'down' or 'up'.
+            group (str): The group of the host, see alert_group_of.
+            host_id (str): The client identity of the host.
+            title (str): The title to use if the host is alone in its group.
+            body (str): The body to use if the host is alone in its group.
+            detail (str): A short detail shown next to the host in a digest, e.g. the downtime.
+        """
+        self.pending.setdefault((state, group), []).append((host_id, title, body, detail))
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+    def flush(self) -> None:
+        """
+        Sends the collected state changes immediately, one message per group.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self.pending = self.pending, {}
+
+        for (state, group), alerts in pending.items():
+            if len(alerts) == 1:
+                _, title, body, _ = alerts[0]
+                self.send(title, body)
+                continue
+            where = f" in {group}" if group else ""
+            listed = ", ".join(f"{host_id} ({detail})" for host_id, _, _, detail in alerts[:self.list_limit])
+            more = len(alerts) - self.list_limit
+            self.send(f"{len(alerts)} hosts{where} are {state}!",
+                      listed + (f" and {more} more." if more > 0 else "."))
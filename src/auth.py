@@ -0,0 +1,137 @@
+import hashlib
+import hmac
+import logging
+from array import array
+from typing import Dict, Iterable, Tuple
+
+REPLAY_WINDOW = 64
+REPLAY_MASK = (1 << REPLAY_WINDOW) - 1
+
+
+class Keyring:
+    """
+    Holds the HMAC keys of every client. A client may have several keys at once so that
+    keys can be rotated: the new key is added next to the old one, clients are switched
+    over, and the old key is removed. Clients without keys of their own use the default key.
+
+    Every key is kept as a pre-keyed HMAC object, which is copied per message instead of
+    deriving the inner and outer key pads again.
+    """
+
+    def __init__(self, default_key: bytes = None) -> None:
+        self._default = (self._prepare(default_key),) if default_key else ()
+        self._keys: Dict[str, Tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @staticmethod
+    def _prepare(key: bytes):
+        return hmac.new(key, digestmod=hashlib.sha256)
+
+    def set_keys(self, host_id: str, keys: Iterable[bytes]) -> None:
+        """
+        Replaces the keys accepted for one client.
+
+        Args:
+            host_id (str): The client identity.
+            keys (Iterable[bytes]): The accepted keys. An empty list removes the client.
+        """
+        prepared = tuple(self._prepare(key) for key in keys)
+        if prepared:
+            self._keys[host_id] = prepared
+        else:
+            self._keys.pop(host_id, None)
+
+    def load(self, path: str) -> None:
+        """
+        Replaces all client keys with those listed in a keyring file. Each line holds a
+        client identity followed by one or more keys separated by whitespace; blank lines
+        and lines starting with `#` are ignored.
+
+        Args:
+            path (str): The path of the keyring file.
+        """
+        keys = {}
+        with open(path, 'r') as keyring_file:
+            for line in keyring_file:
+                fields = line.split()
+                if not fields or fields[0].startswith('#'):
+                    continue
+                if len(fields) < 2:
+                    raise ValueError(f"No key given for {fields[0]} in {path}")
+                keys[fields[0]] = tuple(self._prepare(key.encode()) for key in fields[1:])
+        self._keys = keys
+        logging.info(f"Loaded keys for {len(keys)} clients from {path}.")
+
+    def verify(self, host_id: str, message, digest) -> bool:
+        """
+        Checks an HMAC-SHA256 digest against every key accepted for a client.
+
+        Args:
+            host_id (str): The client identity.
+            message (bytes-like): The signed part of the heartbeat.
+            digest (bytes-like): The raw digest received with the heartbeat.
+
+        Returns:
+            bool: True if the digest was produced by one of the client's keys.
+        """
+        for prepared in self._keys.get(host_id, self._default):
+            mac = prepared.copy()
+            mac.update(message)
+            if hmac.compare_digest(mac.digest(), digest):
+                return True
+        return False
+
+
+class ReplayGuard:
+    """
+    Rejects heartbeats that were already accepted, using a sliding window of sequence
+    numbers per client as in IPsec anti-replay. Each client costs two 64-bit integers: the
+    highest sequence number seen and a bitmap of the REPLAY_WINDOW numbers below it.
+    Sequence numbers older than the window are rejected.
+    """
+    __slots__ = ('_slots', 'highest', 'bitmaps')
+
+    def __init__(self) -> None:
+        self._slots = {}
+        self.highest = array('Q')
+        self.bitmaps = array('Q')
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def accept(self, host_id: str, sequence: int) -> bool:
+        """
+        Records a sequence number for a client if it has not been seen before.
+
+        Args:
+            host_id (str): The client identity.
+            sequence (int): The sequence number of an authenticated heartbeat.
+
+        Returns:
+            bool: True if the sequence number is new, False if it is a replay or too old.
+        """
+        slot = self._slots.get(host_id)
+        if slot is None:
+            self._slots[host_id] = len(self.highest)
+            self.highest.append(sequence)
+            self.bitmaps.append(1)
+            return True
+
+        highest = self.highest[slot]
+        if sequence > highest:
+            shift = sequence - highest
+            self.bitmaps[slot] = ((self.bitmaps[slot] << shift) | 1) & REPLAY_MASK if shift < REPLAY_WINDOW else 1
+            self.highest[slot] = sequence
+            return True
+
+        offset = highest - sequence
+        if offset >= REPLAY_WINDOW:
+            return False
+        bit = 1 << offset
+        bitmap = self.bitmaps[slot]
+        if bitmap & bit:
+            return False
+        self.bitmaps[slot] = bitmap | bit
+        return True
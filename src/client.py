@@ -1,55 +1,111 @@
 import socket
-import hmac
-import hashlib
+import ssl
 import time
 import os
 import argparse
 import logging
+from typing import List
 from dotenv import load_dotenv
+from protocol import GAUGE_NAMES, encode_binary_heartbeat, encode_frame, encode_text_heartbeat, sequence_counter
+from telemetry import read_gauges
+from tls import create_client_context
 
-# Configuration values for server communication
+# Configuration values for server communication. Importing the module needs none of them;
+# initialize_heartbeat_client checks that the required ones are set
 load_dotenv()
+REQUIRED_SETTINGS = ('SERVER_IP', 'SERVER_PORT', 'SECRET_KEY')
 server_ip = os.getenv('SERVER_IP')
-server_port = int(os.getenv('SERVER_PORT'))
-secret_key = os.getenv('SECRET_KEY').encode()
+server_port = int(os.getenv('SERVER_PORT') or 0)
+secret_key = (os.getenv('SECRET_KEY') or '').encode()
+host_id = os.getenv('HOST_ID')
+udp_port = int(os.getenv('UDP_PORT') or server_port)
+heartbeat_format = os.getenv('HEARTBEAT_FORMAT', 'text')
+heartbeat_tls = os.getenv('HEARTBEAT_TLS')
+tls_ca_file = os.getenv('TLS_CA_FILE')
+tls_context = None
+telemetry_gauges = [name.strip() for name in os.getenv('TELEMETRY', '').split(',') if name.strip()]
+telemetry_disk_path = os.getenv('TELEMETRY_DISK_PATH', '/')
 
-# Set up basic logging configuration
-logging.basicConfig(filename='client_log.txt',
-                    level=logging.INFO, format='%(asctime)s - %(message)s')
+# How long a TLS connection may take, and how long a stream connection waits after the
+# TLS handshake for the session ticket
+TLS_TIMEOUT = 10
+TICKET_WAIT = 0.5
 
+sequence_numbers = sequence_counter()
 
-def initialize_heartbeat_client():
+
+
+def initialize_heartbeat_client(argv: List[str] = None):
     """
     Main function that sets up the command-line arguments and starts the heartbeat sending process.
+
+    Args:
+        argv (List[str], optional): The command-line arguments. Defaults to sys.argv.
     """
+    global heartbeat_format, tls_context, telemetry_gauges
+
     # Set up command-line argument parsing
     parser = argparse.ArgumentParser(description='Heartbeat Client')
     parser.add_argument('--interval', type=int, default=45,
                         help='Heartbeat interval in seconds')
-    args = parser.parse_args()
+    parser.add_argument('--mode', choices=['oneshot', 'stream'], default='oneshot',
+                        help='Open a connection per heartbeat, or keep one connection open')
+    parser.add_argument('--format', choices=['text', 'binary'], default=None,
+                        help='Heartbeat wire format (defaults to HEARTBEAT_FORMAT or text)')
+    parser.add_argument('--transport', choices=['tcp', 'udp'], default='tcp',
+                        help='Send heartbeats over TCP, or as fire-and-forget UDP datagrams')
+    parser.add_argument('--tls', action='store_true', default=bool(heartbeat_tls),
+                        help='Send TCP heartbeats over TLS, resuming the session between connections')
+    parser.add_argument('--telemetry', default=','.join(telemetry_gauges),
+                        help=f"Comma-separated gauges to send with each heartbeat, of {', '.join(GAUGE_NAMES)} "
+                             f"(defaults to TELEMETRY). Requires the binary format")
+    args = parser.parse_args(argv)
+    missing = [name for name in REQUIRED_SETTINGS if not os.getenv(name)]
+    if missing:
+        parser.error(f"missing required settings: {', '.join(missing)}")
+
+    # Set up basic logging configuration
+    logging.basicConfig(filename='client_log.txt',
+                        level=logging.INFO, format='%(asctime)s - %(message)s')
+
+    if args.format:
+        heartbeat_format = args.format
+    telemetry_gauges = [name.strip() for name in args.telemetry.split(',') if name.strip()]
+    unknown = [name for name in telemetry_gauges if name not in GAUGE_NAMES]
+    if unknown:
+        parser.error(f"unknown gauges: {', '.join(unknown)}")
+    if telemetry_gauges:
+        if args.format == 'text':
+            parser.error("--telemetry requires the binary format")
+        heartbeat_format = 'binary'
+    if args.tls and args.transport == 'tcp':
+        tls_context = create_client_context(tls_ca_file)
 
     # Start sending heartbeats at the specified interval
-    send_heartbeat_periodically(args.interval)
+    if args.transport == 'udp':
+        send_heartbeat_datagrams(args.interval)
+    elif args.mode == 'stream':
+        send_heartbeat_stream(args.interval)
+    else:
+        send_heartbeat_periodically(args.interval)
 
 
 def generate_heartbeat() -> bytes:
     """
     Creates a heartbeat message encoded with HMAC to ensure authenticity.
+    When HOST_ID is configured, the client identity is carried in the message so that
+    the server can track this host separately from others. Binary heartbeats also carry
+    the gauges selected with TELEMETRY, measured now.
 
     Returns:
         bytes: The encoded heartbeat message including the timestamp and HMAC.
     """
-    # Generate the current time stamp
-    timestamp = str(time.time())
+    if heartbeat_format == 'binary':
+        gauges = read_gauges(telemetry_gauges, telemetry_disk_path) if telemetry_gauges else ()
+        return encode_binary_heartbeat((host_id or '').encode(), time.time_ns(),
+                                       next(sequence_numbers), secret_key, gauges)
 
-    message = f'heartbeat:{timestamp}'.encode()
-
-    # Generate HMAC for the message
-    generated_hmac = hmac.new(secret_key, message, hashlib.sha256).hexdigest()
-
-    # Combine the message parts
-    full_message = f'heartbeat:{timestamp}:{generated_hmac}'
-    return full_message.encode()
+    return encode_text_heartbeat(host_id, time.time(), secret_key)
 
 
 def send_heartbeat_periodically(interval: int, iterations: int = None):
@@ -63,13 +119,17 @@ def send_heartbeat_periodically(interval: int, iterations: int = None):
     count = 0
     while iterations is None or count < iterations:
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
-                # Connect to the server
-                client_socket.connect((server_ip, server_port))
-                heartbeat_message = generate_heartbeat()
-                # Send the heartbeat message
-                client_socket.sendall(heartbeat_message)
+            if tls_context is not None:
+                send_tls_heartbeat(generate_heartbeat())
                 logging.info("Heartbeat sent successfully.")
+            else:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client_socket:
+                    # Connect to the server
+                    client_socket.connect((server_ip, server_port))
+                    heartbeat_message = generate_heartbeat()
+                    # Send the heartbeat message
+                    client_socket.sendall(heartbeat_message)
+                    logging.info("Heartbeat sent successfully.")
         except ConnectionRefusedError:
             logging.warning("Connection refused by the server. Retrying...")
         except socket.timeout:
@@ -82,5 +142,112 @@ def send_heartbeat_periodically(interval: int, iterations: int = None):
         count += 1
 
 
+def send_heartbeat_stream(interval: int, iterations: int = None):
+    """
+    Sends framed heartbeat messages over one long-lived connection at a specified interval,
+    reconnecting when the connection is lost.
+
+    Args:
+        interval (int): The interval between heartbeats in seconds.
+        iterations (int, optional): Number of times to send a heartbeat for testing. Defaults to None for infinite loop.
+    """
+    client_socket = None
+    count = 0
+    try:
+        while iterations is None or count < iterations:
+            try:
+                if client_socket is None:
+                    client_socket = connect_stream()
+                    logging.info("Heartbeat stream connected.")
+                client_socket.sendall(encode_frame(generate_heartbeat()))
+                logging.info("Heartbeat sent successfully.")
+            except ConnectionRefusedError:
+                logging.warning("Connection refused by the server. Retrying...")
+            except socket.timeout:
+                logging.warning("Connection timed out. Retrying...")
+            except socket.error as e:
+                logging.warning(f"Socket error: {e}. Reconnecting...")
+                if client_socket is not None:
+                    client_socket.close()
+                    client_socket = None
+
+            # Wait for the next interval before sending another heartbeat
+            time.sleep(interval)
+            count += 1
+    finally:
+        if client_socket is not None:
+            client_socket.close()
+
+
+def send_tls_heartbeat(heartbeat_message: bytes) -> None:
+    """
+    Sends one heartbeat over a new TLS connection, offering the session of the previous
+    connection so that the server can skip the full handshake. The client then waits for
+    the server to close the connection, which also delivers the next session ticket.
+
+    Args:
+        heartbeat_message (bytes): The heartbeat message.
+    """
+    with socket.create_connection((server_ip, server_port), TLS_TIMEOUT) as raw_socket:
+        with tls_context.wrap_socket(raw_socket, server_hostname=server_ip) as client_socket:
+            client_socket.sendall(heartbeat_message)
+            while client_socket.recv(1024):
+                pass
+            tls_context.remember(client_socket)
+            if client_socket.session_reused:
+                logging.debug("TLS session resumed.")
+
+
+def connect_stream() -> socket.socket:
+    """
+    Opens the connection of a heartbeat stream, over TLS if enabled. After a TLS handshake,
+    the client waits up to TICKET_WAIT for the session ticket, so that a reconnect can
+    resume the session.
+
+    Returns:
+        socket.socket: The connected socket.
+    """
+    client_socket = socket.create_connection((server_ip, server_port))
+    if tls_context is None:
+        return client_socket
+    try:
+        client_socket = tls_context.wrap_socket(client_socket, server_hostname=server_ip)
+        client_socket.settimeout(TICKET_WAIT)
+        try:
+            client_socket.recv(1)
+        except (socket.timeout, ssl.SSLWantReadError):
+            pass
+        client_socket.settimeout(None)
+    except socket.error:
+        client_socket.close()
+        raise
+    tls_context.remember(client_socket)
+    return client_socket
+
+
+def send_heartbeat_datagrams(interval: int, iterations: int = None):
+    """
+    Sends each heartbeat message as a single UDP datagram at a specified interval.
+    Delivery is not confirmed; a lost datagram is covered by the next one.
+
+    Args:
+        interval (int): The interval between heartbeats in seconds.
+        iterations (int, optional): Number of times to send a heartbeat for testing. Defaults to None for infinite loop.
+    """
+    family, kind, proto, _, address = socket.getaddrinfo(server_ip, udp_port, type=socket.SOCK_DGRAM)[0]
+    with socket.socket(family, kind, proto) as client_socket:
+        count = 0
+        while iterations is None or count < iterations:
+            try:
+                client_socket.sendto(generate_heartbeat(), address)
+                logging.info("Heartbeat datagram sent.")
+            except socket.error as e:
+                logging.warning(f"Socket error: {e}. Retrying...")
+
+            # Wait for the next interval before sending another heartbeat
+            time.sleep(interval)
+            count += 1
+
+
 if __name__ == "__main__":
     initialize_heartbeat_client()
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import struct
+from typing import Callable, Iterator, List, NamedTuple, Sequence, Tuple
+
+# Workers validate heartbeats and forward compact liveness updates to the coordinator,
+# which owns host state. Each update is a fixed header followed by the host id and the
+# peer IP: kind, host id length, IP length, peer port, a time and a sequence number.
+# For a heartbeat the time is when the worker accepted it; for an expiry it is the
+# deadline by which the host must be heard from again. The hosts of a relay digest are
+# forwarded as RELAYED updates, with the time the relay last heard from them, directly
+# after the HEARTBEAT of the relay itself; they count only if that heartbeat does.
+# Likewise, the gauges of a heartbeat follow it as a GAUGES update, which carries the
+# encoded gauges in place of the IP. A TLS_HANDSHAKE update counts one TLS handshake in
+# the main process's metrics, with a sequence number of 1 if it resumed a session.
+UPDATE_HEADER = struct.Struct('!BBBHdQ')
+HEARTBEAT = 1
+EXPIRE = 2
+RELAYED = 3
+GAUGES = 4
+TLS_HANDSHAKE = 5
+MAX_BATCH_SIZE = 32 * 1024
+WORKER_NAME_PREFIX = 'avanguard-worker-'
+LISTEN_BACKLOG = 1024
+
+
+class Update(NamedTuple):
+    """
+    One liveness update forwarded by a worker.
+    """
+    kind: int
+    host_id: str
+    address: Tuple[str, int]
+    time: float
+    sequence: int
+    payload: bytes = b''
+
+
+def encode_update(kind: int, host_id: str, address, time: float, sequence: int = 0, payload: bytes = b'') -> bytes:
+    """
+    Encodes one liveness update.
+
+    Args:
+        kind (int): HEARTBEAT, EXPIRE, RELAYED, GAUGES or TLS_HANDSHAKE.
+        host_id (str): The client identity.
+        address (tuple): The peer address, or None if unknown.
+        time (float): The accept time of a heartbeat or the deadline of an expiry.
+        sequence (int, optional): The sequence number of a heartbeat.
+        payload (bytes, optional): The encoded gauges of a GAUGES update, sent instead of
+            the address.
+
+    Returns:
+        bytes: The encoded update.
+    """
+    host = host_id.encode()
+    ip = payload or (address[0].encode() if address else b'')
+    port = address[1] if address else 0
+    return UPDATE_HEADER.pack(kind, len(host), len(ip), port, time, sequence) + host + ip
+
+
+def decode_updates(batch: bytes) -> Iterator[Update]:
+    """
+    Splits a batch of concatenated updates.
+
+    Args:
+        batch (bytes): The batch received from a worker.
+
+    Yields:
+        Update: The updates in the order they were added.
+    """
+    view = memoryview(batch)
+    offset = 0
+    while offset < len(view):
+        kind, host_length, ip_length, port, time, sequence = UPDATE_HEADER.unpack_from(view, offset)
+        offset += UPDATE_HEADER.size
+        host_id = bytes(view[offset:offset + host_length]).decode()
+        offset += host_length
+        ip = bytes(view[offset:offset + ip_length])
+        offset += ip_length
+        if kind == GAUGES:
+            yield Update(kind, host_id, None, time, sequence, ip)
+        else:
+            yield Update(kind, host_id, (ip.decode(), port) if ip else None, time, sequence)
+
+
+class UpdateBatcher:
+    """
+    Collects the updates of a worker and writes them to the coordinator pipe as one
+    message per event loop iteration, or sooner once MAX_BATCH_SIZE bytes are pending.
+    Must be created on the worker's event loop.
+    """
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self.buffer = bytearray()
+        self.broken = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._scheduled = False
+
+    def add(self, kind: int, host_id: str, address, time: float, sequence: int = 0, payload: bytes = b'') -> None:
+        """
+        Queues one update; see encode_update for the arguments.
+        """
+        self.extend(encode_update(kind, host_id, address, time, sequence, payload))
+
+    def extend(self, updates: bytes) -> None:
+        """
+        Queues several encoded updates, which are sent to the coordinator in the same batch.
+
+        Args:
+            updates (bytes): The concatenated updates.
+        """
+        self.buffer += updates
+        if len(self.buffer) >= MAX_BATCH_SIZE:
+            self.flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            self._loop.call_soon(self.flush)
+
+    def flush(self) -> None:
+        """
+        Writes the pending updates to the coordinator.
+        """
+        self._scheduled = False
+        if not self.buffer or self.broken.is_set():
+            return
+        try:
+            self.connection.send_bytes(self.buffer)
+        except OSError as e:
+            logging.error(f"Lost the connection to the coordinator: {e}")
+            self.broken.set()
+        self.buffer.clear()
+
+
+def reuseport_socket(host: str, port: int, kind: int = socket.SOCK_STREAM) -> socket.socket:
+    """
+    Creates a socket bound with SO_REUSEPORT, so that every worker can bind the same port
+    and the kernel spreads connections and datagrams across them.
+
+    Args:
+        host (str): The address to bind, or None for all interfaces.
+        port (int): The port to bind.
+        kind (int, optional): SOCK_STREAM or SOCK_DGRAM. Defaults to SOCK_STREAM.
+
+    Returns:
+        socket.socket: The bound non-blocking socket, listening if it is a stream socket.
+    """
+    family, kind, proto, _, address = socket.getaddrinfo(host, port, type=kind, flags=socket.AI_PASSIVE)[0]
+    sock = socket.socket(family, kind, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setblocking(False)
+    sock.bind(address)
+    if kind == socket.SOCK_STREAM:
+        sock.listen(LISTEN_BACKLOG)
+    return sock
+
+
+def start_workers(count: int, target: Callable, args: Sequence = ()) -> List:
+    """
+    Forks worker processes, each with a pipe back to this process. Workers are forked
+    rather than spawned so that they inherit the loaded configuration and keys; this
+    must happen before the event loop starts.
+
+    Args:
+        count (int): The number of workers.
+        target (Callable): Called in each worker as target(index, connection, *args).
+        args (Sequence, optional): Extra arguments for the target.
+
+    Returns:
+        List[Connection]: The receiving ends of the worker pipes.
+    """
+    context = multiprocessing.get_context('fork')
+    connections = []
+    for index in range(count):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=target, args=(index, sender, *args),
+                                  name=f'{WORKER_NAME_PREFIX}{index}', daemon=True)
+        process.start()
+        sender.close()
+        connections.append(receiver)
+    return connections
+
+
+def signal_workers(signum: int) -> None:
+    """
+    Sends a signal to every running worker started by start_workers.
+
+    Args:
+        signum (int): The signal number, e.g. signal.SIGHUP.
+    """
+    for process in multiprocessing.active_children():
+        if process.name.startswith(WORKER_NAME_PREFIX):
+            os.kill(process.pid, signum)
+
+
+async def receive_updates(connections: List, handle: Callable[[bytes], None]) -> None:
+    """
+    Passes every batch received from the workers to `handle` on the running event loop.
+    Returns once all workers have closed their pipes.
+
+    Args:
+        connections (List[Connection]): The receiving ends of the worker pipes.
+        handle (Callable[[bytes], None]): Called with each batch.
+    """
+    loop = asyncio.get_running_loop()
+    remaining = set(connections)
+    finished = loop.create_future()
+
+    def on_readable(connection) -> None:
+        try:
+            batch = connection.recv_bytes()
+        except (EOFError, OSError):
+            loop.remove_reader(connection.fileno())
+            remaining.discard(connection)
+            logging.error(f"Heartbeat worker pipe closed, {len(remaining)} workers left.")
+            if not remaining and not finished.done():
+                finished.set_result(None)
+            return
+        handle(batch)
+
+    for connection in connections:
+        loop.add_reader(connection.fileno(), on_readable, connection)
+    try:
+        await finished
+    finally:
+        for connection in remaining:
+            loop.remove_reader(connection.fileno())
@@ -0,0 +1,105 @@
+import heapq
+import math
+from array import array
+from typing import Callable, List, Optional
+
+
+class DeadlineQueue:
+    """
+    A min-heap of per-slot expiry times that supports pushing a deadline back in O(1).
+
+    Every slot has at most one live heap entry. Pushing a deadline later only updates the
+    slot's entry in `deadlines`; the stale heap entry is re-queued when it surfaces. Only a
+    deadline moved earlier than its queued entry costs a heap push, so the work done by the
+    watchdog grows with the number of expiries, not with the number of heartbeats or hosts.
+    """
+    __slots__ = ('_heap', 'deadlines', '_queued_at', 'on_earlier')
+
+    def __init__(self, on_earlier: Callable[[], None] = None) -> None:
+        self._heap = []
+        self.deadlines = array('d')
+        self._queued_at = array('d')
+        self.on_earlier = on_earlier
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, slot: int, deadline: float) -> None:
+        """
+        Sets the expiry time of a slot, replacing any previous deadline.
+
+        Args:
+            slot (int): The slot to schedule.
+            deadline (float): The absolute expiry time.
+        """
+        while slot >= len(self.deadlines):
+            self.deadlines.append(math.inf)
+            self._queued_at.append(math.inf)
+        self.deadlines[slot] = deadline
+        if deadline < self._queued_at[slot]:
+            self._push(slot, deadline)
+
+    def cancel(self, slot: int) -> None:
+        """
+        Removes the deadline of a slot. Its heap entry is discarded when it surfaces.
+
+        Args:
+            slot (int): The slot to cancel.
+        """
+        if slot < len(self.deadlines):
+            self.deadlines[slot] = math.inf
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        Returns the earliest queued expiry time, or None if nothing is scheduled.
+        """
+        return self._heap[0][0] if self._heap else None
+
+    def rebuild(self, deadlines: array) -> None:
+        """
+        Replaces every deadline at once, heapifying instead of pushing slot by slot.
+
+        Args:
+            deadlines (array): The deadline of every slot, math.inf for none.
+        """
+        self.deadlines = array('d', deadlines)
+        self._queued_at = array('d', deadlines)
+        self._heap = [(deadline, slot) for slot, deadline in enumerate(deadlines) if deadline != math.inf]
+        heapq.heapify(self._heap)
+        if self._heap and self.on_earlier is not None:
+            self.on_earlier()
+
+    def pop_due(self, now: float) -> List[int]:
+        """
+        Removes and returns the slots whose deadline is at or before `now`.
+
+        Args:
+            now (float): The reference time.
+
+        Returns:
+            List[int]: The expired slots, earliest first.
+        """
+        heap = self._heap
+        due = []
+        while heap and heap[0][0] <= now:
+            queued_at, slot = heapq.heappop(heap)
+            if queued_at != self._queued_at[slot]:
+                # Superseded by an earlier entry for the same slot
+                continue
+            self._queued_at[slot] = math.inf
+            deadline = self.deadlines[slot]
+            if deadline <= now:
+                self.deadlines[slot] = math.inf
+                due.append(slot)
+            elif deadline != math.inf:
+                # The deadline was pushed back since this entry was queued
+                self._push(slot, deadline)
+        return due
+
+    def _push(self, slot: int, deadline: float) -> None:
+        self._queued_at[slot] = deadline
+        heap = self._heap
+        earlier = not heap or deadline < heap[0][0]
+        heapq.heappush(heap, (deadline, slot))
+        if earlier and self.on_earlier is not None:
+            self.on_earlier()
@@ -0,0 +1,358 @@
+import os
+import sys
+import mmap
+import time
+import struct
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from state import frame, pack_strings, read_records, unpack_strings
+
+# Host history is kept in a directory with three files. In memory, every host has a sorted
+# array of its transition times, alternating outage start and end, so a query over any
+# time range is a binary search. The transition log is append-only: each framed record
+# holds a generation and the entries added since the previous write, either a host seen for
+# the first time or the start or end of an outage. Once the log grows larger than the
+# snapshot, all transition arrays are written to a new snapshot as whole columns, which is
+# replaced atomically and loads without replaying entries one by one. The arrival rollups
+# hold a fixed-size block per host with one bucket per day for the last ROLLUP_DAYS days,
+# reused as a ring; each bucket counts the heartbeats of that day and the longest gap
+# between two of them. The rollup file is memory-mapped and updated in place.
+SNAPSHOT_FILE = 'history.bin'
+TRANSITIONS_FILE = 'transitions.log'
+ARRIVALS_FILE = 'arrivals.bin'
+MAGIC = b'AVHL' if sys.byteorder == 'little' else b'AVHB'
+SNAPSHOT_HEADER = struct.Struct('!4sQII')
+LOG_HEADER = struct.Struct('!Q')
+NEW_HOST = 1
+DOWN = 2
+UP = 3
+HOST_ENTRY = struct.Struct('!BHd')
+TRANSITION_ENTRY = struct.Struct('!BId')
+MIN_COMPACT_BYTES = 1024 * 1024
+ROLLUP_DAYS = 366
+ROLLUP_BUCKET = struct.Struct('<HHI')
+ROLLUP_BLOCK = ROLLUP_DAYS * ROLLUP_BUCKET.size
+MAX_GAP = 0xFFFF
+DAY = 86400
+GROW_HOSTS = 1024
+
+
+class HostUptime(NamedTuple):
+    """
+    The availability of a host over a time range. Times are in seconds; the range is cut
+    to the time the host was first seen. Heartbeat counts and gaps cover whole days.
+    """
+    observed: float
+    downtime: float
+    outages: int
+    longest_outage: float
+    heartbeats: int
+    longest_gap: int
+
+    @property
+    def uptime_percent(self) -> float:
+        if self.observed <= 0:
+            return 100.0
+        return 100.0 * (1.0 - self.downtime / self.observed)
+
+
+class HistoryStore:
+    """
+    Records the outages and heartbeat arrivals of every host and answers uptime queries
+    over arbitrary time ranges. Must be used from a single thread, which owns the store;
+    records are encoded by `prepare` on that thread and `write` only touches files, so it
+    can be run in an executor.
+    """
+
+    def __init__(self, directory: str, min_compact_bytes: int = MIN_COMPACT_BYTES) -> None:
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.log_path = os.path.join(directory, TRANSITIONS_FILE)
+        self.arrivals_path = os.path.join(directory, ARRIVALS_FILE)
+        self.min_compact_bytes = min_compact_bytes
+        self.index: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.first_seen = array('d')
+        self.transitions: List[array] = []
+        self.pending = bytearray()
+        self.generation = 0
+        self.snapshot_size = 0
+        self.log_size = 0
+        self.arrivals = None
+        self.capacity = 0
+        self._arrivals_file = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def open(self) -> None:
+        """
+        Loads the snapshot, replays the transition log and maps the arrival rollups,
+        creating them if needed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot_generation = 0
+        if os.path.exists(self.snapshot_path):
+            for record, offset in read_records(self.snapshot_path):
+                snapshot_generation = self._load_snapshot(record)
+                self.snapshot_size = offset
+        self.generation = snapshot_generation
+
+        valid_size = 0
+        if os.path.exists(self.log_path):
+            for record, offset in read_records(self.log_path):
+                valid_size = offset
+                generation = LOG_HEADER.unpack_from(record)[0]
+                if generation <= snapshot_generation:
+                    # Already folded into the snapshot
+                    continue
+                self._apply(record)
+                self.generation = generation
+            # Drop a torn tail so that new records are appended after the last valid one
+            with open(self.log_path, 'r+b') as log_file:
+                log_file.truncate(valid_size)
+        self.log_size = valid_size
+
+        mode = 'r+b' if os.path.exists(self.arrivals_path) else 'w+b'
+        self._arrivals_file = open(self.arrivals_path, mode)
+        self._map(max(len(self.names), os.fstat(self._arrivals_file.fileno()).st_size // ROLLUP_BLOCK, 1))
+
+    def close(self) -> None:
+        """
+        Writes the pending transitions and releases the files.
+        """
+        self.write(*self.prepare())
+        if self.arrivals is not None:
+            self.arrivals.flush()
+            self.arrivals.close()
+            self.arrivals = None
+        if self._arrivals_file is not None:
+            self._arrivals_file.close()
+            self._arrivals_file = None
+
+    def record_down(self, host_id: str, since: float) -> None:
+        """
+        Records that a host went offline.
+
+        Args:
+            host_id (str): The client identity.
+            since (float): The start of the outage, i.e. the last heartbeat before it.
+        """
+        self._record(host_id, DOWN, since)
+
+    def record_up(self, host_id: str, now: float) -> None:
+        """
+        Records that a host is online, ending its outage if it had one.
+
+        Args:
+            host_id (str): The client identity.
+            now (float): When the host was heard from again.
+        """
+        self._record(host_id, UP, now)
+
+    def record_arrival(self, host_id: str, now: float, previous: float) -> None:
+        """
+        Counts a heartbeat in the rollup of its day.
+
+        Args:
+            host_id (str): The client identity.
+            now (float): When the heartbeat was received.
+            previous (float): When the previous heartbeat of the host was received.
+        """
+        index = self._host(host_id, now)
+        day = int(now // DAY)
+        offset = index * ROLLUP_BLOCK + (day % ROLLUP_DAYS) * ROLLUP_BUCKET.size
+        bucket_day, longest_gap, count = ROLLUP_BUCKET.unpack_from(self.arrivals, offset)
+        if bucket_day != day:
+            longest_gap = count = 0
+        gap = min(max(int(now - previous), longest_gap), MAX_GAP)
+        ROLLUP_BUCKET.pack_into(self.arrivals, offset, day, gap, count + 1)
+
+    def uptime(self, host_id: str, start: float, end: float, now: float = None) -> Optional[HostUptime]:
+        """
+        Summarises the outages and heartbeats of a host over a time range.
+
+        Args:
+            host_id (str): The client identity.
+            start (float): The start of the range.
+            end (float): The end of the range; times after `now` are not counted.
+            now (float, optional): The current time. Defaults to time.time().
+
+        Returns:
+            Optional[HostUptime]: The summary, or None if the host has no history.
+        """
+        index = self.index.get(host_id)
+        if index is None:
+            return None
+        end = min(end, time.time() if now is None else now)
+        start = max(start, self.first_seen[index])
+        if end <= start:
+            return HostUptime(0.0, 0.0, 0, 0.0, 0, 0)
+
+        times = self.transitions[index]
+        position = bisect_right(times, start)
+        if position % 2:
+            # The range starts during an outage
+            position -= 1
+        downtime = longest = 0.0
+        outages = 0
+        while position < len(times) and times[position] < end:
+            ended = min(times[position + 1], end) if position + 1 < len(times) else end
+            duration = ended - max(times[position], start)
+            if duration > 0:
+                downtime += duration
+                longest = max(longest, duration)
+                outages += 1
+            position += 2
+        heartbeats, longest_gap = self._arrivals_between(index, start, end)
+        return HostUptime(end - start, downtime, outages, longest, heartbeats, longest_gap)
+
+    def prepare(self) -> Tuple[bytes, bool]:
+        """
+        Encodes the transitions recorded since the previous call, or a full snapshot when
+        the log has outgrown the previous one.
+
+        Returns:
+            Tuple[bytes, bool]: The framed record, empty if nothing changed, and whether it
+            is a snapshot.
+        """
+        compact = self.log_size > max(self.snapshot_size, self.min_compact_bytes)
+        if not self.pending and not compact:
+            return b'', False
+        self.generation += 1
+        if compact:
+            counts = array('I', map(len, self.transitions))
+            record = b''.join([SNAPSHOT_HEADER.pack(MAGIC, self.generation, len(self.names), sum(counts)),
+                               pack_strings(self.names), self.first_seen.tobytes(), counts.tobytes()]
+                              + [times.tobytes() for times in self.transitions])
+        else:
+            record = LOG_HEADER.pack(self.generation) + self.pending
+        self.pending = bytearray()
+        return frame(record), compact
+
+    def write(self, record: bytes, compact: bool) -> None:
+        """
+        Writes a record returned by prepare and syncs it to disk. The arrival rollups are
+        left to the operating system to write back, and synced when the store is closed.
+
+        Args:
+            record (bytes): The framed record.
+            compact (bool): Whether it is a snapshot, which replaces the snapshot file and
+                empties the transition log.
+        """
+        if not record:
+            return
+        if compact:
+            temporary = self.snapshot_path + '.tmp'
+            with open(temporary, 'wb') as snapshot_file:
+                snapshot_file.write(record)
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            os.replace(temporary, self.snapshot_path)
+            with open(self.log_path, 'wb'):
+                pass
+            self.snapshot_size = len(record)
+            self.log_size = 0
+        else:
+            with open(self.log_path, 'ab') as log_file:
+                log_file.write(record)
+                log_file.flush()
+                os.fsync(log_file.fileno())
+            self.log_size += len(record)
+
+    def _load_snapshot(self, record: bytes) -> int:
+        view = memoryview(record)
+        magic, generation, host_count, _ = SNAPSHOT_HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("Unknown history format or byte order")
+        names, offset = unpack_strings(view, SNAPSHOT_HEADER.size, host_count)
+        first_seen = array('d')
+        first_seen.frombytes(view[offset:offset + 8 * host_count])
+        offset += 8 * host_count
+        counts = array('I')
+        counts.frombytes(view[offset:offset + 4 * host_count])
+        offset += 4 * host_count
+
+        transitions = []
+        for count in counts:
+            times = array('d')
+            times.frombytes(view[offset:offset + 8 * count])
+            transitions.append(times)
+            offset += 8 * count
+        self.names = names
+        self.index = {host_id: index for index, host_id in enumerate(names)}
+        self.first_seen = first_seen
+        self.transitions = transitions
+        return generation
+
+    def _apply(self, record: bytes) -> None:
+        # Entries are applied inline, as a long log would otherwise dominate startup
+        unpack_transition = TRANSITION_ENTRY.unpack_from
+        transitions = self.transitions
+        offset = LOG_HEADER.size
+        end = len(record)
+        while offset < end:
+            if record[offset] == NEW_HOST:
+                _, length, first_seen = HOST_ENTRY.unpack_from(record, offset)
+                offset += HOST_ENTRY.size
+                self._add_host(record[offset:offset + length].decode(), first_seen)
+                offset += length
+            else:
+                kind, index, at = unpack_transition(record, offset)
+                offset += TRANSITION_ENTRY.size
+                times = transitions[index]
+                if (kind == DOWN) != (len(times) % 2 == 1):
+                    times.append(max(at, times[-1]) if times else at)
+
+    def _host(self, host_id: str, now: float) -> int:
+        index = self.index.get(host_id)
+        if index is None:
+            index = self._add_host(host_id, now)
+            encoded = host_id.encode()
+            self.pending += HOST_ENTRY.pack(NEW_HOST, len(encoded), now) + encoded
+        return index
+
+    def _add_host(self, host_id: str, first_seen: float) -> int:
+        index = len(self.names)
+        self.index[host_id] = index
+        self.names.append(host_id)
+        self.first_seen.append(first_seen)
+        self.transitions.append(array('d'))
+        if self.arrivals is not None and index >= self.capacity:
+            self._map(index + 1)
+        return index
+
+    def _record(self, host_id: str, kind: int, at: float) -> None:
+        index = self._host(host_id, at)
+        times = self.transitions[index]
+        if (kind == DOWN) == (len(times) % 2 == 1):
+            # Already in that state
+            return
+        if times and at < times[-1]:
+            at = times[-1]
+        times.append(at)
+        self.pending += TRANSITION_ENTRY.pack(kind, index, at)
+
+    def _arrivals_between(self, index: int, start: float, end: float) -> Tuple[int, int]:
+        last = int(end // DAY)
+        first = max(int(start // DAY), last - ROLLUP_DAYS + 1)
+        base = index * ROLLUP_BLOCK
+        heartbeats = longest_gap = 0
+        for day in range(first, last + 1):
+            bucket_day, gap, count = ROLLUP_BUCKET.unpack_from(self.arrivals, base + (day % ROLLUP_DAYS)
+                                                               * ROLLUP_BUCKET.size)
+            if bucket_day == day:
+                heartbeats += count
+                longest_gap = max(longest_gap, gap)
+        return heartbeats, longest_gap
+
+    def _map(self, hosts: int) -> None:
+        self.capacity = -(-hosts // GROW_HOSTS) * GROW_HOSTS
+        if self.arrivals is not None:
+            self.arrivals.close()
+        size = self.capacity * ROLLUP_BLOCK
+        if os.fstat(self._arrivals_file.fileno()).st_size < size:
+            self._arrivals_file.truncate(size)
+        self.arrivals = mmap.mmap(self._arrivals_file.fileno(), size)
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, NamedTuple, Tuple
+
+MAX_HEADER_LINES = 100
+MAX_BODY_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 10
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HttpRequest(NamedTuple):
+    """
+    A parsed HTTP request. Header names are lower-case.
+    """
+    method: str
+    path: str
+    headers: Dict[str, str]
+    body: bytes
+
+
+class HttpResponse(NamedTuple):
+    """
+    The response returned by a route handler.
+    """
+    status: int = 200
+    body: bytes = b''
+    content_type: str = 'text/plain; charset=utf-8'
+
+
+Handler = Callable[[HttpRequest], Awaitable[HttpResponse]]
+
+
+async def read_request(reader) -> HttpRequest:
+    """
+    Reads one HTTP/1.x request from a stream.
+
+    Args:
+        reader (StreamReader): The stream reader of the connection.
+
+    Raises:
+        ValueError: If the request is malformed or too large.
+    """
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    parts = request_line.split()
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise ValueError(f"Bad request line: {request_line!r}")
+    method, target, _ = parts
+
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise ValueError("Too many headers")
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_SIZE:
+        raise ValueError("Body too large")
+    body = await reader.readexactly(length) if length else b''
+    return HttpRequest(method.upper(), target.split('?', 1)[0], headers, body)
+
+
+async def start_http_server(routes: Dict[Tuple[str, str], Handler], host: str, port: int) -> asyncio.Server:
+    """
+    Starts a minimal HTTP server on the running event loop. Every connection serves a
+    single request and is then closed.
+
+    Args:
+        routes (Dict[Tuple[str, str], Handler]): Handlers keyed by (method, path).
+        host (str): The address to bind.
+        port (int): The port to bind.
+
+    Returns:
+        asyncio.Server: The started server.
+    """
+
+    async def handle_connection(reader, writer) -> None:
+        try:
+            request = await asyncio.wait_for(read_request(reader), REQUEST_TIMEOUT)
+            handler = routes.get((request.method, request.path))
+            if handler is None:
+                known_path = any(path == request.path for _, path in routes)
+                response = HttpResponse(405 if known_path else 404, b'')
+            else:
+                response = await handler(request)
+        except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            logging.warning(f"Bad HTTP request from {writer.get_extra_info('peername')}: {e}")
+            response = HttpResponse(400, b'')
+        except Exception as e:
+            logging.error(f"Error handling HTTP request: {e}")
+            response = HttpResponse(500, b'')
+
+        head = (f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}\r\n"
+                f"Content-Type: {response.content_type}\r\n"
+                f"Content-Length: {len(response.body)}\r\n"
+                f"Connection: close\r\n\r\n")
+        try:
+            writer.write(head.encode('latin-1') + response.body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle_connection, host, port)
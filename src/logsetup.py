@@ -0,0 +1,142 @@
+import atexit
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(message)s'
+
+
+class EnqueueHandler(QueueHandler):
+    """
+    A queue handler that hands the record over untouched. Formatting happens on the
+    listener thread, so the logging call on the event loop only appends to a queue.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(filename: str, mode: str = 'async', max_bytes: int = 0, backup_count: int = 5,
+                      when: str = None, level: int = logging.INFO) -> Optional[QueueListener]:
+    """
+    Sets up the root logger to write to a file, optionally rotating it.
+
+    In 'async' mode the file is written by a background listener thread and log calls
+    only enqueue the record. In 'sync' mode records are written by the calling thread.
+
+    Args:
+        filename (str): The log file.
+        mode (str, optional): 'async' or 'sync'. Defaults to 'async'.
+        max_bytes (int, optional): Rotate when the file reaches this size. 0 disables size rotation.
+        backup_count (int, optional): The number of rotated files to keep. Defaults to 5.
+        when (str, optional): Rotate on a schedule instead, e.g. 'midnight' or 'H'
+            (see TimedRotatingFileHandler). Takes precedence over `max_bytes`.
+        level (int, optional): The root log level. Defaults to INFO.
+
+    Returns:
+        Optional[QueueListener]: The running listener in 'async' mode, None otherwise.
+    """
+    if when:
+        file_handler = TimedRotatingFileHandler(filename, when=when, backupCount=backup_count)
+    elif max_bytes:
+        file_handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count)
+    else:
+        file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    if mode != 'async':
+        root.addHandler(file_handler)
+        return None
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(EnqueueHandler(records))
+    return listener
+
+
+class ForwardHandler(logging.Handler):
+    """
+    Hands records received from worker processes to the local logger of the same name.
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger(record.name).handle(record)
+
+
+def forward_worker_logs(records) -> QueueListener:
+    """
+    Starts writing the records that worker processes put on a shared queue through the
+    handlers of this process.
+
+    Args:
+        records (multiprocessing.Queue): The queue the workers log to.
+
+    Returns:
+        QueueListener: The running listener.
+    """
+    listener = QueueListener(records, ForwardHandler())
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def configure_worker_logging(records, level: int = logging.INFO) -> None:
+    """
+    Replaces the handlers of a worker process so that its records are sent to the parent
+    over a shared queue instead of being written to the log file directly.
+
+    Args:
+        records (multiprocessing.Queue): The queue read by forward_worker_logs in the parent.
+        level (int, optional): The root log level. Defaults to INFO.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level)
+
+
+class LogSampler:
+    """
+    Lets one log line per key through every `interval` seconds and counts the rest, so
+    that lines repeated for every connection or heartbeat cannot flood the log. At most
+    `max_keys` keys are tracked; the table is reset when it grows past that.
+    """
+    __slots__ = ('interval', 'max_keys', '_next', '_suppressed')
+
+    def __init__(self, interval: float, max_keys: int = 10000) -> None:
+        self.interval = interval
+        self.max_keys = max_keys
+        self._next = {}
+        self._suppressed = {}
+
+    def sample(self, key, now: float = None) -> Optional[int]:
+        """
+        Decides whether the line for `key` should be logged now.
+
+        Args:
+            key (Hashable): The key lines are sampled by, e.g. a peer IP or host id.
+            now (float, optional): The current monotonic time. Defaults to time.monotonic().
+
+        Returns:
+            Optional[int]: None if the line should be skipped, otherwise the number of lines
+            for this key that were skipped since the last one logged.
+        """
+        if self.interval <= 0:
+            return 0
+        if now is None:
+            now = time.monotonic()
+        if now < self._next.get(key, 0.0):
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return None
+        if len(self._next) >= self.max_keys:
+            self._next.clear()
+            self._suppressed.clear()
+        self._next[key] = now + self.interval
+        return self._suppressed.pop(key, 0)
@@ -0,0 +1,90 @@
+import os
+import time
+from collections import deque
+from typing import List, NamedTuple
+
+
+def tail_lines(path: str, count: int, block_size: int = 8192) -> List[str]:
+    """
+    Returns the last lines of a text file, reading backwards from its end in blocks so
+    that the cost depends on the number of lines requested, not on the size of the file.
+
+    Args:
+        path (str): The path of the file.
+        count (int): The number of lines to return.
+        block_size (int, optional): The number of bytes read per step. Defaults to 8192.
+
+    Returns:
+        List[str]: The last `count` lines, oldest first, with their line endings.
+    """
+    if count <= 0:
+        return []
+    with open(path, 'rb') as file:
+        position = file.seek(0, os.SEEK_END)
+        data = b''
+        # One newline more than requested guarantees the first returned line is complete
+        while position > 0 and data.count(b'\n') <= count:
+            step = min(block_size, position)
+            position -= step
+            file.seek(position)
+            data = file.read(step) + data
+    return [line.decode('utf-8', 'replace') for line in data.splitlines(keepends=True)[-count:]]
+
+
+class Event(NamedTuple):
+    """
+    One structured monitoring event.
+    """
+    time: float
+    kind: str
+    host_id: str
+    message: str
+
+    def __str__(self) -> str:
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.time))
+        return f"{stamp} [{self.kind}] {self.message}"
+
+
+class EventRing:
+    """
+    Keeps the most recent monitoring events in memory, dropping the oldest ones once
+    `size` events are stored, so recent history can be served without touching the disk.
+    """
+
+    def __init__(self, size: int = 1000) -> None:
+        self.events = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def record(self, kind: str, message: str, host_id: str = '') -> None:
+        """
+        Adds an event to the ring.
+
+        Args:
+            kind (str): The event type, e.g. 'down', 'up' or 'invalid'.
+            message (str): A human-readable description.
+            host_id (str, optional): The host the event is about, if any.
+        """
+        self.events.append(Event(time.time(), kind, host_id, message))
+
+    def recent(self, count: int, host_id: str = None, kind: str = None) -> List[Event]:
+        """
+        Returns the most recent events, optionally filtered by host and event type.
+
+        Args:
+            count (int): The maximum number of events to return.
+            host_id (str, optional): Only return events about this host.
+            kind (str, optional): Only return events of this type.
+
+        Returns:
+            List[Event]: The matching events, oldest first.
+        """
+        matches = []
+        for event in reversed(self.events):
+            if len(matches) >= count:
+                break
+            if (host_id is None or event.host_id == host_id) and (kind is None or event.kind == kind):
+                matches.append(event)
+        matches.reverse()
+        return matches
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import Counter
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+# Frames kept in the stack of a stall report, innermost last
+STACK_LIMIT = 20
+
+
+class Stall(NamedTuple):
+    """
+    A callback that held the event loop for longer than the watchdog threshold.
+    """
+    started: float
+    duration: float
+    task: str
+    stack: str
+
+
+class LoopWatchdog:
+    """
+    Detects callbacks that block the event loop, from a background thread. The thread
+    schedules a no-op on the loop and waits for it to run. If it has not run within
+    `threshold` seconds, the thread records the stack of the loop's thread and the task
+    being run at that moment, then waits for the loop to catch up to measure the stall.
+
+    While the loop is responsive this costs one wake-up of the loop per `threshold`
+    seconds. The time each no-op took to run is also the loop's lag, and the largest one
+    is kept until `take_max_lag` is called.
+    """
+
+    def __init__(self, threshold: float, on_stall: Callable[[Stall], None]) -> None:
+        self.threshold = threshold
+        self.on_stall = on_stall
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        self.max_lag = 0.0
+
+    def start(self) -> None:
+        """
+        Starts watching the running event loop. Must be called from the loop's thread.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def take_max_lag(self) -> float:
+        """
+        Returns the largest lag measured since the previous call, in seconds.
+        """
+        lag, self.max_lag = self.max_lag, 0.0
+        return lag
+
+    def _watch(self) -> None:
+        while not self.stopping.is_set():
+            answered = threading.Event()
+            sent = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                return  # The loop was closed
+            if not answered.wait(self.threshold):
+                task, stack = self._capture()
+                while not answered.wait(self.threshold):
+                    if self.stopping.is_set() or self.loop.is_closed():
+                        return
+                duration = time.monotonic() - sent
+                stall = Stall(time.time() - duration, duration, task, stack)
+                try:
+                    self.loop.call_soon_threadsafe(self.on_stall, stall)
+                except RuntimeError:
+                    return
+            self.max_lag = max(self.max_lag, time.monotonic() - sent)
+            self.stopping.wait(self.threshold)
+
+    def _capture(self) -> Tuple[str, str]:
+        """
+        Returns the task the loop is running and the stack of the loop's thread.
+        """
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = ''.join(traceback.format_list(traceback.extract_stack(frame, STACK_LIMIT))) if frame else ''
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            return 'a callback outside any task', stack
+        return f"task {task.get_name()} ({describe_coroutine(task.get_coro())})", stack
+
+
+def describe_coroutine(coroutine) -> str:
+    return getattr(coroutine, '__qualname__', None) or repr(coroutine)
+
+
+class ProfileEntry(NamedTuple):
+    """
+    One function of a profile, with the share of samples it was running in (own) or
+    anywhere on the stack (total).
+    """
+    function: str
+    own: float
+    total: float
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float = 0.005) -> Tuple[int, Counter, Counter]:
+    """
+    Samples the stack of a thread every `interval` seconds for `seconds` seconds. Runs in
+    the calling thread, which must not be the sampled one.
+
+    Args:
+        thread_id (int): The thread to sample, as returned by threading.get_ident().
+        seconds (float): How long to sample.
+        interval (float, optional): Seconds between samples. Defaults to 5 ms.
+
+    Returns:
+        Tuple[int, Counter, Counter]: The number of samples, and per code object the samples
+            it was running in and the samples it was on the stack in.
+    """
+    samples = 0
+    own = Counter()
+    total = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        samples += 1
+        own[frame.f_code] += 1
+        on_stack = set()
+        while frame is not None:
+            on_stack.add(frame.f_code)
+            frame = frame.f_back
+        total.update(on_stack)
+        time.sleep(interval)
+    return samples, own, total
+
+
+def summarize_profile(samples: int, own: Counter, total: Counter, top: int) -> List[ProfileEntry]:
+    """
+    Returns the `top` functions that were running in the most samples.
+
+    Args:
+        samples (int): The number of samples taken.
+        own (Counter): Samples per code object it was running in.
+        total (Counter): Samples per code object it was on the stack in.
+        top (int): The number of functions to return.
+
+    Returns:
+        List[ProfileEntry]: The hottest functions first.
+    """
+    if not samples:
+        return []
+    return [ProfileEntry(f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})",
+                         count / samples, total[code] / samples)
+            for code, count in own.most_common(top)]
+
+
+def format_profile(entries: List[ProfileEntry], samples: int, seconds: float) -> str:
+    """
+    Formats a profile as one line per function, with its own and total share of samples.
+    """
+    lines = [f"{samples} samples over {seconds:g}s. own% total% function"]
+    lines.extend(f"{entry.own:5.1%} {entry.total:6.1%} {entry.function}" for entry in entries)
+    return '\n'.join(lines)
+
+
+def short_path(path: str) -> str:
+    return os.sep.join(path.split(os.sep)[-2:])
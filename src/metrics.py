@@ -0,0 +1,161 @@
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Latency buckets in seconds, from 10 microseconds to 10 seconds
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """
+    The base of all metrics. Values are kept per tuple of label values, in the order of
+    `labelnames`; a metric without labels uses the empty tuple.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def _label_text(self, labels: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{self._label_text(labels)} {value}' for labels, value in self.values.items()]
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """
+    A value that only goes up.
+    """
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, labels: Tuple[str, ...] = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down. With a callback, the values are computed when the
+    metrics are scraped; the callback returns a mapping of label tuples to values.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Callable[[], Dict[Tuple[str, ...], float]] = None) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        self.values[labels] = value
+
+    def inc(self, amount: float = 1, labels: Tuple[str, ...] = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, labels: Tuple[str, ...] = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            self.values = dict(self.callback())
+        return super().samples()
+
+
+class Histogram(Metric):
+    """
+    Counts observations into fixed buckets. Observing costs one binary search and two
+    additions; cumulative bucket counts are only computed when the metrics are scraped.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.counts: Dict[Tuple[str, ...], List[int]] = {}
+        self.sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = self._label_text(labels, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            cumulative += counts[-1]
+            bucket_labels = self._label_text(labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{self._label_text(labels)} {self.sums[labels]}')
+            lines.append(f'{self.name}_count{self._label_text(labels)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The set of metrics exposed on the /metrics endpoint.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Callable[[], Dict[Tuple[str, ...], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+registry = MetricsRegistry()
+
+EVENT_LOOP_LAG = registry.histogram(
+    'avanguard_event_loop_lag_seconds', 'Delay between when the lag probe was due and when it ran.')
+
+
+async def probe_event_loop_lag(interval: float = 0.5) -> None:
+    """
+    Measures how late the event loop runs a sleeping task, which is the time other
+    callbacks kept the loop busy.
+
+    Args:
+        interval (float, optional): Seconds between probes. Defaults to 0.5.
+    """
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - started - interval))
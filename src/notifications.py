@@ -0,0 +1,170 @@
+import asyncio
+import importlib
+import logging
+import time
+from typing import Dict, List, Mapping
+
+from metrics import registry as metrics_registry
+from ratelimit import TokenBucket
+
+QUEUE_SIZE = 1000
+
+# Notification channels are plugins: modules with a create_channel(env) function that
+# builds the channel from the environment. A channel module, and the client library it
+# depends on, is imported only when the channel is enabled. Names not listed here are
+# imported as module names, so other channels can be added without changing this file.
+BUILTIN_CHANNELS = {'telegram': 'telegram_channel', 'pushbullet': 'pushbullet_channel'}
+
+SEND_SECONDS = metrics_registry.histogram(
+    'avanguard_notification_send_seconds', 'Time taken by successful notification sends, by channel.', ['channel'])
+SEND_FAILURES = metrics_registry.counter(
+    'avanguard_notification_failures_total', 'Failed notification send attempts, by channel.', ['channel'])
+
+
+class NotificationChannel:
+    """
+    A destination for notifications. Channels are created once and reused for every
+    message, so their HTTP clients keep their connections open between alerts.
+
+    `rate` is the sustained number of messages per second the service accepts and `burst`
+    the number that may be sent back to back; a rate of None disables rate limiting.
+    """
+    name = 'channel'
+    rate = None
+    burst = 1
+
+    async def start(self) -> None:
+        """
+        Prepares the channel before the first message is sent.
+        """
+
+    async def send(self, title: str, body: str) -> None:
+        """
+        Delivers one notification. Raises an exception if delivery failed.
+
+        Args:
+            title (str): The title of the notification message.
+            body (str): The body of the notification message.
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """
+        Releases the resources held by the channel.
+        """
+
+
+def load_channel(name: str, env: Mapping[str, str]) -> NotificationChannel:
+    """
+    Imports a channel plugin and creates its channel.
+
+    Args:
+        name (str): A built-in channel name, or the module name of a channel plugin.
+        env (Mapping[str, str]): The settings to configure the channel from.
+
+    Returns:
+        NotificationChannel: The channel, not yet started.
+
+    Raises:
+        ImportError: If the plugin or the library it needs is not installed.
+        ValueError: If the channel is not fully configured.
+    """
+    module = importlib.import_module(BUILTIN_CHANNELS.get(name, name))
+    return module.create_channel(env)
+
+
+class NotificationDispatcher:
+    """
+    Delivers notifications in the background so that callers on the event loop never
+    wait for HTTP. Every channel has its own queue and worker task, so a slow or failing
+    channel does not hold up the others. Each worker paces its sends with a token bucket
+    sized from the channel's rate limits. Failed sends are retried with exponential
+    backoff before the message is dropped.
+    """
+
+    def __init__(self, channels: List[NotificationChannel], max_attempts: int = 5,
+                 backoff: float = 1.0, max_backoff: float = 60.0) -> None:
+        self.channels = channels
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queues: Dict[str, asyncio.Queue] = {channel.name: asyncio.Queue(QUEUE_SIZE) for channel in channels}
+        self.workers: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """
+        Starts one worker task per channel.
+        """
+        for channel in self.channels:
+            try:
+                await channel.start()
+            except Exception as e:
+                logging.error(f"Failed to start {channel.name} notifications: {e}")
+            self.workers.append(asyncio.create_task(self._run_worker(channel, self.queues[channel.name])))
+
+    async def stop(self) -> None:
+        """
+        Stops the workers and closes the channels. Messages still queued are discarded.
+        """
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers.clear()
+        for channel in self.channels:
+            try:
+                await channel.close()
+            except Exception as e:
+                logging.error(f"Failed to close {channel.name} notifications: {e}")
+
+    def submit(self, title: str, body: str) -> None:
+        """
+        Queues a notification for every channel without waiting for delivery.
+
+        Args:
+            title (str): The title of the notification message.
+            body (str): The body of the notification message.
+        """
+        for name, queue in self.queues.items():
+            try:
+                queue.put_nowait((title, body))
+            except asyncio.QueueFull:
+                logging.error(f'{name} notification queue full, dropped "{title} {body}"')
+
+    async def join(self) -> None:
+        """
+        Waits until every queued notification has been delivered or dropped.
+        """
+        await asyncio.gather(*(queue.join() for queue in self.queues.values()))
+
+    async def _run_worker(self, channel: NotificationChannel, queue: asyncio.Queue) -> None:
+        bucket = TokenBucket(channel.rate, channel.burst) if channel.rate else None
+        while True:
+            title, body = await queue.get()
+            try:
+                if bucket is not None:
+                    delay = bucket.delay()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    bucket.consume()
+                await self._deliver(channel, title, body)
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, channel: NotificationChannel, title: str, body: str) -> None:
+        delay = self.backoff
+        for attempt in range(1, self.max_attempts + 1):
+            started = time.perf_counter()
+            try:
+                await channel.send(title, body)
+                elapsed = time.perf_counter() - started
+                SEND_SECONDS.observe(elapsed, (channel.name,))
+                logging.warning(f'Send via {channel.name}. "{title} {body}" ({elapsed:.3f}s)')
+                return
+            except Exception as e:
+                SEND_FAILURES.inc(labels=(channel.name,))
+                if attempt == self.max_attempts:
+                    logging.error(f"Failed to send {channel.name} notification after {attempt} attempts: {e}")
+                    return
+                logging.warning(f"Failed to send {channel.name} notification: {e}. Retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
@@ -0,0 +1,123 @@
+import math
+from array import array
+from statistics import NormalDist
+from typing import Optional
+
+MAX_PHI = 300.0
+
+
+class PhiAccrualDetector:
+    """
+    A phi accrual failure detector (Hayashibara et al.) for every host.
+
+    The last `window` heartbeat inter-arrival times of each host are kept in a ring
+    buffer, together with their running sum and sum of squares, so recording a heartbeat
+    and reading the mean and deviation are O(1). The suspicion level after `elapsed`
+    seconds of silence is phi = -log10(P(next arrival > elapsed)) under a normal
+    distribution fitted to the window. A host is suspected once phi reaches `threshold`;
+    because phi only grows with silence, that moment is known in advance as
+    mean + z * deviation, which is what the registry schedules as the host's expiry.
+
+    All ring buffers share one float32 array; each host costs `window` * 4 bytes plus a
+    few counters. Until a host has `min_samples` intervals, no timeout is suggested and
+    the caller falls back to its fixed threshold.
+    """
+    __slots__ = ('threshold', 'window', 'min_samples', 'min_std', '_z', 'samples', 'counts', 'cursors',
+                 'sums', 'squares')
+
+    def __init__(self, threshold: float = 8.0, window: int = 100, min_samples: int = 5,
+                 min_std: float = 1.0) -> None:
+        if not 0 < threshold <= MAX_PHI:
+            raise ValueError(f"Phi threshold must be between 0 and {MAX_PHI}")
+        if not 2 <= min_samples <= window <= 0xFFFF:
+            raise ValueError("The window must hold at least min_samples >= 2 intervals")
+        self.threshold = threshold
+        self.window = window
+        self.min_samples = min_samples
+        self.min_std = min_std
+        self._z = -NormalDist().inv_cdf(10 ** -threshold)
+        self.samples = array('f')
+        self.counts = array('H')
+        self.cursors = array('H')
+        self.sums = array('d')
+        self.squares = array('d')
+
+    def record(self, slot: int, interval: float) -> None:
+        """
+        Adds one inter-arrival time of a host, evicting the oldest once the window is full.
+
+        Args:
+            slot (int): The slot of the host.
+            interval (float): The seconds between its last two heartbeats.
+        """
+        while slot >= len(self.counts):
+            self.samples.frombytes(bytes(self.samples.itemsize * self.window))
+            self.counts.append(0)
+            self.cursors.append(0)
+            self.sums.append(0.0)
+            self.squares.append(0.0)
+
+        index = slot * self.window + self.cursors[slot]
+        if self.counts[slot] == self.window:
+            evicted = self.samples[index]
+            self.sums[slot] -= evicted
+            self.squares[slot] -= evicted * evicted
+        else:
+            self.counts[slot] += 1
+        # Store first, so that the value added to the sums is the rounded one later evicted
+        self.samples[index] = interval
+        interval = self.samples[index]
+        self.sums[slot] += interval
+        self.squares[slot] += interval * interval
+        self.cursors[slot] = (self.cursors[slot] + 1) % self.window
+
+    def reset(self, slot: int) -> None:
+        """
+        Forgets the history of a host, e.g. after it was offline.
+
+        Args:
+            slot (int): The slot of the host.
+        """
+        if slot < len(self.counts):
+            self.counts[slot] = 0
+            self.cursors[slot] = 0
+            self.sums[slot] = 0.0
+            self.squares[slot] = 0.0
+
+    def _distribution(self, slot: int):
+        count = self.counts[slot] if slot < len(self.counts) else 0
+        if count < self.min_samples:
+            return None
+        mean = self.sums[slot] / count
+        variance = max(0.0, self.squares[slot] / count - mean * mean)
+        return mean, max(math.sqrt(variance), self.min_std)
+
+    def phi(self, slot: int, elapsed: float) -> Optional[float]:
+        """
+        Returns the suspicion level of a host after `elapsed` seconds without a heartbeat,
+        or None while it has too few samples.
+
+        Args:
+            slot (int): The slot of the host.
+            elapsed (float): The seconds since its last heartbeat.
+        """
+        distribution = self._distribution(slot)
+        if distribution is None:
+            return None
+        mean, std = distribution
+        later = 0.5 * math.erfc((elapsed - mean) / (std * math.sqrt(2)))
+        return min(MAX_PHI, -math.log10(later)) if later > 0 else MAX_PHI
+
+    def timeout(self, slot: int) -> Optional[float]:
+        """
+        Returns the seconds of silence after which the suspicion of a host reaches the
+        threshold, or None while it has too few samples.
+
+        Args:
+            slot (int): The slot of the host.
+        """
+        distribution = self._distribution(slot)
+        if distribution is None:
+            return None
+        mean, std = distribution
+        return mean + self._z * std
@@ -0,0 +1,320 @@
+import hashlib
+import hmac
+import itertools
+import struct
+import time
+import zlib
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+# Persistent connections carry heartbeats as length-prefixed frames. The prefix is a
+# 4-byte big-endian length capped well below 16 MiB, so the first byte of a stream is
+# always zero, which is how the server tells it apart from a one-shot heartbeat.
+FRAME_HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 64 * 1024
+STREAM_MARKER = b'\x00'
+
+# Heartbeats come in two wire formats, told apart by their first byte. The text format
+# is `heartbeat:[<host_id>:]<timestamp>:<hex hmac>` and always starts with `h`. The binary
+# format starts with a version byte, followed by the length of the host id, an integer
+# nanosecond timestamp, a sequence number, the host id and the raw HMAC-SHA256 digest of
+# everything before it.
+TEXT_MARKER = ord('h')
+BINARY_V1 = 0xB1
+BINARY_HEADER = struct.Struct('!BBQQ')
+DIGEST_SIZE = 32
+MAX_HOST_ID_SIZE = 255
+
+# Binary heartbeats of version 2 also carry host gauges, signed with the rest of the
+# message: after the host id come a gauge count and, per gauge, its id and a float32
+# value. Ids index GAUGE_NAMES; the server skips ids it does not know, so gauges can be
+# added without breaking older servers.
+BINARY_V2 = 0xB2
+GAUGE_ENTRY = struct.Struct('!Bf')
+GAUGE_NAMES = ('load', 'memory', 'disk', 'swap')
+MAX_GAUGES = 16
+
+# Relays forward the hosts they heard from as signed batch digests, which start with
+# their own version byte. After the header (version, relay id length, nanosecond
+# timestamp, sequence number, host count) come the relay id, the zlib-compressed host
+# entries and the HMAC-SHA256 digest of everything before it. Each entry is the host id
+# length, the milliseconds since the relay last heard from the host, and the host id.
+# Entries are split across digests so that each fits in one frame uncompressed.
+RELAY_DIGEST_V1 = 0xD1
+RELAY_DIGEST_HEADER = struct.Struct('!BBQQH')
+RELAY_DIGEST_ENTRY = struct.Struct('!BI')
+MAX_RELAY_DIGEST_BODY = 48 * 1024
+
+
+class BinaryHeartbeat(NamedTuple):
+    """
+    The fields of a binary heartbeat. `signed` and `digest` are views into the message;
+    `gauges` holds the encoded gauges of a version 2 heartbeat, see decode_gauges.
+    """
+    version: int
+    host_id: bytes
+    timestamp_ns: int
+    sequence: int
+    signed: memoryview
+    digest: memoryview
+    gauges: bytes = b''
+
+
+class RelayDigest(NamedTuple):
+    """
+    The fields of a relay digest. `entries` is still compressed; `signed` and `digest`
+    are views into the message.
+    """
+    relay_id: bytes
+    timestamp_ns: int
+    sequence: int
+    count: int
+    entries: memoryview
+    signed: memoryview
+    digest: memoryview
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """
+    Prefixes a payload with its length for sending over a persistent connection.
+
+    Args:
+        payload (bytes): The heartbeat message to frame.
+
+    Returns:
+        bytes: The framed message.
+    """
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {len(payload)} bytes exceeds {MAX_FRAME_SIZE} bytes")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader, header: bytes = b'') -> Optional[bytes]:
+    """
+    Reads one length-prefixed frame from a stream.
+
+    Args:
+        reader (StreamReader): The stream reader of the connection.
+        header (bytes, optional): Bytes of the header that were already consumed.
+
+    Returns:
+        Optional[bytes]: The frame payload, or None if the peer closed the stream cleanly
+        before the next frame.
+
+    Raises:
+        asyncio.IncompleteReadError: If the stream ends in the middle of a frame.
+        ValueError: If the announced frame length is larger than MAX_FRAME_SIZE.
+    """
+    if not header:
+        header = await reader.read(FRAME_HEADER.size)
+        if not header:
+            return None
+    if len(header) < FRAME_HEADER.size:
+        header += await reader.readexactly(FRAME_HEADER.size - len(header))
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame length {length} exceeds {MAX_FRAME_SIZE} bytes")
+    return await reader.readexactly(length)
+
+
+def encode_text_heartbeat(host_id: str, timestamp: float, key: bytes) -> bytes:
+    """
+    Builds a text heartbeat message signed with HMAC-SHA256.
+
+    Args:
+        host_id (str): The client identity, or an empty string for the legacy form without one.
+        timestamp (float): The send time in seconds since the epoch.
+        key (bytes): The HMAC key.
+
+    Returns:
+        bytes: The encoded heartbeat message.
+    """
+    prefix = f'heartbeat:{host_id}:{timestamp}' if host_id else f'heartbeat:{timestamp}'
+    digest = hmac.new(key, prefix.encode(), hashlib.sha256).hexdigest()
+    return f'{prefix}:{digest}'.encode()
+
+
+def sequence_counter() -> Iterator[int]:
+    """
+    Returns the sequence numbers of a new sender of binary heartbeats or relay digests.
+    They start from the current time in microseconds, so they keep increasing across
+    restarts of the sender and line up with the microsecond timestamps the server uses as
+    sequence numbers for text heartbeats.
+    """
+    return itertools.count(time.time_ns() // 1_000)
+
+
+def encode_binary_heartbeat(host_id: bytes, timestamp_ns: int, sequence: int, key: bytes,
+                            gauges: Sequence[Tuple[int, float]] = ()) -> bytes:
+    """
+    Builds a binary heartbeat message signed with HMAC-SHA256. With gauges, the message is
+    a version 2 heartbeat.
+
+    Args:
+        host_id (bytes): The client identity, at most MAX_HOST_ID_SIZE bytes. May be empty.
+        timestamp_ns (int): The send time in nanoseconds since the epoch.
+        sequence (int): The sequence number of the heartbeat.
+        key (bytes): The HMAC key.
+        gauges (Sequence[Tuple[int, float]], optional): Up to MAX_GAUGES pairs of a gauge id
+            and its value.
+
+    Returns:
+        bytes: The encoded heartbeat message.
+    """
+    if len(host_id) > MAX_HOST_ID_SIZE:
+        raise ValueError(f"Host id longer than {MAX_HOST_ID_SIZE} bytes")
+    if len(gauges) > MAX_GAUGES:
+        raise ValueError(f"More than {MAX_GAUGES} gauges")
+    version = BINARY_V2 if gauges else BINARY_V1
+    signed = BINARY_HEADER.pack(version, len(host_id), timestamp_ns, sequence) + host_id
+    if gauges:
+        signed += bytes([len(gauges)]) + b''.join(GAUGE_ENTRY.pack(gauge, value) for gauge, value in gauges)
+    return signed + hmac.new(key, signed, hashlib.sha256).digest()
+
+
+def decode_binary_heartbeat(data: bytes) -> BinaryHeartbeat:
+    """
+    Splits a binary heartbeat message into its fields. Only the host id is copied.
+
+    Args:
+        data (bytes): The received message.
+
+    Returns:
+        BinaryHeartbeat: The fields of the message. The digest is not verified here.
+
+    Raises:
+        ValueError: If the message is not a binary heartbeat of a known version, carries
+        more than MAX_GAUGES gauges or its length does not match the announced host id
+        length and gauge count.
+    """
+    view = memoryview(data)
+    if len(view) < BINARY_HEADER.size + DIGEST_SIZE:
+        raise ValueError("Binary heartbeat too short")
+    version, host_length, timestamp_ns, sequence = BINARY_HEADER.unpack_from(view)
+    if version not in (BINARY_V1, BINARY_V2):
+        raise ValueError(f"Unsupported heartbeat version 0x{version:02x}")
+    host_end = end = BINARY_HEADER.size + host_length
+    gauges = b''
+    if version == BINARY_V2:
+        if len(view) <= end + DIGEST_SIZE:
+            raise ValueError("Binary heartbeat length mismatch")
+        count = view[end]
+        if count > MAX_GAUGES:
+            raise ValueError(f"More than {MAX_GAUGES} gauges")
+        gauges = view[end + 1:end + 1 + count * GAUGE_ENTRY.size].tobytes()
+        end += 1 + count * GAUGE_ENTRY.size
+    if len(view) != end + DIGEST_SIZE:
+        raise ValueError("Binary heartbeat length mismatch")
+    return BinaryHeartbeat(version, view[BINARY_HEADER.size:host_end].tobytes(), timestamp_ns, sequence,
+                           view[:end], view[end:], gauges)
+
+
+def decode_gauges(gauges: bytes) -> List[Tuple[int, float]]:
+    """
+    Unpacks the gauges of a version 2 heartbeat.
+
+    Args:
+        gauges (bytes): The `gauges` field of a BinaryHeartbeat.
+
+    Returns:
+        List[Tuple[int, float]]: Pairs of a gauge id and its value.
+    """
+    return list(GAUGE_ENTRY.iter_unpack(gauges))
+
+
+def encode_relay_digests(relay_id: bytes, hosts: Iterable[Tuple[bytes, int]], timestamp_ns: int,
+                         sequences: Iterator[int], key: bytes) -> List[bytes]:
+    """
+    Builds the signed digests that report a set of hosts upstream. At least one digest is
+    returned, so that an empty digest still shows the relay is alive.
+
+    Args:
+        relay_id (bytes): The identity of the relay, at most MAX_HOST_ID_SIZE bytes.
+        hosts (Iterable[Tuple[bytes, int]]): Host ids and milliseconds since each was heard from.
+        timestamp_ns (int): The send time in nanoseconds since the epoch.
+        sequences (Iterator[int]): Supplies the sequence number of each digest.
+        key (bytes): The HMAC key of the relay.
+
+    Returns:
+        List[bytes]: The encoded digests.
+    """
+    if len(relay_id) > MAX_HOST_ID_SIZE:
+        raise ValueError(f"Relay id longer than {MAX_HOST_ID_SIZE} bytes")
+    chunks = [[bytearray(), 0]]
+    for host_id, age_ms in hosts:
+        if len(host_id) > MAX_HOST_ID_SIZE:
+            raise ValueError(f"Host id longer than {MAX_HOST_ID_SIZE} bytes")
+        entry = RELAY_DIGEST_ENTRY.pack(len(host_id), min(age_ms, 0xFFFFFFFF)) + host_id
+        chunk = chunks[-1]
+        if len(chunk[0]) + len(entry) > MAX_RELAY_DIGEST_BODY or chunk[1] == 0xFFFF:
+            chunk = [bytearray(), 0]
+            chunks.append(chunk)
+        chunk[0] += entry
+        chunk[1] += 1
+
+    digests = []
+    for entries, count in chunks:
+        signed = (RELAY_DIGEST_HEADER.pack(RELAY_DIGEST_V1, len(relay_id), timestamp_ns, next(sequences), count)
+                  + relay_id + zlib.compress(entries))
+        digests.append(signed + hmac.new(key, signed, hashlib.sha256).digest())
+    return digests
+
+
+def decode_relay_digest(data: bytes) -> RelayDigest:
+    """
+    Splits a relay digest into its fields without decompressing the entries.
+
+    Args:
+        data (bytes): The received message.
+
+    Returns:
+        RelayDigest: The fields of the message. The digest is not verified here.
+
+    Raises:
+        ValueError: If the message is not a relay digest of a known version.
+    """
+    view = memoryview(data)
+    if len(view) < RELAY_DIGEST_HEADER.size + DIGEST_SIZE:
+        raise ValueError("Relay digest too short")
+    version, relay_length, timestamp_ns, sequence, count = RELAY_DIGEST_HEADER.unpack_from(view)
+    if version != RELAY_DIGEST_V1:
+        raise ValueError(f"Unsupported relay digest version 0x{version:02x}")
+    start = RELAY_DIGEST_HEADER.size + relay_length
+    end = len(view) - DIGEST_SIZE
+    if end < start:
+        raise ValueError("Relay digest length mismatch")
+    return RelayDigest(view[RELAY_DIGEST_HEADER.size:start].tobytes(), timestamp_ns, sequence, count,
+                       view[start:end], view[:end], view[end:])
+
+
+def expand_relay_digest(digest: RelayDigest) -> List[Tuple[str, int]]:
+    """
+    Decompresses the host entries of an authenticated relay digest.
+
+    Args:
+        digest (RelayDigest): The decoded digest.
+
+    Returns:
+        List[Tuple[str, int]]: Host ids and milliseconds since each was heard from.
+
+    Raises:
+        ValueError: If the entries are corrupt, larger than MAX_RELAY_DIGEST_BODY or do not
+        match the announced count.
+    """
+    try:
+        inflater = zlib.decompressobj()
+        body = inflater.decompress(digest.entries, MAX_RELAY_DIGEST_BODY)
+    except zlib.error as e:
+        raise ValueError(f"Corrupt relay digest: {e}")
+    if inflater.unconsumed_tail or not inflater.eof:
+        raise ValueError("Relay digest entries too large or truncated")
+
+    hosts = []
+    offset = 0
+    while offset + RELAY_DIGEST_ENTRY.size <= len(body):
+        length, age_ms = RELAY_DIGEST_ENTRY.unpack_from(body, offset)
+        offset += RELAY_DIGEST_ENTRY.size
+        hosts.append((body[offset:offset + length].decode(), age_ms))
+        offset += length
+    if offset != len(body) or len(hosts) != digest.count:
+        raise ValueError("Relay digest entries do not match the announced count")
+    return hosts
@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Mapping
+
+from pushbullet import Pushbullet
+
+from notifications import NotificationChannel
+
+
+class PushbulletChannel(NotificationChannel):
+    """
+    Sends notifications through Pushbullet. The Pushbullet SDK is blocking, so the client
+    is created and used on a worker thread; it keeps its HTTP session between pushes.
+    """
+    name = 'pushbullet'
+    rate = 10 / 60
+    burst = 5
+
+    def __init__(self, api_key: str, executor: ThreadPoolExecutor) -> None:
+        self.api_key = api_key
+        self.executor = executor
+        self.client = None
+
+    def _push(self, title: str, body: str) -> None:
+        if self.client is None:
+            self.client = Pushbullet(self.api_key)
+        self.client.push_note(title, body)
+
+    async def send(self, title: str, body: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._push, title, body)
+
+    async def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+def create_channel(env: Mapping[str, str]) -> PushbulletChannel:
+    """
+    Creates the Pushbullet channel from PUSHBULLET_API_KEY.
+
+    Args:
+        env (Mapping[str, str]): The settings, usually os.environ.
+    """
+    api_key = env.get('PUSHBULLET_API_KEY')
+    if not api_key:
+        raise ValueError("PUSHBULLET_API_KEY must be set")
+    return PushbulletChannel(api_key, ThreadPoolExecutor(max_workers=2, thread_name_prefix='pushbullet'))
@@ -0,0 +1,49 @@
+import time
+
+
+class TokenBucket:
+    """
+    A token bucket that refills at `rate` tokens per second up to `capacity` tokens.
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float = None) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def consume(self, amount: float = 1, now: float = None) -> bool:
+        """
+        Takes tokens from the bucket if enough are available.
+
+        Args:
+            amount (float, optional): The number of tokens to take. Defaults to 1.
+            now (float, optional): The current monotonic time. Defaults to time.monotonic().
+
+        Returns:
+            bool: True if the tokens were taken, False if the bucket is short.
+        """
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def delay(self, amount: float = 1, now: float = None) -> float:
+        """
+        Returns how long to wait until `amount` tokens are available, without taking them.
+
+        Args:
+            amount (float, optional): The number of tokens needed. Defaults to 1.
+            now (float, optional): The current monotonic time. Defaults to time.monotonic().
+        """
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
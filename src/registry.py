@@ -0,0 +1,333 @@
+import math
+import time
+from array import array
+from itertools import compress
+from typing import List, NamedTuple, Optional
+
+from deadlines import DeadlineQueue
+from phi import PhiAccrualDetector
+
+
+class HostStatus(NamedTuple):
+    """
+    A read-only view of one host record, used for status replies.
+    """
+    host_id: str
+    last_seen: float
+    offline: bool
+    down_since: float
+    threshold: int
+
+
+class HostRegistry:
+    """
+    Tracks the liveness state of every monitored host, keyed by the client identity
+    carried in its heartbeats.
+
+    Records are stored column-wise in typed arrays indexed by a small integer slot, so a
+    host costs a dictionary entry plus a few bytes per field instead of a Python object.
+    A threshold of 0 means the host follows the registry-wide default threshold.
+
+    Each online host has an expiry deadline of last-seen time plus threshold, kept in a
+    DeadlineQueue so that expired hosts can be found without scanning the table.
+
+    With a phi accrual detector, hosts without a threshold of their own expire when their
+    suspicion level reaches the detector's phi threshold instead, once it has seen enough
+    of their heartbeats; the fixed default threshold applies until then.
+
+    Every mutation flags the slot in `changed`, so that the state can be persisted
+    incrementally; see take_changes. Each consumer of the changes, e.g. the state saver
+    and replication, gets every change independently of the others; see track_changes.
+    """
+    __slots__ = ('_slots', 'names', 'last_seen', 'down_since', 'thresholds', 'offline',
+                 'default_threshold', 'deadlines', 'groups', 'group_names', '_group_ids', 'detector', 'changed',
+                 '_untaken')
+
+    def __init__(self, default_threshold: int, detector: PhiAccrualDetector = None) -> None:
+        self._slots = {}
+        self.names = []
+        self.last_seen = array('d')
+        self.down_since = array('d')
+        self.thresholds = array('I')
+        self.offline = bytearray()
+        self.default_threshold = default_threshold
+        self.deadlines = DeadlineQueue()
+        self.groups = array('H')
+        self.group_names = ['']
+        self._group_ids = {'': 0}
+        self.detector = detector
+        self.changed = bytearray()
+        # Per consumer of changes, the slots flagged since it last took them
+        self._untaken = [set()]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, host_id: str) -> bool:
+        return host_id in self._slots
+
+    def lookup(self, host_id: str) -> Optional[int]:
+        """
+        Returns the slot of a host, or None if the host has never been seen.
+
+        Args:
+            host_id (str): The client identity of the host.
+        """
+        return self._slots.get(host_id)
+
+    def add(self, host_id: str, now: float = None, group: str = '') -> int:
+        """
+        Adds a host to the registry, treating it as online and last seen at `now`.
+
+        Args:
+            host_id (str): The client identity of the host.
+            now (float, optional): Time of the first heartbeat. Defaults to the current time.
+            group (str, optional): The alert group of the host. Defaults to no group.
+
+        Returns:
+            int: The slot of the host.
+        """
+        slot = self._slots.get(host_id)
+        if slot is not None:
+            return slot
+        if now is None:
+            now = time.time()
+        slot = len(self.names)
+        self._slots[host_id] = slot
+        self.names.append(host_id)
+        self.last_seen.append(now)
+        self.down_since.append(0.0)
+        self.thresholds.append(0)
+        self.offline.append(0)
+        self.groups.append(self._group_id(group))
+        self.changed.append(1)
+        self.deadlines.schedule(slot, now + self.default_threshold)
+        return slot
+
+    def touch(self, host_id: str, now: float = None) -> Optional[float]:
+        """
+        Records a valid heartbeat for a host, adding the host if it is new. A heartbeat older
+        than the last one recorded, e.g. one reported late by a relay, is ignored.
+
+        Args:
+            host_id (str): The client identity of the host.
+            now (float, optional): Arrival time of the heartbeat. Defaults to the current time.
+
+        Returns:
+            Optional[float]: The downtime in seconds if the host was offline and is now back
+            online, None otherwise.
+        """
+        if now is None:
+            now = time.time()
+        slot = self._slots.get(host_id)
+        if slot is None:
+            self.add(host_id, now)
+            return None
+        if now < self.last_seen[slot]:
+            return None
+        if self.detector is not None:
+            if self.offline[slot]:
+                # The outage is not an inter-arrival time; start the history afresh
+                self.detector.reset(slot)
+            else:
+                self.detector.record(slot, now - self.last_seen[slot])
+        self.last_seen[slot] = now
+        self.changed[slot] = 1
+        self.deadlines.schedule(slot, now + self.timeout_of(slot))
+        if self.offline[slot]:
+            self.offline[slot] = 0
+            return now - self.down_since[slot]
+        return None
+
+    def mark_offline(self, slot: int) -> None:
+        """
+        Flags a host as offline. Its downtime is counted from its last heartbeat.
+
+        Args:
+            slot (int): The slot of the host.
+        """
+        self.offline[slot] = 1
+        self.down_since[slot] = self.last_seen[slot]
+        self.changed[slot] = 1
+        self.deadlines.cancel(slot)
+
+    def expire_by(self, host_id: str, deadline: float) -> None:
+        """
+        Brings the expiry of an online host forward to `deadline` if it is currently later.
+
+        Args:
+            host_id (str): The client identity of the host.
+            deadline (float): The latest time at which the host should expire.
+        """
+        slot = self._slots.get(host_id)
+        if slot is not None and not self.offline[slot] and deadline < self.deadlines.deadlines[slot]:
+            self.deadlines.schedule(slot, deadline)
+
+    def threshold_of(self, slot: int) -> int:
+        """
+        Returns the effective offline threshold of a host in seconds.
+
+        Args:
+            slot (int): The slot of the host.
+        """
+        return self.thresholds[slot] or self.default_threshold
+
+    def timeout_of(self, slot: int) -> float:
+        """
+        Returns the seconds of silence after which a host expires: the phi accrual timeout
+        when the detector has enough history and the host has no threshold of its own,
+        the effective offline threshold otherwise.
+
+        Args:
+            slot (int): The slot of the host.
+        """
+        if self.detector is None or self.thresholds[slot]:
+            return self.threshold_of(slot)
+        timeout = self.detector.timeout(slot)
+        return self.default_threshold if timeout is None else timeout
+
+    def phi_of(self, slot: int, now: float = None) -> Optional[float]:
+        """
+        Returns the current suspicion level of a host, or None without a detector or while
+        the detector has too few samples.
+
+        Args:
+            slot (int): The slot of the host.
+            now (float, optional): The reference time. Defaults to the current time.
+        """
+        if self.detector is None:
+            return None
+        return self.detector.phi(slot, (time.time() if now is None else now) - self.last_seen[slot])
+
+    def set_threshold(self, slot: int, seconds: int) -> None:
+        """
+        Overrides the offline threshold of a single host. A value of 0 restores the default.
+
+        Args:
+            slot (int): The slot of the host.
+            seconds (int): The new threshold in seconds.
+        """
+        self.thresholds[slot] = seconds
+        self.changed[slot] = 1
+        self._reschedule(slot)
+
+    def set_default_threshold(self, seconds: int) -> None:
+        """
+        Changes the threshold of every host that has no threshold of its own.
+
+        Args:
+            seconds (int): The new default threshold in seconds.
+        """
+        self.default_threshold = seconds
+        for slot in range(len(self.names)):
+            if not self.thresholds[slot]:
+                self._reschedule(slot)
+
+    def pop_expired(self, now: float = None) -> List[int]:
+        """
+        Returns the slots of online hosts whose last heartbeat is older than their timeout.
+        Each expiry is reported once; the host is expected to be marked offline by the caller.
+
+        Args:
+            now (float, optional): The reference time. Defaults to the current time.
+        """
+        if now is None:
+            now = time.time()
+        return [slot for slot in self.deadlines.pop_due(now) if not self.offline[slot]]
+
+    def _reschedule(self, slot: int) -> None:
+        if not self.offline[slot]:
+            self.deadlines.schedule(slot, self.last_seen[slot] + self.timeout_of(slot))
+
+    def group_of(self, slot: int) -> str:
+        """
+        Returns the alert group of a host.
+
+        Args:
+            slot (int): The slot of the host.
+        """
+        return self.group_names[self.groups[slot]]
+
+    def _group_id(self, group: str) -> int:
+        group_id = self._group_ids.get(group)
+        if group_id is None:
+            group_id = self._group_ids[group] = len(self.group_names)
+            self.group_names.append(group)
+        return group_id
+
+    def status(self, slot: int) -> HostStatus:
+        """
+        Returns a snapshot of one host record.
+
+        Args:
+            slot (int): The slot of the host.
+        """
+        return HostStatus(self.names[slot], self.last_seen[slot], bool(self.offline[slot]),
+                          self.down_since[slot], self.threshold_of(slot))
+
+    def offline_count(self) -> int:
+        """
+        Returns the number of hosts currently flagged as offline.
+        """
+        return self.offline.count(1)
+
+    def track_changes(self) -> int:
+        """
+        Registers another consumer of changes. Consumer 0, the default of take_changes,
+        always exists.
+
+        Returns:
+            int: The consumer to pass to take_changes.
+        """
+        self._untaken.append(set())
+        return len(self._untaken) - 1
+
+    def take_changes(self, consumer: int = 0) -> List[int]:
+        """
+        Returns the slots changed since the previous call by the same consumer. Slots taken
+        by one consumer are still returned to the others.
+
+        Args:
+            consumer (int, optional): The consumer from track_changes. Defaults to 0.
+        """
+        changed = list(compress(range(len(self.changed)), self.changed))
+        self.changed = bytearray(len(self.names))
+        if len(self._untaken) == 1:
+            return changed
+        for untaken in self._untaken:
+            untaken.update(changed)
+        changed = sorted(self._untaken[consumer])
+        self._untaken[consumer] = set()
+        return changed
+
+    def restore(self, names: List[str], group_names: List[str], last_seen: array, down_since: array,
+                thresholds: array, offline: bytearray, groups: array, not_before: float = 0.0) -> None:
+        """
+        Replaces the whole registry with saved records, e.g. on a warm restart. Offline hosts
+        stay offline; online hosts expire at their usual time, but not before `not_before`.
+
+        Args:
+            names (List[str]): The host ids, by slot.
+            group_names (List[str]): The alert group names, by group id, starting with ''.
+            last_seen (array): The last heartbeat times, by slot.
+            down_since (array): The times hosts went offline, by slot.
+            thresholds (array): The per-host thresholds, 0 for the default, by slot.
+            offline (bytearray): The offline flags, by slot.
+            groups (array): The alert group ids, by slot.
+            not_before (float, optional): The earliest expiry of online hosts.
+        """
+        self.names = list(names)
+        self._slots = {host_id: slot for slot, host_id in enumerate(self.names)}
+        self.group_names = list(group_names)
+        self._group_ids = {group: group_id for group_id, group in enumerate(self.group_names)}
+        self.last_seen = array('d', last_seen)
+        self.down_since = array('d', down_since)
+        self.thresholds = array('I', thresholds)
+        self.offline = bytearray(offline)
+        self.groups = array('H', groups)
+        self.changed = bytearray(len(self.names))
+        for untaken in self._untaken:
+            untaken.clear()
+        self.deadlines.rebuild(array('d', (
+            math.inf if self.offline[slot] else max(self.last_seen[slot] + self.timeout_of(slot), not_before)
+            for slot in range(len(self.names)))))
@@ -0,0 +1,106 @@
+import time
+import asyncio
+import logging
+from typing import Dict
+
+from protocol import encode_relay_digests, sequence_counter
+
+# Hosts whose last heartbeat is older than this many intervals are not reported again
+# after the upstream was unreachable; if they are still alive, a newer heartbeat is.
+MAX_BACKLOG_INTERVALS = 10
+
+
+class RelayBuffer:
+    """
+    The hosts a relay heard from since its last digest, with the time of the latest
+    heartbeat of each. However many heartbeats a host sends in one interval, it is
+    reported once.
+    """
+
+    def __init__(self) -> None:
+        self.seen: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.seen)
+
+    def add(self, host_id: str, now: float = None) -> None:
+        """
+        Records a valid heartbeat of a host.
+
+        Args:
+            host_id (str): The client identity.
+            now (float, optional): When the heartbeat arrived. Defaults to the current time.
+        """
+        now = time.time() if now is None else now
+        if self.seen.get(host_id, 0.0) < now:
+            self.seen[host_id] = now
+
+    def take(self) -> Dict[str, float]:
+        """
+        Returns the hosts heard from since the previous call and starts a new interval.
+        """
+        seen, self.seen = self.seen, {}
+        return seen
+
+    def put_back(self, seen: Dict[str, float], oldest: float) -> None:
+        """
+        Returns hosts that could not be forwarded, so that they go out with the next digest.
+
+        Args:
+            seen (Dict[str, float]): The hosts returned by take.
+            oldest (float): Hosts last heard from before this time are dropped.
+        """
+        for host_id, heard in seen.items():
+            if heard >= oldest:
+                self.add(host_id, heard)
+
+
+class RelayForwarder:
+    """
+    Sends the contents of a RelayBuffer upstream as signed, compressed digests once per
+    interval over one persistent connection. Digests that cannot be delivered are merged
+    into the next interval.
+    """
+
+    def __init__(self, buffer: RelayBuffer, sender, relay_id: str, key: bytes, interval: float) -> None:
+        self.buffer = buffer
+        self.sender = sender
+        self.relay_id = relay_id.encode()
+        self.key = key
+        self.interval = interval
+        self.sequences = sequence_counter()
+
+    async def forward(self) -> bool:
+        """
+        Sends one interval's digests.
+
+        Returns:
+            bool: True if every digest was written to the upstream connection.
+        """
+        seen = self.buffer.take()
+        now = time.time()
+        hosts = ((host_id.encode(), int((now - heard) * 1000)) for host_id, heard in seen.items())
+        for digest in encode_relay_digests(self.relay_id, hosts, time.time_ns(), self.sequences, self.key):
+            if not await self.sender.send(digest):
+                self.buffer.put_back(seen, now - MAX_BACKLOG_INTERVALS * self.interval)
+                return False
+        return True
+
+    async def run(self) -> None:
+        """
+        Forwards digests every interval until cancelled.
+        """
+        logging.info(f"Relaying heartbeats upstream every {self.interval}s...")
+        loop = asyncio.get_running_loop()
+        next_run = loop.time()
+        while True:
+            next_run += self.interval
+            await asyncio.sleep(max(0.0, next_run - loop.time()))
+            count = len(self.buffer)
+            if await self.forward():
+                logging.debug(f"Relayed {count} hosts upstream.")
+            else:
+                logging.warning(f"Failed to relay {count} hosts upstream, will retry.")
+
+    def close(self) -> None:
+        self.sender.close()
@@ -0,0 +1,286 @@
+import os
+import hmac
+import time
+import zlib
+import struct
+import asyncio
+import hashlib
+import logging
+from typing import Callable, List, Optional
+
+from registry import HostRegistry
+from state import STATE_HEADER, SavedState, Settings, apply_record, encode_record
+
+# A standby server connects to the primary and sends a hello: a random nonce, the send time
+# and an HMAC of both. The primary answers with one full record of its registry and then,
+# every interval, with a record of only the hosts changed since the previous one. A record
+# is sent even when nothing changed, so that the standby can tell that the primary is
+# alive. Records are those of the state store (see state.py), compressed and signed
+# together with the nonce, so they cannot be forged or replayed into another session.
+HELLO = struct.Struct('!4s16sQ32s')
+HELLO_MAGIC = b'AVRH'
+MESSAGE_HEADER = struct.Struct('!I32s')
+MAX_MESSAGE_BYTES = 256 * 1024 * 1024
+MAX_CLOCK_SKEW_NS = 10 * 1_000_000_000
+# A standby that has not read this much of the stream yet is disconnected; it gets a
+# full record when it reconnects
+MAX_BACKLOG_BYTES = 64 * 1024 * 1024
+
+
+def encode_hello(key: bytes, nonce: bytes, timestamp_ns: int) -> bytes:
+    digest = hmac.new(key, HELLO_MAGIC + nonce + timestamp_ns.to_bytes(8, 'big'), hashlib.sha256).digest()
+    return HELLO.pack(HELLO_MAGIC, nonce, timestamp_ns, digest)
+
+
+def decode_hello(data: bytes, key: bytes, now_ns: int = None) -> bytes:
+    """
+    Checks the hello of a standby.
+
+    Args:
+        data (bytes): The hello.
+        key (bytes): The replication key.
+        now_ns (int, optional): The current time in nanoseconds. Defaults to the clock.
+
+    Returns:
+        bytes: The nonce of the session.
+
+    Raises:
+        ValueError: If the hello is malformed, forged or stale.
+    """
+    magic, nonce, timestamp_ns, digest = HELLO.unpack(data)
+    if magic != HELLO_MAGIC:
+        raise ValueError("Not a replication hello")
+    expected = encode_hello(key, nonce, timestamp_ns)[-32:]
+    if not hmac.compare_digest(digest, expected):
+        raise ValueError("Invalid replication key")
+    now_ns = time.time_ns() if now_ns is None else now_ns
+    if abs(now_ns - timestamp_ns) > MAX_CLOCK_SKEW_NS:
+        raise ValueError("Stale replication hello")
+    return nonce
+
+
+def sign_record(record: bytes, key: bytes, nonce: bytes) -> bytes:
+    body = zlib.compress(record, 1)
+    return MESSAGE_HEADER.pack(len(body), hmac.new(key, nonce + body, hashlib.sha256).digest()) + body
+
+
+class StandbyLink:
+    """
+    The replication session of one connected standby, with the names it has been sent.
+    """
+
+    def __init__(self, writer, nonce: bytes) -> None:
+        self.writer = writer
+        self.nonce = nonce
+        self.generation = 0
+        self.sent_hosts = 0
+        self.sent_groups = 0
+
+
+class ReplicationSource:
+    """
+    Runs on the primary: streams the registry and server settings to connected standbys,
+    first in full and then as deltas of the changed hosts every interval. Encoding happens
+    on the event loop, which owns the registry.
+    """
+
+    def __init__(self, registry: HostRegistry, settings: Callable[[], Settings], key: bytes, interval: float) -> None:
+        """
+        Args:
+            registry (HostRegistry): The registry to replicate.
+            settings (Callable[[], Settings]): Returns the current server-wide settings.
+            key (bytes): The replication key shared with the standbys.
+            interval (float): Seconds between deltas.
+        """
+        self.registry = registry
+        self.settings = settings
+        self.key = key
+        self.interval = interval
+        # Replication takes the registry's changes apart from the state store
+        self.consumer = registry.track_changes()
+        self.links: List[StandbyLink] = []
+
+    async def handle(self, reader, writer) -> None:
+        """
+        Serves one standby until it disconnects. Used as the connection callback of the
+        replication listener.
+        """
+        address = writer.get_extra_info('peername')
+        try:
+            nonce = decode_hello(await asyncio.wait_for(reader.readexactly(HELLO.size), self.interval + 5),
+                                 self.key)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError) as e:
+            logging.warning(f"Rejected replication connection from {address}: {e!r}")
+            writer.close()
+            return
+        link = StandbyLink(writer, nonce)
+        self.send(link, list(range(len(self.registry.names))))
+        self.links.append(link)
+        logging.info(f"Standby {address} connected, sent {len(self.registry)} hosts.")
+        try:
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            if link in self.links:
+                self.links.remove(link)
+            writer.close()
+        logging.warning(f"Standby {address} disconnected.")
+
+    def send(self, link: StandbyLink, slots: List[int]) -> None:
+        """
+        Sends the given slots to a standby, with the names it has not been sent yet.
+        """
+        link.generation += 1
+        record = encode_record(self.registry, self.settings(), link.generation, slots, link.sent_hosts,
+                               link.sent_groups)
+        link.sent_hosts = len(self.registry.names)
+        link.sent_groups = len(self.registry.group_names)
+        link.writer.write(sign_record(record, self.key, link.nonce))
+
+    def tick(self) -> None:
+        """
+        Sends the hosts changed since the previous tick to every standby.
+        """
+        # Taken even without standbys, which get everything in full when they connect
+        changed = self.registry.take_changes(self.consumer)
+        if not self.links:
+            return
+        for link in list(self.links):
+            if link.writer.transport.get_write_buffer_size() > MAX_BACKLOG_BYTES:
+                logging.warning("Standby is not keeping up with replication, disconnecting it.")
+                self.links.remove(link)
+                link.writer.transport.abort()
+                continue
+            self.send(link, changed)
+
+    async def run(self) -> None:
+        """
+        Sends deltas every interval until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            self.tick()
+
+    def close(self) -> None:
+        for link in self.links:
+            link.writer.close()
+        self.links = []
+
+
+class ReplicaFollower:
+    """
+    Runs on a standby: keeps a copy of the primary's state from the replication stream,
+    reconnecting when the connection is lost, until the primary has been silent for
+    `timeout` seconds.
+    """
+
+    def __init__(self, host: str, port: int, key: bytes, timeout: float) -> None:
+        self.host = host
+        self.port = port
+        self.key = key
+        self.timeout = timeout
+        self.state: Optional[SavedState] = None
+        self.heard = 0.0
+
+    def silence(self) -> float:
+        return time.monotonic() - self.heard
+
+    async def follow(self) -> Optional[SavedState]:
+        """
+        Follows the primary until it goes silent.
+
+        Returns:
+            Optional[SavedState]: The last state received, or None if none was.
+        """
+        self.heard = time.monotonic()
+        while self.silence() < self.timeout:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout - self.silence())
+            except (OSError, asyncio.TimeoutError) as e:
+                logging.debug(f"Cannot reach the primary at {self.host}:{self.port}: {e!r}")
+                await asyncio.sleep(max(0.0, min(1.0, self.timeout - self.silence())))
+                continue
+            try:
+                await self.receive(reader, writer)
+            except (OSError, asyncio.IncompleteReadError, ValueError, zlib.error) as e:
+                logging.warning(f"Replication from {self.host}:{self.port} broken: {e!r}")
+            finally:
+                writer.close()
+            await asyncio.sleep(max(0.0, min(1.0, self.timeout - self.silence())))
+        return self.state
+
+    async def probe(self) -> bool:
+        """
+        Checks whether the primary serves replication: connects, sends a hello and waits
+        up to `timeout` seconds for the first record.
+
+        Returns:
+            bool: True if a valid record was received.
+        """
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        try:
+            nonce = await self.send_hello(writer)
+            await self.read_record(reader, nonce, self.timeout)
+            return True
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError, zlib.error) as e:
+            logging.debug(f"No replication from {self.host}:{self.port}: {e!r}")
+            return False
+        finally:
+            writer.close()
+
+    async def send_hello(self, writer) -> bytes:
+        """
+        Starts a session with a fresh nonce and returns the nonce.
+        """
+        nonce = os.urandom(16)
+        writer.write(encode_hello(self.key, nonce, time.time_ns()))
+        await writer.drain()
+        return nonce
+
+    async def read_record(self, reader, nonce: bytes, timeout: float) -> bytes:
+        """
+        Reads and checks the next record of a session.
+
+        Args:
+            reader (StreamReader): The replication connection.
+            nonce (bytes): The nonce of the session.
+            timeout (float): Seconds to wait for the record to start.
+
+        Returns:
+            bytes: The decompressed record.
+
+        Raises:
+            asyncio.TimeoutError: If no record started within `timeout`.
+            ValueError: If the record is too large or not signed for this session.
+        """
+        header = await asyncio.wait_for(reader.readexactly(MESSAGE_HEADER.size), timeout)
+        length, digest = MESSAGE_HEADER.unpack(header)
+        if length > MAX_MESSAGE_BYTES:
+            raise ValueError(f"Replication record of {length} bytes is too large")
+        body = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+        if not hmac.compare_digest(digest, hmac.new(self.key, nonce + body, hashlib.sha256).digest()):
+            raise ValueError("Invalid replication record signature")
+        return zlib.decompress(body)
+
+    async def receive(self, reader, writer) -> None:
+        """
+        Receives records on one connection until it breaks or the primary goes silent.
+        """
+        nonce = await self.send_hello(writer)
+        generation = 0
+        while True:
+            try:
+                record = await self.read_record(reader, nonce, max(0.0, self.timeout - self.silence()))
+            except asyncio.TimeoutError:
+                return
+            generation += 1
+            if STATE_HEADER.unpack_from(record)[1] != generation:
+                raise ValueError("Replication record out of order")
+            # A new session starts with a full record, which replaces the previous state
+            self.state, _ = apply_record(self.state if generation > 1 else None, record)
+            self.heard = time.monotonic()
@@ -1,42 +1,197 @@
 import os
+import sys
 import hmac
-import hashlib
+import json
 import logging
 import time
+import signal
+import threading
+import socket
+import ssl
 import asyncio
+import argparse
+import multiprocessing
 from datetime import timedelta
-from pushbullet import Pushbullet
-from telegram import Update, Bot
-from telegram.ext import Application, CommandHandler, ContextTypes
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from dotenv import load_dotenv
-
-# Load configuration settings from .env
+from registry import HostRegistry
+from phi import PhiAccrualDetector
+from admission import ConnectionLimiter, SourceLimiter
+from state import SavedState, Settings, StateStore
+from history import HistoryStore
+from auth import Keyring, ReplayGuard
+from notifications import NotificationDispatcher, load_channel
+from alerts import AlertAggregator, alert_group_of
+from logtail import EventRing, tail_lines
+from logsetup import LogSampler, configure_logging, configure_worker_logging, forward_worker_logs
+from metrics import registry as metrics_registry, probe_event_loop_lag
+from httpd import HttpResponse, start_http_server
+from cluster import EXPIRE, GAUGES, HEARTBEAT, RELAYED, TLS_HANDSHAKE, UpdateBatcher, decode_updates, encode_update, receive_updates, \
+    reuseport_socket, signal_workers, start_workers
+from protocol import BINARY_V1, BINARY_V2, FRAME_HEADER, GAUGE_NAMES, MAX_HOST_ID_SIZE, RELAY_DIGEST_V1, \
+    STREAM_MARKER, TEXT_MARKER, decode_binary_heartbeat, decode_gauges, decode_relay_digest, expand_relay_digest, \
+    read_frame
+from relay import RelayBuffer, RelayForwarder
+from agent import ReconnectBackoff, StreamSender
+from tls import create_client_context, create_server_context
+from replication import ReplicaFollower, ReplicationSource
+from loopwatch import LoopWatchdog, Stall, format_profile, sample_stacks, summarize_profile
+from telemetry import TelemetryStore, format_gauge, parse_limits
+
+if TYPE_CHECKING:
+    # The Telegram library is only imported when the bot is started
+    from telegram import Update
+    from telegram.ext import ContextTypes
+
+# Load configuration settings from .env. Required settings are checked when the server
+# starts, so that the module can be imported without them.
 load_dotenv()
+REQUIRED_SETTINGS = ('SERVER_PORT', 'OFFLINE_THRESHOLD', 'SECRET_KEY')
 server_ip = os.getenv('SERVER_IP')
-server_port = int(os.getenv('SERVER_PORT'))
-offline_threshold = int(os.getenv('OFFLINE_THRESHOLD'))
-secret_key = os.getenv('SECRET_KEY').encode()
+server_port = int(os.getenv('SERVER_PORT') or 0)
+offline_threshold = int(os.getenv('OFFLINE_THRESHOLD') or 60)
+secret_key = (os.getenv('SECRET_KEY') or '').encode()
+keyring_file = os.getenv('KEYRING_FILE')
 pushbullet_use = os.getenv('PUSHBULLET_NOTIFICATION')
 pushbullet_api_key = os.getenv('PUSHBULLET_API_KEY')
 telegram_bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
 telegram_id_to_notify = os.getenv('TELEGRAM_ID_TO_NOTIFY')
-
-# Set up basic logging configuration
-logging.basicConfig(filename='server_log.txt',
-                    level=logging.INFO, format='%(asctime)s - %(message)s')
-logging.getLogger('httpx').setLevel(
-    logging.WARNING)  # To avoid clutter in logs
-
-# Initialize variables for tracking heartbeats and system status
-last_heartbeat_time = time.time()
-offline = False
-failed_heartbeat_time = time.time()
+telegram_api_url = os.getenv('TELEGRAM_API_URL')
+telegram_mode = os.getenv('TELEGRAM_MODE', 'polling')
+telegram_webhook_url = os.getenv('TELEGRAM_WEBHOOK_URL')
+telegram_webhook_host = os.getenv('TELEGRAM_WEBHOOK_HOST', '127.0.0.1')
+telegram_webhook_port = int(os.getenv('TELEGRAM_WEBHOOK_PORT') or 8443)
+telegram_webhook_path = os.getenv('TELEGRAM_WEBHOOK_PATH', '/telegram')
+telegram_webhook_secret = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+notification_channels = os.getenv('NOTIFICATION_CHANNELS')
+default_host_id = os.getenv('DEFAULT_HOST_ID', 'Hawkeye')
+stream_close_grace = float(os.getenv('STREAM_CLOSE_GRACE', 5))
+udp_port = int(os.getenv('UDP_PORT') or 0)
+alert_window = float(os.getenv('ALERT_WINDOW', 10))
+alert_group_by = os.getenv('ALERT_GROUP_BY', 'tag')
+notify_rate_per_minute = float(os.getenv('NOTIFY_RATE_PER_MINUTE') or 0)
+log_mode = os.getenv('LOG_MODE', 'async')
+# 0 disables size rotation, so only an unset or empty LOG_MAX_BYTES gets the default
+log_max_bytes = os.getenv('LOG_MAX_BYTES')
+log_max_bytes = 10 * 1024 * 1024 if log_max_bytes is None or not log_max_bytes.strip() else int(log_max_bytes)
+log_backup_count = int(os.getenv('LOG_BACKUP_COUNT') or 5)
+log_rotate_when = os.getenv('LOG_ROTATE_WHEN')
+log_sample_interval = float(os.getenv('LOG_SAMPLE_INTERVAL', 60))
+metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+metrics_port = int(os.getenv('METRICS_PORT') or 0)
+server_workers = int(os.getenv('SERVER_WORKERS') or 0)
+phi_threshold = float(os.getenv('PHI_THRESHOLD') or 0)
+phi_window = int(os.getenv('PHI_WINDOW') or 100)
+phi_min_std = float(os.getenv('PHI_MIN_STD') or 1.0)
+state_dir = os.getenv('STATE_DIR')
+state_interval = float(os.getenv('STATE_INTERVAL') or 10)
+history_dir = os.getenv('HISTORY_DIR')
+history_interval = float(os.getenv('HISTORY_INTERVAL') or 10)
+max_connections = int(os.getenv('MAX_CONNECTIONS') or 10000)
+admission_wait = float(os.getenv('ADMISSION_WAIT') or 1.0)
+read_timeout = float(os.getenv('READ_TIMEOUT') or 5.0)
+connection_timeout = float(os.getenv('CONNECTION_TIMEOUT') or 10.0)
+source_rate = float(os.getenv('SOURCE_RATE') or 0)
+source_burst = float(os.getenv('SOURCE_BURST') or max(1.0, 2 * source_rate))
+relay_upstream = os.getenv('RELAY_UPSTREAM')
+relay_id = os.getenv('RELAY_ID') or os.getenv('HOST_ID') or socket.gethostname()
+relay_interval = float(os.getenv('RELAY_INTERVAL') or 5)
+relay_key = (os.getenv('RELAY_KEY') or '').encode() or secret_key
+trusted_relays = frozenset(filter(None, (relay.strip() for relay in os.getenv('RELAY_IDS', '').split(','))))
+relay_tls = os.getenv('RELAY_TLS')
+tls_ca_file = os.getenv('TLS_CA_FILE')
+tls_cert_file = os.getenv('TLS_CERT_FILE')
+tls_key_file = os.getenv('TLS_KEY_FILE')
+instrument = bool(os.getenv('INSTRUMENT'))
+replication_port = int(os.getenv('REPLICATION_PORT') or 0)
+replication_primary = os.getenv('REPLICATION_PRIMARY')
+replication_key = (os.getenv('REPLICATION_KEY') or '').encode() or secret_key
+replication_interval = float(os.getenv('REPLICATION_INTERVAL') or 1)
+replication_timeout = float(os.getenv('REPLICATION_TIMEOUT') or 5)
+replication_cold_takeover = bool(os.getenv('REPLICATION_COLD_TAKEOVER'))
+slow_callback_threshold = float(os.getenv('SLOW_CALLBACK_THRESHOLD') or 0.1)
+profile_seconds = float(os.getenv('PROFILE_SECONDS') or 10)
+profile_top = int(os.getenv('PROFILE_TOP') or 15)
+telemetry_buckets = int(os.getenv('TELEMETRY_BUCKETS') or 12)
+telemetry_bucket_seconds = int(os.getenv('TELEMETRY_BUCKET_SECONDS') or 300)
+telemetry_alerts = os.getenv('TELEMETRY_ALERTS', '')
+
+LOG_FILE = 'server_log.txt'
+EVENT_RING_SIZE = 1000
+
+# Initialize the registry of monitored hosts and the notification settings
+registry = HostRegistry(offline_threshold,
+                        PhiAccrualDetector(phi_threshold, phi_window, min_std=phi_min_std) if phi_threshold else None)
+keyring = Keyring(secret_key)
+replay_guard = ReplayGuard()
+watchdog_wakeup = asyncio.Event()
+notifier = None
+telegram_application = None
+log_listener = None
+headless = False
+worker_connections = []
+state_store = StateStore(state_dir) if state_dir else None
+history_store = HistoryStore(history_dir) if history_dir else None
+update_sink = None
+events = EventRing(EVENT_RING_SIZE)
+connection_log_sampler = LogSampler(log_sample_interval)
+throttle_log_sampler = LogSampler(log_sample_interval)
+connection_limiter = ConnectionLimiter(max_connections, admission_wait)
+source_limiter = SourceLimiter(source_rate, source_burst) if source_rate else None
+relay_buffer = RelayBuffer() if relay_upstream else None
+tls_context = None
+loop_watchdog = None
+profile_lock = asyncio.Lock()
+signal_profile = None
+replication_source = None
+# The latest state and history writes, which keep running on their worker thread when the
+# saver that started them is cancelled
+state_write = None
+history_write = None
+telemetry_store = TelemetryStore(telemetry_buckets, telemetry_bucket_seconds)
+heartbeat_log_sampler = LogSampler(log_sample_interval)
+
+# Metrics exposed on the optional /metrics endpoint
+HEARTBEATS = metrics_registry.counter(
+    'avanguard_heartbeats_total', 'Heartbeats received, by validation result.', ['result'])
+VALIDATION_SECONDS = metrics_registry.histogram(
+    'avanguard_heartbeat_validation_seconds', 'Time spent validating one heartbeat.')
+HANDLING_SECONDS = metrics_registry.histogram(
+    'avanguard_heartbeat_handling_seconds', 'Time spent validating and recording one heartbeat.')
+OPEN_CONNECTIONS = metrics_registry.gauge(
+    'avanguard_open_connections', 'Heartbeat TCP connections currently open.')
+REFUSED_CONNECTIONS = metrics_registry.counter(
+    'avanguard_refused_connections_total', 'Heartbeat TCP connections refused, by reason.', ['reason'])
+HOSTS = metrics_registry.gauge(
+    'avanguard_hosts', 'Monitored hosts, by state.', ['state'],
+    callback=lambda: {('online',): len(registry) - registry.offline_count(), ('offline',): registry.offline_count()})
+TLS_HANDSHAKES = metrics_registry.counter(
+    'avanguard_tls_handshakes_total', 'Completed TLS handshakes, by whether the session was resumed.', ['session'])
+TLS_RESUMPTION_RATIO = metrics_registry.gauge(
+    'avanguard_tls_resumption_ratio', 'Share of TLS handshakes that resumed a session.',
+    callback=lambda: {(): tls_resumption_ratio(TLS_HANDSHAKES.values)})
+SLOW_CALLBACKS = metrics_registry.counter(
+    'avanguard_slow_callbacks_total', 'Callbacks that blocked the event loop for longer than SLOW_CALLBACK_THRESHOLD.')
+REPLICATION_STANDBYS = metrics_registry.gauge(
+    'avanguard_replication_standbys', 'Standby servers receiving the replication stream.',
+    callback=lambda: {(): len(replication_source.links) if replication_source else 0})
+NOTIFICATION_QUEUE_DEPTH = metrics_registry.gauge(
+    'avanguard_notification_queue_depth', 'Notifications waiting to be sent, by channel.', ['channel'],
+    callback=lambda: {(name,): queue.qsize() for name, queue in notifier.queues.items()} if notifier else {})
 TIME_LIMIT = 10
+TIME_LIMIT_NS = TIME_LIMIT * 1_000_000_000
+STATUS_LIST_LIMIT = 20
+UDP_BATCH_SIZE = 256
+UDP_MAX_DATAGRAM = 2048
+UDP_RECEIVE_BUFFER = 4 * 1024 * 1024
+TELEGRAM_MESSAGE_LIMIT = 4096
+# How long a standby that steps down waits for its notification to be delivered
+STEP_DOWN_NOTIFY_WAIT = 10
 snooze_start_time = None
 snooze_duration = 0
 
 
-async def try_notify_channels(title: str, body: str) -> None:
+def try_notify_channels(title: str, body: str) -> None:
     """
     Sends a notification via Pushbullet and/or Telegram depending on snooze settings.
 
@@ -47,23 +202,65 @@ async def try_notify_channels(title: str, body: str) -> None:
     if is_notification_allowed():
         notify_channels(title, body)
         logging.warning(f'Sent notification: "{title} {body}"')
+        events.record('notify', f'Sent notification: "{title} {body}"')
     else:
         logging.info(f'Notification "{title} {body}" snoozed, not sent.')
+        events.record('notify', f'Notification "{title} {body}" snoozed, not sent.')
+
 
+alert_aggregator = AlertAggregator(try_notify_channels, alert_window)
 
-async def notify_channels(title: str, body: str) -> None:
+
+def notify_channels(title: str, body: str) -> None:
     """
-    Sends a notification via Pushbullet and/or Telegram.
+    Queues a notification for delivery via Pushbullet and/or Telegram. Delivery happens in
+    the background, so this never waits for the notification services.
 
     Args:
     title (str): The title of the notification message.
     body (str): The body of the notification message.
     """
+    if notifier is None:
+        logging.error(f'Notification system not started, dropped "{title} {body}"')
+        return
+    notifier.submit(title, body)
+
 
+def enabled_channels() -> List[str]:
+    """
+    Returns the names of the notification channels to use: NOTIFICATION_CHANNELS if set,
+    otherwise every built-in channel that is configured. None in headless mode.
+    """
+    if headless:
+        return []
+    if notification_channels is not None:
+        return [name.strip() for name in notification_channels.split(',') if name.strip()]
+    names = []
+    if telegram_bot_token and telegram_id_to_notify:
+        names.append('telegram')
     if pushbullet_use:
-        send_pushbullet_notification(title, body)
-    await send_telegram_notification(f'{title} {body}')
-    logging.warning(f'Sent notification: "{title} {body}"')
+        names.append('pushbullet')
+    return names
+
+
+def create_notifier() -> NotificationDispatcher:
+    """
+    Creates the notification dispatcher with a channel for every enabled service. Each
+    channel plugin is imported here, so disabled services cost nothing at startup.
+
+    Returns:
+        NotificationDispatcher: The dispatcher, not yet started.
+    """
+    channels = []
+    for name in enabled_channels():
+        try:
+            channels.append(load_channel(name, os.environ))
+        except (ImportError, ValueError) as e:
+            logging.error(f"Notification channel {name} is not available: {e}")
+    if notify_rate_per_minute:
+        for channel in channels:
+            channel.rate = notify_rate_per_minute / 60
+    return NotificationDispatcher(channels)
 
 
 def is_heartbeat_valid(data: bytes) -> bool:
@@ -76,44 +273,221 @@ def is_heartbeat_valid(data: bytes) -> bool:
     Returns:
     bool: True if the heartbeat is valid, False otherwise.
     """
-    try:
-        # Split the message into components
-        _, timestamp, received_hmac = data.decode().split(":")
+    return validate_heartbeat(data) is not None
 
-        # Recreate the message for HMAC validation
-        message = f'heartbeat:{timestamp}'.encode()
-        calculated_hmac = hmac.new(
-            secret_key, message, hashlib.sha256).hexdigest()
 
-        # Verify HMAC authenticity
-        if not hmac.compare_digest(calculated_hmac, received_hmac):
-            logging.warning("Failed HMAC validation")
-            return False
+def validate_heartbeat(data: bytes) -> Optional[str]:
+    """
+    Validates the HMAC, timestamp and sequence number of the received heartbeat and extracts
+    the client identity.
 
-        # Verify that the timestamp is within the allowed time limit
-        current_time = time.time()
-        time_difference = current_time - float(timestamp)
-        if time_difference < TIME_LIMIT:
-            return True
-        else:
-            logging.warning(
-                "Failed timestamp validation - time difference too large."
-            )
-            return False
+    Args:
+    data (bytes): The data received from the heartbeat which includes timestamp and HMAC.
+
+    Returns:
+    Optional[str]: The host identity if the heartbeat is valid, None otherwise.
+    """
+    authenticated = authenticate_heartbeat(data)
+    if authenticated is None or not is_sequence_fresh(authenticated[0], authenticated[1]):
+        return None
+    return authenticated[0]
+
+
+def authenticate_heartbeat(data: bytes) -> Optional[Tuple[str, int, bytes]]:
+    """
+    Validates the HMAC and timestamp of the received heartbeat. Replays are not checked
+    here, so that workers can authenticate heartbeats without shared state.
+    The wire format is chosen by the first byte of the message.
+
+    Args:
+    data (bytes): The data received from the heartbeat which includes timestamp and HMAC.
+
+    Returns:
+    Optional[Tuple[str, int, bytes]]: The host identity, sequence number and encoded gauges
+    if the heartbeat is authentic, None otherwise.
+    """
+    try:
+        if data[0] in (BINARY_V1, BINARY_V2):
+            return validate_binary_heartbeat(data)
+        if data[0] == TEXT_MARKER:
+            return validate_text_heartbeat(data)
+        raise ValueError(f"Unknown heartbeat format 0x{data[0]:02x}")
     except ValueError as ve:
         logging.error(
-            f"ValueError in validate_heartbeat: {ve} - Data received: {data}"
+            f"ValueError in authenticate_heartbeat: {ve} - Data received: {data}"
         )
-        return False
+        events.record('invalid', f"Malformed heartbeat: {ve}")
+        HEARTBEATS.inc(labels=('malformed',))
+        return None
     except TypeError as te:
         logging.error(
-            f"TypeError in validate_heartbeat: {te} - Data received: {data}"
+            f"TypeError in authenticate_heartbeat: {te} - Data received: {data}"
         )
-        return False
+        events.record('invalid', f"Malformed heartbeat: {te}")
+        HEARTBEATS.inc(labels=('malformed',))
+        return None
     except Exception as e:
-        logging.error(f"Unexpected error in validate_heartbeat: {e}"
+        logging.error(f"Unexpected error in authenticate_heartbeat: {e}"
                       f"- Data received: {data}")
+        events.record('invalid', f"Malformed heartbeat: {e}")
+        HEARTBEATS.inc(labels=('malformed',))
+        return None
+
+
+def validate_text_heartbeat(data: bytes) -> Optional[Tuple[str, int, bytes]]:
+    """
+    Authenticates a text heartbeat of the form `heartbeat:<host_id>:<timestamp>:<hmac>`. The legacy
+    form `heartbeat:<timestamp>:<hmac>` is still accepted and is attributed to the default host.
+
+    Args:
+    data (bytes): The text heartbeat message.
+
+    Returns:
+    Optional[Tuple[str, int, bytes]]: The host identity, sequence number and encoded gauges,
+    always empty for text heartbeats, if the heartbeat is authentic, None otherwise.
+
+    Raises:
+    ValueError: If the message is malformed or its host id is longer than MAX_HOST_ID_SIZE bytes.
+    """
+    # Split the message into components
+    parts = data.decode().split(":")
+    if len(parts) == 4:
+        _, host_id, timestamp, received_hmac = parts
+        message = f'heartbeat:{host_id}:{timestamp}'.encode()
+    else:
+        _, timestamp, received_hmac = parts
+        host_id = default_host_id
+        message = f'heartbeat:{timestamp}'.encode()
+    # The same limit as binary heartbeats, which also bounds the host id forwarded by workers
+    if len(host_id.encode()) > MAX_HOST_ID_SIZE:
+        raise ValueError(f"Host id longer than {MAX_HOST_ID_SIZE} bytes")
+
+    # Verify HMAC authenticity against the keys of the host
+    if not keyring.verify(host_id, message, bytes.fromhex(received_hmac)):
+        logging.warning("Failed HMAC validation")
+        events.record('invalid', f"Failed HMAC validation for {host_id}", host_id)
+        HEARTBEATS.inc(labels=('invalid_hmac',))
+        return None
+
+    # Verify that the timestamp is within the allowed time limit
+    if not is_timestamp_current(time.time_ns() - int(float(timestamp) * 1_000_000_000), host_id,
+                                f"heartbeat from {host_id}"):
+        return None
+
+    # Text heartbeats have no sequence number; their timestamp in microseconds stands in for it
+    return host_id, int(float(timestamp) * 1_000_000), b''
+
+
+def validate_binary_heartbeat(data: bytes) -> Optional[Tuple[str, int, bytes]]:
+    """
+    Authenticates a binary heartbeat. The message is parsed in place with a precompiled struct;
+    only the host id and the gauges are copied out of it.
+
+    Args:
+    data (bytes): The binary heartbeat message.
+
+    Returns:
+    Optional[Tuple[str, int, bytes]]: The host identity, sequence number and encoded gauges
+    if the heartbeat is authentic, None otherwise.
+    """
+    heartbeat = decode_binary_heartbeat(data)
+    host_id = heartbeat.host_id.decode() if heartbeat.host_id else default_host_id
+
+    # Verify HMAC authenticity against the keys of the host
+    if not keyring.verify(host_id, heartbeat.signed, heartbeat.digest):
+        logging.warning("Failed HMAC validation")
+        events.record('invalid', f"Failed HMAC validation for {host_id}", host_id)
+        HEARTBEATS.inc(labels=('invalid_hmac',))
+        return None
+
+    # Verify that the timestamp is within the allowed time limit
+    if not is_timestamp_current(time.time_ns() - heartbeat.timestamp_ns, host_id, f"heartbeat from {host_id}"):
+        return None
+    return host_id, heartbeat.sequence, heartbeat.gauges
+
+
+def is_timestamp_current(age_ns: int, host_id: str, subject: str) -> bool:
+    """
+    Checks the send time of an authenticated message against TIME_LIMIT, in both directions.
+    A message dated in the future would move the replay window of its host ahead of the
+    messages that follow it, and its sequence number could overflow the window.
+
+    Args:
+    age_ns (int): Nanoseconds between the send time of the message and now.
+    host_id (str): The client identity.
+    subject (str): What the message is, for the event log, e.g. "heartbeat from alpha".
+
+    Returns:
+    bool: True if the message was sent within TIME_LIMIT of now, False otherwise.
+    """
+    if age_ns >= TIME_LIMIT_NS:
+        logging.warning("Failed timestamp validation - time difference too large.")
+        events.record('invalid', f"Stale {subject}", host_id)
+        HEARTBEATS.inc(labels=('stale',))
+        return False
+    if age_ns <= -TIME_LIMIT_NS:
+        logging.warning("Failed timestamp validation - timestamp ahead of the server clock.")
+        events.record('invalid', f"Future-dated {subject}", host_id)
+        HEARTBEATS.inc(labels=('future',))
         return False
+    return True
+
+
+def is_sequence_fresh(host_id: str, sequence: int) -> bool:
+    """
+    Checks an authenticated heartbeat against the replay window of its host.
+
+    Args:
+    host_id (str): The client identity.
+    sequence (int): The sequence number of the heartbeat.
+
+    Returns:
+    bool: True if the heartbeat was not seen before, False if it is a replay.
+    """
+    if not replay_guard.accept(host_id, sequence):
+        logging.warning(f"Rejected replayed heartbeat from {host_id}")
+        events.record('invalid', f"Rejected replayed heartbeat from {host_id}", host_id)
+        HEARTBEATS.inc(labels=('replayed',))
+        return False
+    return True
+
+
+def authenticate_relay_digest(data: bytes) -> Optional[Tuple[str, int, List[Tuple[str, int]]]]:
+    """
+    Validates the HMAC and timestamp of a digest sent by an edge relay and unpacks the hosts
+    it reports. Only the identities listed in RELAY_IDS may send digests, as a relay vouches
+    for other hosts. The digest is signed with the key of the relay, which is checked like
+    the key of any other host; replays are not checked here.
+
+    Args:
+    data (bytes): The relay digest.
+
+    Returns:
+    Optional[Tuple[str, int, List[Tuple[str, int]]]]: The relay identity, the sequence number
+    and the reported hosts with the milliseconds since the relay last heard from each, if the
+    digest is authentic, None otherwise.
+    """
+    try:
+        digest = decode_relay_digest(data)
+        relay = digest.relay_id.decode()
+        if relay not in trusted_relays:
+            logging.warning(f"Rejected digest from {relay}, which is not listed in RELAY_IDS")
+            events.record('invalid', f"Rejected digest from {relay}, which is not a trusted relay", relay)
+            HEARTBEATS.inc(labels=('untrusted_relay',))
+            return None
+        if not keyring.verify(relay, digest.signed, digest.digest):
+            logging.warning("Failed HMAC validation")
+            events.record('invalid', f"Failed HMAC validation for relay {relay}", relay)
+            HEARTBEATS.inc(labels=('invalid_hmac',))
+            return None
+        if not is_timestamp_current(time.time_ns() - digest.timestamp_ns, relay, f"digest from relay {relay}"):
+            return None
+        return relay, digest.sequence, expand_relay_digest(digest)
+    except ValueError as ve:
+        logging.error(f"ValueError in authenticate_relay_digest: {ve}")
+        events.record('invalid', f"Malformed relay digest: {ve}")
+        HEARTBEATS.inc(labels=('malformed',))
+        return None
 
 
 async def run_heartbeat_server() -> None:
@@ -121,127 +495,647 @@ async def run_heartbeat_server() -> None:
     Starts the server that listens for heartbeat messages on a specified port.
     """
     server = await asyncio.start_server(process_heartbeat_from_client, server_ip, server_port)
-    logging.info("Server started and is listening for heartbeats...")
+    logging.info("Server started and is listening for heartbeats" + (" over TLS..." if tls_context else "..."))
+    if udp_port:
+        await start_datagram_listener(server_ip, udp_port)
     async with server:
         await server.serve_forever()
 
 
+class HeartbeatDatagramProtocol(asyncio.DatagramProtocol):
+    """
+    Receives heartbeats sent as single UDP datagrams.
+
+    When the event loop reports the socket readable, all datagrams already queued on it
+    are drained in one batch, up to UDP_BATCH_SIZE, instead of one per loop iteration.
+    """
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+
+    def datagram_received(self, data: bytes, address) -> None:
+        batch = [(data, address)]
+        try:
+            while len(batch) < UDP_BATCH_SIZE:
+                batch.append(self.sock.recvfrom(UDP_MAX_DATAGRAM))
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            logging.warning(f"Error draining heartbeat datagrams: {e}")
+
+        for data, address in batch:
+            if is_source_allowed(address):
+                accept_heartbeat(data, address)
+
+    def error_received(self, exc: Exception) -> None:
+        logging.warning(f"Heartbeat datagram listener error: {exc}")
+
+
+async def start_datagram_listener(host: str, port: int, reuse_port: bool = False) -> asyncio.DatagramTransport:
+    """
+    Starts listening for heartbeat datagrams on a UDP port.
+
+    Args:
+        host (str): The address to bind, or None for all interfaces.
+        port (int): The UDP port to bind.
+        reuse_port (bool, optional): Bind with SO_REUSEPORT so that several workers share the port.
+
+    Returns:
+        asyncio.DatagramTransport: The transport of the listener.
+    """
+    family, kind, proto, _, address = socket.getaddrinfo(
+        host, port, type=socket.SOCK_DGRAM, flags=socket.AI_PASSIVE)[0]
+    if reuse_port:
+        sock = reuseport_socket(host, port, socket.SOCK_DGRAM)
+    else:
+        sock = socket.socket(family, kind, proto)
+        sock.setblocking(False)
+        sock.bind(address)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER)
+
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(lambda: HeartbeatDatagramProtocol(sock), sock=sock)
+    logging.info(f"Listening for heartbeat datagrams on UDP port {port}...")
+    return transport
+
+
 async def process_heartbeat_from_client(reader, writer) -> None:
     """
     Handles incoming connections and processes data from clients to validate heartbeats.
 
+    A connection either carries a single heartbeat and is closed by the client, or, if it
+    starts with a zero byte, is a persistent stream of length-prefixed heartbeat frames.
+
+    Connections are admitted by the connection limiter and the per-source rate limit
+    first. With TLS, the handshake only starts once the connection is admitted, so the
+    limits also bound the handshakes, the costliest step. A single-heartbeat connection
+    must complete the handshake and deliver its heartbeat within CONNECTION_TIMEOUT, and
+    every read within READ_TIMEOUT.
+
     Args:
         reader (StreamReader): The stream reader object to read data from the client.
         writer (StreamWriter): The stream writer object to send data to the client.
     """
-    global last_heartbeat_time, offline, failed_heartbeat_time
-
     address = writer.get_extra_info('peername')
-    logging.warning(f"Connection from {address}.")
-
-    data = await reader.read(1024)
-    if data and is_heartbeat_valid(data):
-        logging.info(f"Valid heartbeat received from IP: {address}")
-
-        # Update last heartbeat time and check elapsed time since last valid heartbeat
-        elapsed_time = time.time() - last_heartbeat_time
-        last_heartbeat_time = time.time()
-
-        # If the system was offline and is now back online, calculate downtime
-        if elapsed_time >= offline_threshold and offline:
-            offline = False
-            temp_time = time.time() - failed_heartbeat_time
-            downtime = str(timedelta(seconds=temp_time)).split(".")[0]
-
-            # Notify depending on the length of the downtime
-            if temp_time < 300:
-                logging.info(
-                    f"Hawkeye back up after {downtime}. Possible short outage."
-                )
-                await try_notify_channels("Hawkeye is up!", f"Possible short power outage. Time taken {downtime}.")
-            else:
-                logging.info(f"Hawkeye back up after {downtime}.")
-                await try_notify_channels("Hawkeye is up!", f"Hawkeye back online after {downtime}.")
+    if not await connection_limiter.acquire():
+        REFUSED_CONNECTIONS.inc(labels=('limit',))
+        writer.transport.abort()
+        return
+    OPEN_CONNECTIONS.inc()
+    try:
+        if not is_source_allowed(address):
+            REFUSED_CONNECTIONS.inc(labels=('rate',))
+            writer.transport.abort()
+            return
+        skipped = connection_log_sampler.sample(address[0] if address else None)
+        if skipped is not None:
+            logging.warning(f"Connection from {address}." + (f" ({skipped} more not logged)" if skipped else ""))
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + connection_timeout
+        if tls_context is not None:
+            try:
+                await writer.start_tls(tls_context, ssl_handshake_timeout=connection_timeout)
+            except (ConnectionError, ssl.SSLError) as e:
+                logging.info(f"TLS handshake with {address} failed: {e}")
+                writer.transport.abort()
+                return
+            count_tls_handshake(writer.get_extra_info('ssl_object'))
+        try:
+            data = await asyncio.wait_for(reader.read(1), min(read_timeout, deadline - loop.time()))
+            if data == STREAM_MARKER:
+                enable_keepalive(writer.get_extra_info('socket'))
+                await process_heartbeat_stream(reader, address, data)
+            elif data:
+                data += await asyncio.wait_for(reader.read(1023), min(read_timeout, deadline - loop.time()))
+                accept_heartbeat(data, address)
+        except asyncio.TimeoutError:
+            REFUSED_CONNECTIONS.inc(labels=('timeout',))
+            logging.info(f"Connection from {address} timed out before sending a heartbeat.")
+        except ConnectionError:
+            pass
+
+        writer.close()
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
+    finally:
+        OPEN_CONNECTIONS.dec()
+        connection_limiter.release()
+
+
+def count_tls_handshake(ssl_object: ssl.SSLObject) -> None:
+    """
+    Counts a completed TLS handshake of an admitted connection, in the main process's
+    metrics, which also log the hit rate.
 
-    writer.close()
-    await writer.wait_closed()
+    Args:
+        ssl_object (ssl.SSLObject): The TLS state of the connection.
+    """
+    if update_sink is not None:
+        update_sink.add(TLS_HANDSHAKE, '', None, time.time(), int(ssl_object.session_reused))
+    else:
+        TLS_HANDSHAKES.inc(labels=('resumed' if ssl_object.session_reused else 'full',))
 
 
-async def monitor_heartbeat_status() -> None:
+def is_source_allowed(address) -> bool:
     """
-    Periodically checks if heartbeats are being received within the expected interval.
-    If not, sets the system status to offline and sends notifications.
+    Takes a token from the rate limit of the sender's IP address, if SOURCE_RATE is set.
+    Messages from a sender over its limit are dropped before they are parsed or verified.
+
+    Args:
+        address (tuple): The peer address of the message.
+
+    Returns:
+        bool: False if the message should be dropped.
     """
-    global offline, failed_heartbeat_time
-    logging.info("Heartbeat watchdog started...")
+    if source_limiter is None or not address:
+        return True
+    if source_limiter.allow(address[0]):
+        return True
+    HEARTBEATS.inc(labels=('throttled',))
+    skipped = throttle_log_sampler.sample(address[0])
+    if skipped is not None:
+        logging.warning(f"Dropped heartbeats from {address[0]} over the rate limit."
+                        + (f" ({skipped} more not logged)" if skipped else ""))
+    return False
+
+
+def tls_resumption_ratio(handshakes: dict) -> float:
+    """
+    Computes the share of TLS handshakes that resumed a session.
+
+    Args:
+        handshakes (dict): Handshake counts keyed by ('full',) and ('resumed',).
+
+    Returns:
+        float: The ratio, or 0 if there were no handshakes.
+    """
+    resumed = handshakes.get(('resumed',), 0)
+    total = resumed + handshakes.get(('full',), 0)
+    return resumed / total if total else 0.0
+
+
+async def run_tls_reporter() -> None:
+    """
+    Logs the TLS session resumption hit rate every LOG_SAMPLE_INTERVAL seconds in which
+    there were handshakes. Runs in the main process, which also counts the handshakes of
+    the heartbeat workers.
+    """
+    reported = {}
     while True:
-        await asyncio.sleep(60)
-        elapsed_time = time.time() - last_heartbeat_time
+        await asyncio.sleep(log_sample_interval or 60)
+        current = dict(TLS_HANDSHAKES.values)
+        interval = {labels: count - reported.get(labels, 0) for labels, count in current.items()}
+        reported = current
+        total = sum(interval.values())
+        if total:
+            logging.info(f"TLS sessions resumed: {tls_resumption_ratio(interval):.1%} of {total:g} handshakes.")
+
+
+async def process_heartbeat_stream(reader, address, header: bytes) -> None:
+    """
+    Processes heartbeat frames on a persistent connection until the client goes away.
 
-        if elapsed_time > offline_threshold:
-            offline = True
-            failed_heartbeat_time = last_heartbeat_time
-            downtime = str(timedelta(seconds=elapsed_time)).split(".")[0]
+    A stream that closes, breaks or stays silent for longer than the threshold of its hosts
+    is itself a liveness signal: the hosts seen on it are expired after STREAM_CLOSE_GRACE
+    seconds unless they reconnect first. Once a frame has started, the rest of it must
+    arrive within READ_TIMEOUT, and frames over the sender's rate limit are dropped.
 
-            logging.warning(f"More than {offline_threshold} seconds "
-                            f"passed since last heartbeat.")
-            await try_notify_channels("Hawkeye is down!", f"Downtime: {downtime}")
+    Args:
+        reader (StreamReader): The stream reader of the connection.
+        address (tuple): The peer address of the connection.
+        header (bytes): The part of the first frame header that was already read.
+    """
+    hosts = set()
+    try:
+        while True:
+            slots = (registry.lookup(host_id) for host_id in hosts)
+            timeout = max((registry.threshold_of(slot) for slot in slots if slot is not None),
+                          default=registry.default_threshold)
+            if not header:
+                header = await asyncio.wait_for(reader.read(FRAME_HEADER.size), timeout)
+                if not header:
+                    logging.info(f"Heartbeat stream from {address} closed by the client.")
+                    break
+            frame = await asyncio.wait_for(read_frame(reader, header), read_timeout)
+            header = b''
+            if not is_source_allowed(address):
+                continue
+            host_id = accept_heartbeat(frame, address)
+            if host_id is not None:
+                hosts.add(host_id)
+    except asyncio.TimeoutError:
+        logging.warning(f"Heartbeat stream from {address} went silent.")
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+        logging.warning(f"Heartbeat stream from {address} broken: {e}")
+
+    deadline = time.time() + stream_close_grace
+    for host_id in hosts:
+        if update_sink is not None:
+            update_sink.add(EXPIRE, host_id, address, deadline)
+        else:
+            registry.expire_by(host_id, deadline)
 
 
-def send_pushbullet_notification(title: str, body: str) -> None:
+def accept_heartbeat(data: bytes, address) -> Optional[str]:
     """
-    Sends a notification through Pushbullet service.
+    Validates one heartbeat message and records it against the sending host.
 
     Args:
-        title (str): Title of the notification.
-        body (str): Content of the notification.
+        data (bytes): The heartbeat message.
+        address (tuple): The peer address the message came from.
+
+    Returns:
+        Optional[str]: The host identity if the heartbeat was valid, None otherwise.
+    """
+    if data and data[0] == RELAY_DIGEST_V1:
+        return accept_relay_digest(data, address)
+    if update_sink is not None:
+        # In a worker, only authenticate; the coordinator checks replays and records the heartbeat
+        authenticated = authenticate_heartbeat(data)
+        if authenticated is None:
+            return None
+        host_id, sequence, gauges = authenticated
+        if gauges:
+            # Queued together, so that the coordinator gets the gauges in the same batch
+            now = time.time()
+            update_sink.extend(encode_update(HEARTBEAT, host_id, address, now, sequence)
+                               + encode_update(GAUGES, host_id, None, now, sequence, gauges))
+        else:
+            update_sink.add(HEARTBEAT, host_id, address, time.time(), sequence)
+        return host_id
+
+    started = time.perf_counter()
+    # As validate_heartbeat, but keeping the gauges decoded during authentication
+    authenticated = authenticate_heartbeat(data)
+    host_id = None
+    if authenticated is not None and is_sequence_fresh(authenticated[0], authenticated[1]):
+        host_id = authenticated[0]
+    VALIDATION_SECONDS.observe(time.perf_counter() - started)
+    if host_id is not None:
+        record_heartbeat(host_id, address)
+        record_gauges(host_id, authenticated[2])
+    HANDLING_SECONDS.observe(time.perf_counter() - started)
+    return host_id
+
+
+def accept_relay_digest(data: bytes, address) -> Optional[str]:
     """
-    pb = Pushbullet(pushbullet_api_key)
-    pb.push_note(title, body)
-    logging.warning(f'Send via Pushbullet. "{title} {body}"')
+    Validates a digest sent by an edge relay and records a heartbeat for the relay and for
+    every host it reports, as of the time the relay last heard from the host.
 
+    Args:
+        data (bytes): The relay digest.
+        address (tuple): The peer address of the relay.
 
-async def send_telegram_notification(text: str) -> None:
+    Returns:
+        Optional[str]: The relay identity if the digest was valid, None otherwise. Only the
+        relay is tied to the connection; its hosts expire on their own thresholds.
+    """
+    authenticated = authenticate_relay_digest(data)
+    if authenticated is None:
+        return None
+    relay, sequence, hosts = authenticated
+    now = time.time()
+    if update_sink is not None:
+        update_sink.extend(encode_update(HEARTBEAT, relay, address, now, sequence) + b''.join(
+            encode_update(RELAYED, host_id, address, now - age_ms / 1000) for host_id, age_ms in hosts))
+        return relay
+    if not is_sequence_fresh(relay, sequence):
+        return None
+    record_heartbeat(relay, address)
+    for host_id, age_ms in hosts:
+        record_heartbeat(host_id, address, now - age_ms / 1000)
+    return relay
+
+
+def record_heartbeat(host_id: str, address, seen: float = None) -> None:
     """
-    Sends a notification message through a Telegram bot.
+    Records a valid heartbeat against its host, registering hosts seen for the first time
+    and announcing hosts that come back online. On an edge relay, the heartbeat is queued
+    for the next digest instead.
 
     Args:
-        text (str): The message to be sent via Telegram.
+        host_id (str): The client identity.
+        address (tuple): The peer address the heartbeat came from.
+        seen (float, optional): When a relay heard the heartbeat, for hosts reported in a
+            relay digest. Defaults to now. A relayed heartbeat older than the threshold of
+            its host is dropped, as it no longer shows that the host is up.
     """
-    bot = Bot(telegram_bot_token)
-    try:
-        await bot.send_message(chat_id=telegram_id_to_notify, text=text)
-        logging.warning(f'Send via Telegram. "{text}"')
-    except Exception as e:
-        logging.error(f"Failed to send Telegram notification: {e}")
+    if seen is not None:
+        slot = registry.lookup(host_id)
+        if slot is not None and time.time() - seen >= registry.threshold_of(slot):
+            return
+    HEARTBEATS.inc(labels=('accepted' if seen is None else 'relayed',))
+    if relay_buffer is not None:
+        relay_buffer.add(host_id, seen)
+        return
+    skipped = heartbeat_log_sampler.sample(host_id)
+    if skipped is not None:
+        logging.info(f"Valid heartbeat received from {host_id} at IP: {address}"
+                     + (f" ({skipped} more not logged)" if skipped else ""))
+
+    now = time.time() if seen is None else seen
+    if host_id not in registry:
+        registry.add(host_id, now, group=alert_group_of(host_id, address, alert_group_by))
+        events.record('new', f"First heartbeat from {host_id} at IP: {address}", host_id)
+        if history_store is not None:
+            history_store.record_up(host_id, now)
+    if history_store is not None:
+        history_store.record_arrival(host_id, now, registry.last_seen[registry.lookup(host_id)])
+
+    # Update the host record; a downtime is returned if the host was offline
+    downtime = registry.touch(host_id, now)
+    if downtime is not None:
+        if history_store is not None:
+            history_store.record_up(host_id, now)
+        announce_host_up(host_id, downtime)
+
+
+def record_gauges(host_id: str, gauges: bytes) -> None:
+    """
+    Records the gauges carried by a valid heartbeat and alerts on those that cross their
+    limit. Edge relays do not forward gauges.
+
+    Args:
+        host_id (str): The client identity.
+        gauges (bytes): The encoded gauges of the heartbeat, empty if it carried none.
+    """
+    if not gauges or relay_buffer is not None:
+        return
+    for alert in telemetry_store.record(host_id, time.time(), decode_gauges(gauges)):
+        value = format_gauge(alert.gauge, alert.value)
+        limit = format_gauge(alert.gauge, alert.limit)
+        state = f"over the {alert.gauge} limit" if alert.over else f"back under the {alert.gauge} limit"
+        text = f"{host_id}: {alert.gauge} at {value}, {state} of {limit}."
+        if alert.over:
+            logging.warning(text)
+        else:
+            logging.info(text)
+        events.record('gauge', text, host_id)
+        alert_aggregator.add(state, registry.group_of(registry.lookup(host_id)), host_id,
+                             f"{host_id} is {state}!", text, value)
+
+
+def apply_worker_updates(batch: bytes) -> None:
+    """
+    Applies a batch of liveness updates forwarded by a heartbeat worker.
+
+    Args:
+        batch (bytes): The concatenated updates.
+    """
+    # The hosts of a relay digest and the gauges of a heartbeat only count if the heartbeat
+    # before them does
+    fresh = False
+    for update in decode_updates(batch):
+        if update.kind == EXPIRE:
+            registry.expire_by(update.host_id, update.time)
+        elif update.kind == RELAYED:
+            if fresh:
+                record_heartbeat(update.host_id, update.address, update.time)
+        elif update.kind == GAUGES:
+            if fresh:
+                record_gauges(update.host_id, update.payload)
+        elif update.kind == TLS_HANDSHAKE:
+            TLS_HANDSHAKES.inc(labels=('resumed' if update.sequence else 'full',))
+        else:
+            fresh = is_sequence_fresh(update.host_id, update.sequence)
+            if fresh:
+                record_heartbeat(update.host_id, update.address)
+
+
+async def receive_worker_updates() -> None:
+    """
+    Applies the updates of the heartbeat workers until all of them have exited.
+    """
+    logging.info(f"Receiving heartbeats from {len(worker_connections)} workers...")
+    await receive_updates(worker_connections, apply_worker_updates)
+    raise RuntimeError("All heartbeat workers exited")
+
+
+def start_heartbeat_workers(count: int) -> None:
+    """
+    Forks the heartbeat workers. Must be called before the event loop is started.
+
+    Args:
+        count (int): The number of worker processes.
+    """
+    global worker_connections
+    log_records = multiprocessing.get_context('fork').Queue()
+    forward_worker_logs(log_records)
+    worker_connections = start_workers(count, run_heartbeat_worker, (log_records,))
+
+
+def run_heartbeat_worker(index: int, connection, log_records) -> None:
+    """
+    The entry point of a forked heartbeat worker process.
+
+    Args:
+        index (int): The number of the worker.
+        connection (Connection): The pipe to the coordinator.
+        log_records (multiprocessing.Queue): The queue the worker logs to.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, 'SIGHUP'):
+        # The coordinator forwards its SIGHUP; until the loop handles it, it must not kill the worker
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    configure_worker_logging(log_records)
+    asyncio.run(serve_heartbeat_worker(index, connection))
+
+
+async def serve_heartbeat_worker(index: int, connection) -> None:
+    """
+    Accepts and authenticates heartbeats on the shared port, forwarding them to the
+    coordinator, until the coordinator goes away.
+
+    Args:
+        index (int): The number of the worker.
+        connection (Connection): The pipe to the coordinator.
+    """
+    global update_sink
+    update_sink = UpdateBatcher(connection)
+    if keyring_file and hasattr(signal, 'SIGHUP'):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_keyring)
+    server = await asyncio.start_server(process_heartbeat_from_client, sock=reuseport_socket(server_ip, server_port))
+    if udp_port:
+        await start_datagram_listener(server_ip, udp_port, reuse_port=True)
+    logging.info(f"Heartbeat worker {index} (pid {os.getpid()}) started.")
+    async with server:
+        await update_sink.broken.wait()
 
 
-async def telegram_command_check_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+def enable_keepalive(sock) -> None:
     """
-    A Telegram command handler function that checks the current status of the system and replies to the user.
+    Turns on TCP keepalive so that a peer which vanished without closing the connection
+    is detected by the kernel even while no frames are expected.
+
+    Args:
+        sock (socket.socket): The socket of a persistent heartbeat connection.
+    """
+    if sock is None:
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (('TCP_KEEPIDLE', 30), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+def announce_host_up(host_id: str, elapsed: float) -> None:
+    """
+    Logs and notifies that a host came back online.
+
+    Args:
+        host_id (str): The client identity of the host.
+        elapsed (float): The downtime in seconds, counted from the last heartbeat before the outage.
+    """
+    downtime = format_duration(elapsed)
+    group = registry.group_of(registry.lookup(host_id))
+
+    # Notify depending on the length of the downtime
+    if elapsed < 300:
+        logging.info(
+            f"{host_id} back up after {downtime}. Possible short outage."
+        )
+        events.record('up', f"{host_id} back up after {downtime}. Possible short outage.", host_id)
+        alert_aggregator.add('up', group, host_id, f"{host_id} is up!",
+                             f"Possible short power outage. Time taken {downtime}.", downtime)
+    else:
+        logging.info(f"{host_id} back up after {downtime}.")
+        events.record('up', f"{host_id} back up after {downtime}.", host_id)
+        alert_aggregator.add('up', group, host_id, f"{host_id} is up!",
+                             f"{host_id} back online after {downtime}.", downtime)
+
+
+async def monitor_heartbeat_status() -> None:
+    """
+    Waits for the earliest host deadline and sets hosts whose heartbeats stopped to offline,
+    sending notifications through the alert aggregator. The watchdog sleeps until the next expiry and is woken early
+    whenever a sooner deadline is scheduled.
+    """
+    logging.info("Heartbeat watchdog started...")
+    registry.deadlines.on_earlier = watchdog_wakeup.set
+    while True:
+        now = time.time()
+
+        for slot in registry.pop_expired(now):
+            registry.mark_offline(slot)
+            host_id = registry.names[slot]
+            if history_store is not None:
+                history_store.record_down(host_id, registry.last_seen[slot])
+            downtime = format_duration(now - registry.last_seen[slot])
+            phi = registry.phi_of(slot, now)
+            if phi is not None and not registry.thresholds[slot]:
+                reason = f"{host_id}: no heartbeat for {downtime}, suspicion level phi {phi:.1f}."
+            else:
+                reason = f"{host_id}: more than {registry.threshold_of(slot)} seconds passed since last heartbeat."
+
+            logging.warning(reason)
+            events.record('down', reason, host_id)
+            alert_aggregator.add('down', registry.group_of(slot), host_id,
+                                 f"{host_id} is down!", f"Downtime: {downtime}", downtime)
+
+        next_deadline = registry.deadlines.next_deadline()
+        timeout = None if next_deadline is None else max(0.0, next_deadline - time.time())
+        watchdog_wakeup.clear()
+        try:
+            await asyncio.wait_for(watchdog_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Formats a duration in seconds as H:MM:SS, dropping fractions of a second.
+
+    Args:
+        seconds (float): The duration in seconds.
+    """
+    return str(timedelta(seconds=seconds)).split(".")[0]
+
+
+def describe_gauges(host_id: str, now: float) -> str:
+    """
+    Describes the gauges a host reports, with their rollups over the kept buckets, for a
+    status reply.
+
+    Args:
+        host_id (str): The client identity of the host.
+        now (float): The current time.
+
+    Returns:
+        str: One line per gauge, each starting with a newline, or '' if the host reports none.
+    """
+    latest = telemetry_store.latest_values(host_id)
+    if not latest:
+        return ""
+    window = format_duration(telemetry_store.buckets * telemetry_store.bucket_seconds)
+    text = f"\nGauges, with their range over the last {window}:"
+    for name, value in latest.items():
+        text += f"\n{name}: {format_gauge(name, value)}"
+        rollup = telemetry_store.rollup(host_id, name, now)
+        if rollup is not None:
+            text += (f" (min {format_gauge(name, rollup.minimum)}, avg {format_gauge(name, rollup.average)}, "
+                     f"max {format_gauge(name, rollup.maximum)})")
+        limit = telemetry_store.limits[GAUGE_NAMES.index(name)]
+        if value > limit:
+            text += f", over the limit of {format_gauge(name, limit)}"
+    return text
+
+
+async def telegram_command_check_status(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE') -> None:
+    """
+    A Telegram command handler function that checks the current status of the monitored hosts and replies
+    to the user. With a host argument, the reply describes that host only.
 
     Args:
         update (Update): The Telegram update object containing message details.
         context (ContextTypes.DEFAULT_TYPE): Context of the command including arguments.
     """
-    global last_heartbeat_time, offline, snooze_start_time, snooze_duration, offline_threshold
+    current_time = int(time.time())
 
-    if last_heartbeat_time is None:
+    if len(registry) == 0:
         await update.message.reply_text("No heartbeat has been received yet.")
+    elif len(context.args) > 0 or len(registry) == 1:
+        host_id = context.args[0] if len(context.args) > 0 else registry.names[0]
+        slot = registry.lookup(host_id)
+        if slot is None:
+            await update.message.reply_text(f"No heartbeat has been received from {host_id} yet.")
+            return
+        host = registry.status(slot)
+        downtime = format_duration(current_time - host.last_seen)
+        status = "Online" if not host.offline else "Offline"
+        text = (f"{host_id} is currently {status} with a threshold of {host.threshold} "
+                f"seconds.\nLast heartbeat was {downtime} ago.")
+        phi = registry.phi_of(slot)
+        if phi is not None and not host.offline:
+            text += f"\nSuspicion level phi is {phi:.1f} (alert at {registry.detector.threshold:g})."
+        text += describe_gauges(host_id, current_time)
+        await update.message.reply_text(text)
     else:
-        current_time = int(time.time())
-        elapsed_time = current_time - last_heartbeat_time
-        downtime = str(timedelta(seconds=elapsed_time)).split(".")[0]
-        status = "Online" if not offline else "Offline"
-        await update.message.reply_text(f"Hawkeye is currently {status} with a threshold of {offline_threshold} seconds.\nLast heartbeat was {downtime} ago.")
+        offline_count = registry.offline_count()
+        offline_hosts = [name for slot, name in enumerate(registry.names) if registry.offline[slot]]
+        text = (f"Monitoring {len(registry)} hosts: {len(registry) - offline_count} online, "
+                f"{offline_count} offline. Default threshold is {registry.default_threshold} seconds.")
+        if offline_hosts:
+            shown = ", ".join(offline_hosts[:STATUS_LIST_LIMIT])
+            more = len(offline_hosts) - STATUS_LIST_LIMIT
+            text += f"\nOffline: {shown}" + (f" and {more} more." if more > 0 else ".")
+        over_limits = telemetry_store.over_limits()
+        if over_limits:
+            shown = ", ".join(f"{name} ({', '.join(gauges)})"
+                              for name, gauges in list(over_limits.items())[:STATUS_LIST_LIMIT])
+            more = len(over_limits) - STATUS_LIST_LIMIT
+            text += f"\nOver gauge limits: {shown}" + (f" and {more} more." if more > 0 else ".")
+        await update.message.reply_text(text)
 
-        if snooze_start_time is not None:
-            snooze_elapsed_time = current_time - snooze_start_time
-            if snooze_elapsed_time < snooze_duration:
-                await update.message.reply_text(f"Notifications are currently snoozed for {snooze_duration - snooze_elapsed_time} seconds more.")
+    if snooze_start_time is not None:
+        snooze_elapsed_time = current_time - snooze_start_time
+        if snooze_elapsed_time < snooze_duration:
+            await update.message.reply_text(f"Notifications are currently snoozed for {snooze_duration - snooze_elapsed_time} seconds more.")
 
 
-async def telegram_command_snooze_notifications(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def telegram_command_snooze_notifications(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE') -> None:
     """
     A Telegram command handler function that sets or disables a snooze period for notifications.
 
@@ -279,33 +1173,50 @@ async def telegram_command_snooze_notifications(update: Update, context: Context
         await update.message.reply_text("Usage: /snooze <seconds> (between 5 and 36000) or /snooze disable.")
 
 
-async def telegram_command_view_logs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def telegram_command_view_logs(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE') -> None:
     """
     A Telegram command handler function that displays recent log entries.
 
+    `/view_logs [lines]` shows the end of the log file. `/view_logs events [lines] [host=<id>]
+    [type=<type>]` shows recent monitoring events from memory, optionally filtered.
+
     Args:
         update (Update): The Telegram update object.
         context (ContextTypes.DEFAULT_TYPE): Context of the command including arguments.
     """
     try:
-        lines = int(context.args[0]) if len(context.args) > 0 else 10
+        args = list(context.args)
+        from_events = len(args) > 0 and args[0].lower() == "events"
+        if from_events:
+            args.pop(0)
+        filters = dict(arg.split("=", 1) for arg in args if "=" in arg)
+        counts = [arg for arg in args if "=" not in arg]
+        if set(filters) - {"host", "type"} or len(counts) > 1 or (filters and not from_events):
+            raise ValueError("Invalid arguments")
+
+        lines = int(counts[0]) if counts else 10
         if not (0 <= lines <= 50):
             raise ValueError("Invalid lines count")
 
-        with open('server_log.txt', 'r') as log_file:
-            lines = log_file.readlines()[-lines:]
-            log_text = ''.join(lines)
+        if from_events:
+            recent = events.recent(lines, filters.get("host"), filters.get("type"))
+            log_text = "\n".join(str(event) for event in recent) or "No matching events."
+            await update.message.reply_text(f"Recent events:\n{log_text}")
+            return
 
+        log_text = ''.join(tail_lines(LOG_FILE, lines))
         await update.message.reply_text(f"Recent logs:\n{log_text}")
     except FileNotFoundError:
         await update.message.reply_text("Log file not found.")
     except (IndexError, ValueError):
-        await update.message.reply_text("Usage: /view_logs <lines> (between 0 and 50).")
+        await update.message.reply_text("Usage: /view_logs <lines> (between 0 and 50) or "
+                                        "/view_logs events <lines> [host=<id>] [type=<type>].")
 
 
-async def telegram_command_set_offline_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def telegram_command_set_offline_threshold(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE') -> None:
     """
-    A Telegram command handler function that adjusts the offline threshold for notifications.
+    A Telegram command handler function that adjusts the offline threshold for notifications, either
+    the default for all hosts or, with a host argument, for a single host.
 
     Args:
         update (Update): The Telegram update object.
@@ -314,13 +1225,87 @@ async def telegram_command_set_offline_threshold(update: Update, context: Contex
     global offline_threshold
     try:
         new_threshold = int(context.args[0])
+        if new_threshold <= 0:
+            raise ValueError("Invalid threshold")
+        if len(context.args) > 1:
+            host_id = context.args[1]
+            slot = registry.lookup(host_id)
+            if slot is None:
+                await update.message.reply_text(f"No heartbeat has been received from {host_id} yet.")
+                return
+            registry.set_threshold(slot, new_threshold)
+            await update.message.reply_text(f"Offline threshold for {host_id} set to {new_threshold} seconds.")
+            return
         offline_threshold = new_threshold
+        registry.set_default_threshold(new_threshold)
         await update.message.reply_text(f"Offline threshold set to {new_threshold} seconds.")
     except (IndexError, ValueError):
-        await update.message.reply_text("Usage: /set_threshold <seconds>")
+        await update.message.reply_text("Usage: /set_threshold <seconds> [host]")
+
 
+async def telegram_command_uptime(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE') -> None:
+    """
+    A Telegram command handler function that reports the uptime, outages and heartbeats of a
+    host over the last days, from the host history.
 
-async def telegram_command_show_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    Args:
+        update (Update): The Telegram update object.
+        context (ContextTypes.DEFAULT_TYPE): Context of the command including arguments.
+    """
+    if history_store is None:
+        await update.message.reply_text("Host history is not recorded. Set HISTORY_DIR to enable it.")
+        return
+    try:
+        host_id = context.args[0]
+        days = int(context.args[1]) if len(context.args) > 1 else 30
+        if not (1 <= days <= 3650):
+            raise ValueError("Invalid number of days")
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /uptime <host> [days] (between 1 and 3650, 30 by default)")
+        return
+
+    now = time.time()
+    uptime = history_store.uptime(host_id, now - days * 86400, now, now)
+    if uptime is None:
+        await update.message.reply_text(f"No history has been recorded for {host_id} yet.")
+        return
+    text = (f"{host_id} over the last {days} days: {uptime.uptime_percent:.3f}% uptime over "
+            f"{format_duration(uptime.observed)} observed.\n"
+            f"{uptime.outages} outages, {format_duration(uptime.downtime)} down in total, "
+            f"longest {format_duration(uptime.longest_outage)}.\n"
+            f"{uptime.heartbeats} heartbeats, longest gap between two {uptime.longest_gap} seconds.")
+    await update.message.reply_text(text)
+
+
+async def telegram_command_profile(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE') -> None:
+    """
+    A Telegram command handler function that samples the event loop for a few seconds and
+    replies with the functions it spent the most time in. Only available with --instrument.
+
+    Args:
+        update (Update): The Telegram update object.
+        context (ContextTypes.DEFAULT_TYPE): Context of the command including arguments.
+    """
+    if not instrument:
+        await update.message.reply_text("Profiling is only available when the server runs with --instrument.")
+        return
+    try:
+        seconds = float(context.args[0]) if context.args else profile_seconds
+        if not 1 <= seconds <= 300:
+            raise ValueError("Invalid duration")
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds] (between 1 and 300).")
+        return
+    if profile_lock.locked():
+        await update.message.reply_text("A profile is already running.")
+        return
+
+    await update.message.reply_text(f"Profiling the event loop for {seconds:g}s...")
+    report = await profile_event_loop(seconds)
+    await update.message.reply_text(f"Event loop profile:\n{report}"[:TELEGRAM_MESSAGE_LIMIT])
+
+
+async def telegram_command_show_help(update: 'Update', context: 'ContextTypes.DEFAULT_TYPE') -> None:
     """
     A Telegram command handler function that shows a help message with available commands.
 
@@ -330,11 +1315,15 @@ async def telegram_command_show_help(update: Update, context: ContextTypes.DEFAU
     """
     help_text = (
         "Available commands:\n\n"
-        "/snooze <seconds> - Snooze notifications for a specified time (between 5 and 36000 seconds).\n"
-        "/status - Check if Hawkeye is currently online or offline and the time since the last heartbeat.\n"
-        "/set_threshold <seconds> - Set the offline threshold duration in seconds.\n"
-        "/extend_snooze <additional_seconds> - Extend the snooze duration by a specified amount of time.\n"
-        "/view_logs - View the last 10 lines of the log file for recent events.\n"
+        "/snooze <seconds> - Snooze notifications for a specified time (between 5 and 36000 seconds), "
+        "or extend an active snooze by that time.\n"
+        "/snooze disable - End the snooze.\n"
+        "/status [host] - Check which hosts are online or offline and the time since the last heartbeat.\n"
+        "/set_threshold <seconds> [host] - Set the offline threshold duration in seconds.\n"
+        "/view_logs [lines] - View the last lines of the log file (10 by default).\n"
+        "/view_logs events [lines] [host=<id>] [type=<type>] - View recent events (down, up, new, invalid, notify, slow, gauge).\n"
+        "/uptime <host> [days] - Show the uptime, outages and heartbeats of a host over the last days (30 by default).\n"
+        "/profile [seconds] - Profile the server's event loop and show the busiest functions (--instrument only).\n"
         "/help - Show this help message with all available commands.\n"
     )
     await update.message.reply_text(help_text)
@@ -359,9 +1348,20 @@ async def initialize_telegram_bot() -> None:
     """
     Initializes and starts the Telegram bot with command handlers set up.
 
-    This function configures the bot to listen for commands and manage its lifecycle.
+    This function configures the bot to listen for commands and manage its lifecycle. With
+    TELEGRAM_MODE=webhook, updates are pushed by Telegram to a local HTTP endpoint instead
+    of being fetched by long polling.
     """
-    application = Application.builder().token(telegram_bot_token).build()
+    from telegram.ext import Application, CommandHandler
+
+    global telegram_application
+    webhook = telegram_mode == 'webhook'
+    builder = Application.builder().token(telegram_bot_token)
+    if telegram_api_url:
+        builder = builder.base_url(telegram_api_url)
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
     # Adding command handlers for Telegram commands
     application.add_handler(CommandHandler("help", telegram_command_show_help))
     application.add_handler(CommandHandler("snooze", telegram_command_snooze_notifications))
@@ -369,26 +1369,504 @@ async def initialize_telegram_bot() -> None:
     application.add_handler(CommandHandler(
         "set_threshold", telegram_command_set_offline_threshold))
     application.add_handler(CommandHandler("view_logs", telegram_command_view_logs))
+    application.add_handler(CommandHandler("uptime", telegram_command_uptime))
+    application.add_handler(CommandHandler("profile", telegram_command_profile))
 
-    logging.info("Starting Telegram bot...")
+    logging.info(f"Starting Telegram bot ({telegram_mode})...")
     await application.initialize()
     await application.start()
-    await application.updater.start_polling()
-
+    telegram_application = application
     try:
-        # Keep the bot running until it's manually stopped or an error occurs
-        while True:
-            await asyncio.sleep(3600)
-    except asyncio.CancelledError:
+        if webhook:
+            await run_telegram_webhook(application)
+        else:
+            await application.updater.start_polling()
+            # Keep the bot running until it's manually stopped or an error occurs
+            await asyncio.get_running_loop().create_future()
+    finally:
         logging.info("Stopping Telegram bot...")
+        telegram_application = None
+        if application.updater is not None and application.updater.running:
+            await application.updater.stop()
         await application.stop()
+        await application.shutdown()
+
+
+async def run_telegram_webhook(application) -> None:
+    """
+    Receives Telegram updates on TELEGRAM_WEBHOOK_HOST:TELEGRAM_WEBHOOK_PORT and, when
+    TELEGRAM_WEBHOOK_URL is set, registers that public URL with Telegram. The URL is
+    expected to reach the local endpoint through a TLS-terminating proxy.
+
+    Args:
+        application (Application): The started bot application.
+    """
+    server = await start_http_server({('POST', telegram_webhook_path): serve_telegram_webhook},
+                                     telegram_webhook_host, telegram_webhook_port)
+    logging.info(f"Receiving Telegram updates on {telegram_webhook_host}:{telegram_webhook_port}"
+                 f"{telegram_webhook_path}")
+    async with server:
+        if telegram_webhook_url:
+            await application.bot.set_webhook(telegram_webhook_url, secret_token=telegram_webhook_secret)
+        await server.serve_forever()
+
+
+async def serve_telegram_webhook(request) -> HttpResponse:
+    """
+    Queues one Telegram update posted to the webhook endpoint for the command handlers.
+    Requests without the TELEGRAM_WEBHOOK_SECRET token are rejected.
+
+    Args:
+        request (HttpRequest): The update posted by Telegram.
+    """
+    from telegram import Update
+
+    if telegram_webhook_secret and not hmac.compare_digest(
+            request.headers.get('x-telegram-bot-api-secret-token', '').encode(), telegram_webhook_secret.encode()):
+        logging.warning("Rejected a Telegram update with a wrong secret token.")
+        return HttpResponse(403)
+    if telegram_application is None:
+        return HttpResponse(500)
+    try:
+        update = Update.de_json(json.loads(request.body), telegram_application.bot)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        logging.warning(f"Bad Telegram update: {e}")
+        return HttpResponse(400)
+    await telegram_application.update_queue.put(update)
+    return HttpResponse(200)
+
+
+async def serve_metrics(request) -> HttpResponse:
+    """
+    Returns all metrics in the Prometheus text format.
+
+    Args:
+        request (HttpRequest): The scrape request.
+    """
+    return HttpResponse(200, metrics_registry.render().encode(), 'text/plain; version=0.0.4; charset=utf-8')
+
+
+async def run_metrics_server() -> None:
+    """
+    Serves /metrics on METRICS_HOST:METRICS_PORT and probes the event loop lag.
+    """
+    server = await start_http_server({('GET', '/metrics'): serve_metrics}, metrics_host, metrics_port)
+    logging.info(f"Serving metrics on {metrics_host}:{metrics_port}/metrics")
+    async with server:
+        await asyncio.gather(server.serve_forever(), probe_event_loop_lag())
+
+
+def report_stall(stall: Stall) -> None:
+    """
+    Logs a callback that blocked the event loop, with the stack it was blocked in.
+
+    Args:
+        stall (Stall): The stall found by the loop watchdog.
+    """
+    SLOW_CALLBACKS.inc()
+    summary = f"Event loop blocked for {stall.duration * 1000:.0f} ms by {stall.task}"
+    events.record('slow', summary + ".")
+    logging.warning(f"{summary}. Stack when detected:\n{stall.stack.rstrip()}")
+
+
+async def profile_event_loop(seconds: float) -> str:
+    """
+    Samples the stack of the event loop's thread from another thread for a number of
+    seconds, without blocking the loop.
+
+    Args:
+        seconds (float): How long to sample.
+
+    Returns:
+        str: The PROFILE_TOP functions the loop spent the most time in.
+    """
+    async with profile_lock:
+        samples, own, total = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds)
+    return format_profile(summarize_profile(samples, own, total, profile_top), samples, seconds)
+
+
+async def log_event_loop_profile(seconds: float) -> None:
+    logging.info(f"Profiling the event loop for {seconds:g}s...")
+    logging.info(f"Event loop profile:\n{await profile_event_loop(seconds)}")
+
+
+def start_signal_profile() -> None:
+    """
+    Profiles the event loop for PROFILE_SECONDS on SIGUSR1 and writes the report to the log.
+    """
+    global signal_profile
+    if profile_lock.locked():
+        logging.warning("A profile is already running.")
+        return
+    signal_profile = asyncio.ensure_future(log_event_loop_profile(profile_seconds))
+
+
+async def run_loop_instrumentation() -> None:
+    """
+    Watches the event loop for callbacks blocking it for longer than SLOW_CALLBACK_THRESHOLD
+    and logs the largest loop lag every LOG_SAMPLE_INTERVAL seconds. SIGUSR1 starts a profile.
+    """
+    global loop_watchdog
+    loop_watchdog = LoopWatchdog(slow_callback_threshold, report_stall)
+    loop_watchdog.start()
+    if hasattr(signal, 'SIGUSR1'):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, start_signal_profile)
+    interval = log_sample_interval or 60
+    logging.info(f"Watching the event loop for callbacks slower than {slow_callback_threshold * 1000:.0f} ms...")
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            logging.info(f"Event loop lag: at most {loop_watchdog.take_max_lag() * 1000:.1f} ms "
+                         f"in the last {interval:g}s.")
+    finally:
+        loop_watchdog.stop()
+
+
+def reload_keyring() -> None:
+    """
+    Reloads the per-client keys from KEYRING_FILE, keeping the current keys if the file is unreadable.
+    """
+    try:
+        keyring.load(keyring_file)
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to load keyring from {keyring_file}: {e}")
+
+
+def reload_all_keyrings() -> None:
+    """
+    Handles SIGHUP in the main process: reloads the keyring and has every heartbeat worker
+    reload its own copy.
+    """
+    reload_keyring()
+    if worker_connections:
+        signal_workers(signal.SIGHUP)
+
+
+def current_settings() -> Settings:
+    """
+    Returns the server-wide settings that are saved with the host state.
+    """
+    return Settings(registry.default_threshold, snooze_start_time, snooze_duration)
+
+
+def apply_saved_state(saved: SavedState, not_before: float) -> None:
+    """
+    Replaces the host records, thresholds and snooze state with saved ones.
+
+    Args:
+        saved (SavedState): The saved state.
+        not_before (float): The earliest time online hosts may expire.
+    """
+    global offline_threshold, snooze_start_time, snooze_duration
+    offline_threshold = saved.settings.default_threshold
+    registry.default_threshold = offline_threshold
+    registry.restore(saved.names, saved.group_names, saved.last_seen, saved.down_since, saved.thresholds,
+                     saved.offline, saved.groups, not_before=not_before)
+    snooze_start_time = None if saved.settings.snooze_start_time is None else int(saved.settings.snooze_start_time)
+    snooze_duration = int(saved.settings.snooze_duration)
+
+
+def restore_state() -> None:
+    """
+    Restores the host records, thresholds and snooze state saved in STATE_DIR. Hosts that
+    were offline stay offline. Online hosts expire as usual, but no sooner than one save
+    interval after the restart, since heartbeats received after the last save were lost.
+    """
+    started = time.perf_counter()
+    try:
+        saved = state_store.load()
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to load the saved state from {state_dir}: {e}")
+        return
+    if saved is None:
+        logging.info(f"No saved state in {state_dir}, starting fresh.")
+        return
+
+    apply_saved_state(saved, time.time() + state_interval)
+    logging.info(f"Restored {len(registry)} hosts ({registry.offline_count()} offline) saved "
+                 f"{format_duration(max(0.0, time.time() - saved.saved_at))} ago, "
+                 f"in {(time.perf_counter() - started) * 1000:.0f} ms.")
+    events.record('restore', f"Restored {len(registry)} hosts from the saved state.")
+
+
+class SteppedDown(Exception):
+    """
+    Raised when a standby that took over finds the primary serving again.
+    """
+
+
+async def follow_primary() -> bool:
+    """
+    Runs the server as a standby: keeps a copy of the primary's state from its replication
+    stream until the primary has been silent for REPLICATION_TIMEOUT seconds, then takes
+    the copy over. Online hosts get one REPLICATION_TIMEOUT of grace, since their heartbeats
+    went to the primary in the meantime.
+
+    A standby that has not received any state, e.g. because it started before the primary,
+    keeps standing by, unless REPLICATION_COLD_TAKEOVER is set.
+
+    Returns:
+        bool: True if state from the primary was taken over, False for a cold takeover.
+    """
+    host, _, port = replication_primary.rpartition(':')
+    follower = ReplicaFollower(host, int(port), replication_key, replication_timeout)
+    logging.info(f"Standing by for the primary at {replication_primary}...")
+    saved = await follower.follow()
+    if saved is None and not replication_cold_takeover:
+        logging.warning(f"No state received from the primary at {replication_primary} yet, still standing by.")
+        while saved is None:
+            saved = await follower.follow()
+    if saved is None:
+        logging.warning(f"No state received from the primary at {replication_primary}, taking over without it.")
+        events.record('failover', f"Took over from the primary at {replication_primary} without its state.")
+        return False
+    apply_saved_state(saved, time.time() + replication_timeout)
+    logging.warning(f"The primary at {replication_primary} has been silent for {replication_timeout:g}s, taking "
+                    f"over with {len(registry)} hosts ({registry.offline_count()} offline).")
+    events.record('failover', f"Took over from the primary at {replication_primary}.")
+    return True
+
+
+async def watch_primary() -> None:
+    """
+    Runs after a standby took over: checks every REPLICATION_TIMEOUT seconds whether the
+    primary at REPLICATION_PRIMARY serves replication again, e.g. once a network partition
+    heals. If it does, this server steps down, so that the two do not both monitor and
+    notify.
+
+    Raises:
+        SteppedDown: Once the primary answers.
+    """
+    host, _, port = replication_primary.rpartition(':')
+    follower = ReplicaFollower(host, int(port), replication_key, replication_timeout)
+    while not await follower.probe():
+        await asyncio.sleep(replication_timeout)
+    logging.warning(f"The primary at {replication_primary} is serving again, stepping down.")
+    events.record('failover', f"Stepped down for the primary at {replication_primary}.")
+    try_notify_channels("Failover", f"The primary at {replication_primary} is back, the standby stepped down.")
+    try:
+        await asyncio.wait_for(notifier.join(), STEP_DOWN_NOTIFY_WAIT)
+    except asyncio.TimeoutError:
+        pass
+    raise SteppedDown(f"Stepped down for the primary at {replication_primary}")
+
+
+async def run_replication_source() -> None:
+    """
+    Streams the monitoring state to standby servers connecting to REPLICATION_PORT: in full
+    when a standby connects, then the changed hosts every REPLICATION_INTERVAL seconds.
+    """
+    global replication_source
+    replication_source = ReplicationSource(registry, current_settings, replication_key, replication_interval)
+    server = await asyncio.start_server(replication_source.handle, server_ip, replication_port)
+    logging.info(f"Replicating the monitoring state to standbys on port {replication_port}...")
+    try:
+        async with server:
+            await asyncio.gather(server.serve_forever(), replication_source.run())
+    finally:
+        replication_source.close()
+
+
+async def save_state() -> None:
+    """
+    Writes the changes since the previous save. The records are encoded on the event loop
+    and written to disk on a worker thread.
+    """
+    global state_write
+    record, compact = state_store.prepare(registry, current_settings())
+    state_write = asyncio.get_running_loop().run_in_executor(None, state_store.write, record, compact)
+    await asyncio.shield(state_write)
+
+
+async def run_state_saver() -> None:
+    """
+    Saves the monitoring state every STATE_INTERVAL seconds.
+    """
+    logging.info(f"Saving the monitoring state to {state_dir} every {state_interval}s...")
+    while True:
+        await asyncio.sleep(state_interval)
+        try:
+            await save_state()
+        except OSError as e:
+            logging.error(f"Failed to save the monitoring state: {e}")
+
+
+async def save_history() -> None:
+    """
+    Writes the host transitions recorded since the previous save on a worker thread.
+    """
+    global history_write
+    record, compact = history_store.prepare()
+    history_write = asyncio.get_running_loop().run_in_executor(None, history_store.write, record, compact)
+    await asyncio.shield(history_write)
+
+
+async def wait_for_pending_writes() -> None:
+    """
+    Waits for state and history writes still running on their worker thread, so that the
+    final save and close at shutdown do not race them. Their errors were already reported
+    to the saver that started them.
+    """
+    pending = [write for write in (state_write, history_write) if write is not None and not write.done()]
+    if pending:
+        await asyncio.wait(pending)
+
+
+async def run_history_writer() -> None:
+    """
+    Saves the host history every HISTORY_INTERVAL seconds.
+    """
+    logging.info(f"Recording host history to {history_dir} every {history_interval}s...")
+    while True:
+        await asyncio.sleep(history_interval)
+        try:
+            await save_history()
+        except OSError as e:
+            logging.error(f"Failed to save the host history: {e}")
+
+
+async def run_relay() -> None:
+    """
+    Runs the server as an edge relay: heartbeats are validated here and the hosts heard from
+    are forwarded to RELAY_UPSTREAM as one signed digest per RELAY_INTERVAL, over a single
+    persistent connection. A relay does not track host state or send notifications itself.
+    """
+    host, _, port = relay_upstream.rpartition(':')
+    sender = StreamSender(host, int(port), connection_timeout, ReconnectBackoff(),
+                          create_client_context(tls_ca_file) if relay_tls else None)
+    forwarder = RelayForwarder(relay_buffer, sender, relay_id, relay_key, relay_interval)
+    services = [run_heartbeat_server(), forwarder.run()]
+    if metrics_port:
+        services.append(run_metrics_server())
+    if tls_context is not None:
+        services.append(run_tls_reporter())
+    try:
+        await asyncio.gather(*services)
+    finally:
+        forwarder.close()
 
 
 async def run_all_services() -> None:
     """
     The main coroutine that gathers and runs the server, heartbeat check, and Telegram bot concurrently.
+    In headless mode, the Telegram bot and notification channels are not started.
+    """
+    global notifier
+    if keyring_file and hasattr(signal, 'SIGHUP'):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_all_keyrings)
+    if relay_buffer is not None:
+        await run_relay()
+        return
+    took_over = await follow_primary() if replication_primary else False
+    if state_store is not None and not took_over:
+        restore_state()
+    if history_store is not None:
+        history_store.open()
+    notifier = create_notifier()
+    await notifier.start()
+    if took_over:
+        try_notify_channels("Failover", f"The standby took over from the primary at {replication_primary}.")
+    elif replication_primary:
+        try_notify_channels("Failover", f"The standby took over from the primary at {replication_primary} "
+                                        f"without its state.")
+    try:
+        heartbeats = receive_worker_updates() if worker_connections else run_heartbeat_server()
+        services = [heartbeats, monitor_heartbeat_status()]
+        if telegram_bot_token and not headless:
+            services.append(initialize_telegram_bot())
+        if metrics_port:
+            services.append(run_metrics_server())
+        if state_store is not None:
+            services.append(run_state_saver())
+        if history_store is not None:
+            services.append(run_history_writer())
+        if tls_context is not None:
+            services.append(run_tls_reporter())
+        if instrument:
+            services.append(run_loop_instrumentation())
+        if replication_port:
+            services.append(run_replication_source())
+        if replication_primary:
+            services.append(watch_primary())
+        await asyncio.gather(*services)
+    finally:
+        await wait_for_pending_writes()
+        if state_store is not None:
+            try:
+                await save_state()
+            except OSError as e:
+                logging.error(f"Failed to save the monitoring state: {e}")
+        if history_store is not None:
+            try:
+                history_store.close()
+            except OSError as e:
+                logging.error(f"Failed to save the host history: {e}")
+        await notifier.stop()
+
+
+def main(argv: List[str] = None) -> None:
     """
-    await asyncio.gather(run_heartbeat_server(), monitor_heartbeat_status(), initialize_telegram_bot())
+    Checks the configuration, sets up logging and runs the server until it is stopped.
+
+    Args:
+        argv (List[str], optional): The command-line arguments. Defaults to sys.argv.
+    """
+    global headless, instrument, log_listener, tls_context, telemetry_store
+    parser = argparse.ArgumentParser(description='Heartbeat Server')
+    parser.add_argument('--headless', action='store_true',
+                        help='Run only the heartbeat listener and offline detection, without the '
+                             'Telegram bot or notifications')
+    parser.add_argument('--instrument', action='store_true', default=instrument,
+                        help='Watch the event loop for slow callbacks and allow profiling it with '
+                             '/profile or SIGUSR1')
+    args = parser.parse_args(argv)
+    missing = [name for name in REQUIRED_SETTINGS if not os.getenv(name)]
+    if missing:
+        parser.error(f"missing required settings: {', '.join(missing)}")
+    if telegram_mode not in ('polling', 'webhook'):
+        parser.error(f"TELEGRAM_MODE must be polling or webhook, not {telegram_mode}")
+    if relay_upstream:
+        if server_workers:
+            parser.error("RELAY_UPSTREAM cannot be combined with SERVER_WORKERS")
+        if not relay_upstream.rpartition(':')[2].isdigit():
+            parser.error(f"RELAY_UPSTREAM must be <host>:<port>, not {relay_upstream}")
+        if replication_port or replication_primary:
+            parser.error("RELAY_UPSTREAM cannot be combined with replication")
+    if replication_primary:
+        if server_workers:
+            parser.error("REPLICATION_PRIMARY cannot be combined with SERVER_WORKERS")
+        if not replication_primary.rpartition(':')[2].isdigit():
+            parser.error(f"REPLICATION_PRIMARY must be <host>:<port>, not {replication_primary}")
+    try:
+        telemetry_store = TelemetryStore(telemetry_buckets, telemetry_bucket_seconds, parse_limits(telemetry_alerts))
+    except ValueError as e:
+        parser.error(f"TELEMETRY_ALERTS: {e}")
+    headless = args.headless
+    instrument = args.instrument
+    if tls_cert_file:
+        # Created before the workers are forked, so that they share the session ticket key
+        try:
+            tls_context = create_server_context(tls_cert_file, tls_key_file)
+        except (OSError, ssl.SSLError) as e:
+            parser.error(f"cannot load TLS_CERT_FILE: {e}")
+
+    # Set up logging, written by a background thread unless LOG_MODE=sync
+    log_listener = configure_logging(LOG_FILE, log_mode, log_max_bytes, log_backup_count, log_rotate_when)
+    logging.getLogger('httpx').setLevel(
+        logging.WARNING)  # To avoid clutter in logs
+
+    # Loaded before the workers are forked, so that they start with the same keys
+    if keyring_file:
+        reload_keyring()
+    if server_workers:
+        start_heartbeat_workers(server_workers)
+    try:
+        asyncio.run(run_all_services())
+    except SteppedDown as e:
+        # Exits with an error, so that a supervisor restarts the server as a standby
+        logging.warning(f"{e}, exiting.")
+        sys.exit(1)
+
 
 if __name__ == '__main__':
-    asyncio.run(run_all_services())
+    main()
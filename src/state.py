@@ -0,0 +1,319 @@
+import os
+import sys
+import math
+import time
+import zlib
+import struct
+import logging
+from array import array
+from itertools import accumulate
+from typing import List, NamedTuple, Optional, Tuple
+
+from registry import HostRegistry
+
+# Monitoring state is kept in a directory with two files. The snapshot holds the full
+# state and is replaced atomically (write, fsync, rename). The change log is appended to
+# between snapshots with only the hosts that changed. Both hold records of the same form:
+# a header, the host and group names added since the previous record, the changed slots
+# and the columns of those slots. Every record is framed with its length and CRC32, so a
+# record torn by a crash is detected and ignored; generations let records already folded
+# into a newer snapshot be skipped. Columns are stored in native byte order.
+SNAPSHOT_FILE = 'snapshot.bin'
+LOG_FILE = 'changes.log'
+MAGIC = b'AVSL' if sys.byteorder == 'little' else b'AVSB'
+RECORD_FRAME = struct.Struct('!II')
+STATE_HEADER = struct.Struct('!4sQdIddIIII')
+MIN_COMPACT_BYTES = 1024 * 1024
+COLUMN_TYPES = (('last_seen', 'd'), ('down_since', 'd'), ('thresholds', 'I'), ('groups', 'H'))
+
+
+class Settings(NamedTuple):
+    """
+    The server-wide settings saved with the host records.
+    """
+    default_threshold: int
+    snooze_start_time: Optional[float]
+    snooze_duration: float
+
+
+class SavedState(NamedTuple):
+    """
+    The state read back from disk, in the column layout of HostRegistry.
+    """
+    saved_at: float
+    settings: Settings
+    names: List[str]
+    group_names: List[str]
+    last_seen: array
+    down_since: array
+    thresholds: array
+    offline: bytearray
+    groups: array
+
+
+def pack_strings(strings: List[str]) -> bytes:
+    encoded = [string.encode() for string in strings]
+    return array('H', map(len, encoded)).tobytes() + b''.join(encoded)
+
+
+def unpack_strings(data: memoryview, offset: int, count: int) -> Tuple[List[str], int]:
+    lengths = array('H')
+    lengths.frombytes(data[offset:offset + 2 * count])
+    offset += 2 * count
+    blob = bytes(data[offset:offset + sum(lengths)])
+    ends = list(accumulate(lengths))
+    strings = [blob[end - length:end].decode() for end, length in zip(ends, lengths)]
+    return strings, offset + len(blob)
+
+
+def encode_record(registry: HostRegistry, settings: Settings, generation: int, slots: List[int],
+                  first_host: int, first_group: int) -> bytes:
+    """
+    Encodes the records of some hosts, with the names added since `first_host` and the
+    groups added since `first_group`.
+
+    Args:
+        registry (HostRegistry): The registry to save from.
+        settings (Settings): The server-wide settings.
+        generation (int): The generation of the record.
+        slots (List[int]): The slots to save.
+        first_host (int): The number of host names already saved.
+        first_group (int): The number of group names already saved.
+
+    Returns:
+        bytes: The record, without its frame.
+    """
+    snooze = math.nan if settings.snooze_start_time is None else settings.snooze_start_time
+    new_groups = registry.group_names[first_group:]
+    new_names = registry.names[first_host:]
+    parts = [STATE_HEADER.pack(MAGIC, generation, time.time(), settings.default_threshold, snooze,
+                               settings.snooze_duration, len(registry.names), len(new_groups),
+                               len(new_names), len(slots)),
+             pack_strings(new_groups), pack_strings(new_names), array('I', slots).tobytes()]
+    if len(slots) == len(registry.names):
+        # Full snapshot: the columns can be written as they are
+        parts.extend(getattr(registry, name).tobytes() for name, _ in COLUMN_TYPES)
+        parts.append(bytes(registry.offline))
+    else:
+        for name, typecode in COLUMN_TYPES:
+            column = getattr(registry, name)
+            parts.append(array(typecode, [column[slot] for slot in slots]).tobytes())
+        parts.append(bytes(registry.offline[slot] for slot in slots))
+    return b''.join(parts)
+
+
+def apply_record(state: SavedState, data: bytes) -> Tuple[SavedState, int]:
+    """
+    Applies one record to the state read so far.
+
+    Args:
+        state (SavedState): The state before the record, or None for the first record.
+        data (bytes): The record, without its frame.
+
+    Returns:
+        Tuple[SavedState, int]: The updated state and the generation of the record.
+
+    Raises:
+        ValueError: If the record was not written by this version on this platform.
+    """
+    view = memoryview(data)
+    (magic, generation, saved_at, default_threshold, snooze, snooze_duration, host_count, group_count,
+     name_count, slot_count) = STATE_HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("Unknown state format or byte order")
+    offset = STATE_HEADER.size
+    new_groups, offset = unpack_strings(view, offset, group_count)
+    new_names, offset = unpack_strings(view, offset, name_count)
+    settings = Settings(default_threshold, None if math.isnan(snooze) else snooze, snooze_duration)
+
+    if state is None:
+        state = SavedState(saved_at, settings, [], [], array('d'), array('d'), array('I'), bytearray(),
+                           array('H'))
+    state.group_names.extend(new_groups)
+    state.names.extend(new_names)
+    grow = host_count - len(state.offline)
+    if grow > 0:
+        for name, typecode in COLUMN_TYPES:
+            getattr(state, name).frombytes(bytes(grow * array(typecode).itemsize))
+        state.offline.extend(bytes(grow))
+
+    slots = array('I')
+    slots.frombytes(view[offset:offset + 4 * slot_count])
+    offset += 4 * slot_count
+    full = slot_count == host_count and name_count == host_count
+    for name, typecode in COLUMN_TYPES:
+        values = array(typecode)
+        size = values.itemsize * slot_count
+        values.frombytes(view[offset:offset + size])
+        offset += size
+        if full:
+            getattr(state, name)[:] = values
+        else:
+            column = getattr(state, name)
+            for slot, value in zip(slots, values):
+                column[slot] = value
+    flags = view[offset:offset + slot_count]
+    if full:
+        state.offline[:] = flags
+    else:
+        for slot, flag in zip(slots, flags):
+            state.offline[slot] = flag
+    return state._replace(saved_at=saved_at, settings=settings), generation
+
+
+def read_records(path: str):
+    """
+    Yields the framed records of a file up to the first torn or corrupt one.
+
+    Args:
+        path (str): The file to read.
+
+    Yields:
+        Tuple[bytes, int]: Each record and the file offset just past it.
+    """
+    with open(path, 'rb') as state_file:
+        data = state_file.read()
+    offset = 0
+    while offset + RECORD_FRAME.size <= len(data):
+        length, checksum = RECORD_FRAME.unpack_from(data, offset)
+        start = offset + RECORD_FRAME.size
+        record = data[start:start + length]
+        if len(record) != length or zlib.crc32(record) != checksum:
+            logging.warning(f"Ignoring a torn or corrupt record at offset {offset} of {path}.")
+            return
+        offset = start + length
+        yield record, offset
+
+
+def frame(record: bytes) -> bytes:
+    return RECORD_FRAME.pack(len(record), zlib.crc32(record)) + record
+
+
+class StateStore:
+    """
+    Persists the host registry and server settings in a directory: each save appends the
+    hosts changed since the previous save to the change log, and once the log grows larger
+    than the snapshot it is folded into a new snapshot. Encoding happens on the caller's
+    thread, which must own the registry; the file writes are blocking and can be run in an
+    executor.
+    """
+
+    def __init__(self, directory: str, min_compact_bytes: int = MIN_COMPACT_BYTES) -> None:
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.min_compact_bytes = min_compact_bytes
+        self.generation = 0
+        self.saved_hosts = 0
+        self.saved_groups = 1
+        self.snapshot_size = 0
+        self.log_size = 0
+
+    def load(self) -> Optional[SavedState]:
+        """
+        Reads the snapshot and replays the change log.
+
+        Returns:
+            Optional[SavedState]: The saved state, or None if nothing was saved yet.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        state = None
+        snapshot_generation = 0
+        if os.path.exists(self.snapshot_path):
+            for record, offset in read_records(self.snapshot_path):
+                state, snapshot_generation = apply_record(None, record)
+                self.snapshot_size = offset
+        self.generation = snapshot_generation
+
+        valid_size = 0
+        if os.path.exists(self.log_path):
+            for record, offset in read_records(self.log_path):
+                valid_size = offset
+                generation = STATE_HEADER.unpack_from(record)[1]
+                if state is None or generation <= snapshot_generation:
+                    # The snapshot the log builds on is missing, or the record is already in it
+                    continue
+                state, self.generation = apply_record(state, record)
+            # Drop a torn tail so that new records are appended after the last valid one
+            with open(self.log_path, 'r+b') as log_file:
+                log_file.truncate(valid_size)
+        self.log_size = valid_size
+
+        if state is not None:
+            self.saved_hosts = len(state.names)
+            self.saved_groups = len(state.group_names)
+        return state
+
+    def prepare(self, registry: HostRegistry, settings: Settings) -> Tuple[bytes, bool]:
+        """
+        Encodes the changes since the previous save, or a full snapshot when it is due.
+
+        Args:
+            registry (HostRegistry): The registry to save.
+            settings (Settings): The server-wide settings.
+
+        Returns:
+            Tuple[bytes, bool]: The framed record and whether it is a snapshot.
+        """
+        changed = registry.take_changes()
+        self.generation += 1
+        compact = self.log_size > max(self.snapshot_size, self.min_compact_bytes) or not self.snapshot_size
+        if compact:
+            record = encode_record(registry, settings, self.generation, list(range(len(registry.names))), 0, 0)
+        else:
+            record = encode_record(registry, settings, self.generation, changed, self.saved_hosts,
+                                   self.saved_groups)
+        self.saved_hosts = len(registry.names)
+        self.saved_groups = len(registry.group_names)
+        return frame(record), compact
+
+    def write(self, record: bytes, compact: bool) -> None:
+        """
+        Writes a record returned by prepare and syncs it to disk.
+
+        Args:
+            record (bytes): The framed record.
+            compact (bool): Whether it is a snapshot, which replaces the snapshot file and
+                empties the change log.
+        """
+        try:
+            self._write(record, compact)
+        except OSError:
+            # The changes in the record are lost from the log; make the next save a snapshot
+            self.snapshot_size = 0
+            raise
+
+    def _write(self, record: bytes, compact: bool) -> None:
+        if compact:
+            temporary = self.snapshot_path + '.tmp'
+            with open(temporary, 'wb') as snapshot_file:
+                snapshot_file.write(record)
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            os.replace(temporary, self.snapshot_path)
+            self._sync_directory()
+            with open(self.log_path, 'wb'):
+                pass
+            self.snapshot_size = len(record)
+            self.log_size = 0
+        else:
+            with open(self.log_path, 'ab') as log_file:
+                log_file.write(record)
+                log_file.flush()
+                os.fsync(log_file.fileno())
+            self.log_size += len(record)
+
+    def save(self, registry: HostRegistry, settings: Settings) -> None:
+        """
+        Prepares and writes one record on the calling thread.
+        """
+        self.write(*self.prepare(registry, settings))
+
+    def _sync_directory(self) -> None:
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        descriptor = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
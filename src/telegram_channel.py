@@ -0,0 +1,47 @@
+from typing import Mapping
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from notifications import NotificationChannel
+
+
+class TelegramChannel(NotificationChannel):
+    """
+    Sends notifications as Telegram messages through one long-lived Bot instance.
+    """
+    name = 'telegram'
+    rate = 20 / 60
+    burst = 5
+
+    def __init__(self, token: str, chat_id: str, base_url: str = None) -> None:
+        request = HTTPXRequest(connection_pool_size=2)
+        if base_url:
+            self.bot = Bot(token, base_url=base_url, request=request)
+        else:
+            self.bot = Bot(token, request=request)
+        self.chat_id = chat_id
+
+    async def start(self) -> None:
+        await self.bot.initialize()
+
+    async def send(self, title: str, body: str) -> None:
+        await self.bot.send_message(chat_id=self.chat_id, text=f'{title} {body}')
+
+    async def close(self) -> None:
+        await self.bot.shutdown()
+
+
+def create_channel(env: Mapping[str, str]) -> TelegramChannel:
+    """
+    Creates the Telegram channel from TELEGRAM_BOT_TOKEN, TELEGRAM_ID_TO_NOTIFY and the
+    optional TELEGRAM_API_URL.
+
+    Args:
+        env (Mapping[str, str]): The settings, usually os.environ.
+    """
+    token = env.get('TELEGRAM_BOT_TOKEN')
+    chat_id = env.get('TELEGRAM_ID_TO_NOTIFY')
+    if not token or not chat_id:
+        raise ValueError("TELEGRAM_BOT_TOKEN and TELEGRAM_ID_TO_NOTIFY must be set")
+    return TelegramChannel(token, chat_id, env.get('TELEGRAM_API_URL'))
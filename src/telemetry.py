@@ -0,0 +1,237 @@
+import os
+import math
+import shutil
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from protocol import GAUGE_NAMES
+
+# Gauges measured as a percentage, shown with a % sign
+PERCENT_GAUGES = frozenset(('memory', 'disk', 'swap'))
+
+
+def read_gauges(names: Iterable[str], disk_path: str = '/') -> List[Tuple[int, float]]:
+    """
+    Measures the given gauges of this host. Gauges that cannot be measured here, e.g.
+    memory outside Linux, are left out.
+
+    Args:
+        names (Iterable[str]): Names from GAUGE_NAMES.
+        disk_path (str, optional): The file system the disk gauge measures. Defaults to /.
+
+    Returns:
+        List[Tuple[int, float]]: Pairs of a gauge id and its value, as sent in heartbeats.
+    """
+    meminfo = None
+    gauges = []
+    for name in names:
+        value = None
+        if name == 'load' and hasattr(os, 'getloadavg'):
+            value = os.getloadavg()[0]
+        elif name == 'disk':
+            usage = shutil.disk_usage(disk_path)
+            value = 100.0 * usage.used / usage.total if usage.total else None
+        elif name in ('memory', 'swap'):
+            if meminfo is None:
+                meminfo = read_meminfo()
+            total, free = ('MemTotal', 'MemAvailable') if name == 'memory' else ('SwapTotal', 'SwapFree')
+            if meminfo.get(total) and free in meminfo:
+                value = 100.0 * (meminfo[total] - meminfo[free]) / meminfo[total]
+        if value is not None:
+            gauges.append((GAUGE_NAMES.index(name), value))
+    return gauges
+
+
+def read_meminfo() -> Dict[str, int]:
+    """
+    Returns the fields of /proc/meminfo in kB, or an empty dict where it does not exist.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            return {name: int(value.split()[0]) for name, value in (line.split(':', 1) for line in f)}
+    except (OSError, ValueError, IndexError):
+        return {}
+
+
+def parse_limits(text: str) -> Dict[str, float]:
+    """
+    Parses gauge alert limits such as "disk>90,memory>95,load>8".
+
+    Returns:
+        Dict[str, float]: The limit of each gauge named.
+
+    Raises:
+        ValueError: If an entry is malformed or names an unknown gauge.
+    """
+    limits = {}
+    for entry in filter(None, (entry.strip() for entry in text.split(','))):
+        name, separator, limit = entry.partition('>')
+        name = name.strip()
+        if not separator or name not in GAUGE_NAMES:
+            raise ValueError(f"Invalid gauge limit {entry!r}, expected e.g. disk>90 with a gauge of "
+                             f"{', '.join(GAUGE_NAMES)}")
+        limits[name] = float(limit)
+    return limits
+
+
+def format_gauge(name: str, value: float) -> str:
+    return f"{value:.1f}%" if name in PERCENT_GAUGES else f"{value:.2f}"
+
+
+class Rollup(NamedTuple):
+    """
+    The minimum, maximum and average of one gauge of a host over a period.
+    """
+    minimum: float
+    maximum: float
+    average: float
+    count: int
+
+
+class GaugeAlert(NamedTuple):
+    """
+    A gauge of a host that went over its limit, or back under it.
+    """
+    gauge: str
+    value: float
+    limit: float
+    over: bool
+
+
+class TelemetryStore:
+    """
+    Keeps the gauges reported by hosts as rollups in fixed time buckets, so that memory
+    does not grow with the heartbeat rate or with time.
+
+    Each host that reports gauges gets a ring of `buckets` buckets of `bucket_seconds`
+    seconds per gauge. A bucket holds the minimum, maximum, sum and count of the values
+    received during its period and is reused once the ring wraps around. Like the
+    registry, everything is stored in flat typed arrays indexed by a host index, which
+    costs about 80 bytes per bucket and host for the four gauges.
+    """
+
+    def __init__(self, buckets: int = 12, bucket_seconds: int = 300, limits: Dict[str, float] = None) -> None:
+        """
+        Args:
+            buckets (int, optional): Buckets kept per gauge. Defaults to 12.
+            bucket_seconds (int, optional): The period of a bucket. Defaults to 300.
+            limits (Dict[str, float], optional): Values above which a gauge alerts, by name.
+        """
+        self.buckets = buckets
+        self.bucket_seconds = bucket_seconds
+        self.limits = [(limits or {}).get(name, math.inf) for name in GAUGE_NAMES]
+        self._index = {}
+        # Per host and bucket position: the period number of the bucket, plus one, or 0
+        self.periods = array('I')
+        # Per host, gauge and bucket position
+        self.minimum = array('f')
+        self.maximum = array('f')
+        self.total = array('d')
+        self.count = array('I')
+        # Per host and gauge
+        self.latest = array('f')
+        self.alerting = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _host_index(self, host_id: str) -> int:
+        index = self._index.get(host_id)
+        if index is None:
+            index = self._index[host_id] = len(self._index)
+            gauges = len(GAUGE_NAMES)
+            cells = gauges * self.buckets
+            self.periods.extend([0] * self.buckets)
+            self.minimum.extend([0.0] * cells)
+            self.maximum.extend([0.0] * cells)
+            self.total.extend([0.0] * cells)
+            self.count.extend([0] * cells)
+            self.latest.extend([math.nan] * gauges)
+            self.alerting.extend(bytes(gauges))
+        return index
+
+    def record(self, host_id: str, now: float, gauges: Iterable[Tuple[int, float]]) -> List[GaugeAlert]:
+        """
+        Adds the gauges of one heartbeat.
+
+        Args:
+            host_id (str): The client identity of the host.
+            now (float): The time the heartbeat was received.
+            gauges (Iterable[Tuple[int, float]]): Pairs of a gauge id and its value. Unknown
+                ids and values that are not finite are ignored.
+
+        Returns:
+            List[GaugeAlert]: The gauges that went over or back under their limit.
+        """
+        host = self._host_index(host_id)
+        period = int(now // self.bucket_seconds) + 1
+        position = period % self.buckets
+        if self.periods[host * self.buckets + position] != period:
+            self.periods[host * self.buckets + position] = period
+            for gauge in range(len(GAUGE_NAMES)):
+                self.count[(host * len(GAUGE_NAMES) + gauge) * self.buckets + position] = 0
+        alerts = []
+        for gauge, value in gauges:
+            if gauge >= len(GAUGE_NAMES) or not math.isfinite(value):
+                continue
+            cell = (host * len(GAUGE_NAMES) + gauge) * self.buckets + position
+            if self.count[cell]:
+                self.minimum[cell] = min(self.minimum[cell], value)
+                self.maximum[cell] = max(self.maximum[cell], value)
+                self.total[cell] += value
+                self.count[cell] += 1
+            else:
+                self.minimum[cell] = self.maximum[cell] = self.total[cell] = value
+                self.count[cell] = 1
+            self.latest[host * len(GAUGE_NAMES) + gauge] = value
+            over = value > self.limits[gauge]
+            if over != self.alerting[host * len(GAUGE_NAMES) + gauge]:
+                self.alerting[host * len(GAUGE_NAMES) + gauge] = over
+                alerts.append(GaugeAlert(GAUGE_NAMES[gauge], value, self.limits[gauge], over))
+        return alerts
+
+    def latest_values(self, host_id: str) -> Dict[str, float]:
+        """
+        Returns the last value received of each gauge of a host, by name.
+        """
+        host = self._index.get(host_id)
+        if host is None:
+            return {}
+        start = host * len(GAUGE_NAMES)
+        return {name: value for name, value in zip(GAUGE_NAMES, self.latest[start:start + len(GAUGE_NAMES)])
+                if not math.isnan(value)}
+
+    def rollup(self, host_id: str, gauge: str, now: float) -> Optional[Rollup]:
+        """
+        Rolls up one gauge of a host over the buckets still in the ring at `now`.
+
+        Returns:
+            Optional[Rollup]: The rollup, or None if no value was received in that time.
+        """
+        host = self._index.get(host_id)
+        if host is None:
+            return None
+        oldest = int(now // self.bucket_seconds) + 2 - self.buckets
+        start = (host * len(GAUGE_NAMES) + GAUGE_NAMES.index(gauge)) * self.buckets
+        minimum, maximum, total, count = math.inf, -math.inf, 0.0, 0
+        for position in range(self.buckets):
+            cell = start + position
+            if self.periods[host * self.buckets + position] < oldest or not self.count[cell]:
+                continue
+            minimum = min(minimum, self.minimum[cell])
+            maximum = max(maximum, self.maximum[cell])
+            total += self.total[cell]
+            count += self.count[cell]
+        return Rollup(minimum, maximum, total / count, count) if count else None
+
+    def over_limits(self) -> Dict[str, List[str]]:
+        """
+        Returns the gauges over their limit, by host.
+        """
+        over = {}
+        for host_id, host in self._index.items():
+            names = [name for gauge, name in enumerate(GAUGE_NAMES)
+                     if self.alerting[host * len(GAUGE_NAMES) + gauge]]
+            if names:
+                over[host_id] = names
+        return over
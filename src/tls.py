@@ -0,0 +1,75 @@
+import ssl
+from typing import Optional
+
+# Heartbeat connections are short and frequent, so a full TLS handshake per connection
+# would dominate the server's CPU time. Clients therefore keep the session ticket of their
+# last connection and offer it on the next one, which the server resumes with an
+# abbreviated handshake. With TLS 1.3, tickets are sent by the server after the
+# handshake, so a client must read from the connection before the ticket is available.
+
+
+class ResumingContext(ssl.SSLContext):
+    """
+    A client context that offers the most recently remembered session on every new
+    connection, both for blocking sockets and for asyncio connections.
+    """
+    session: Optional[ssl.SSLSession] = None
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        return super().wrap_socket(sock, server_side, do_handshake_on_connect, suppress_ragged_eofs,
+                                   server_hostname, session or self.session)
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session or self.session)
+
+    def remember(self, ssl_object) -> None:
+        """
+        Keeps the session of a connection for the next one, if the server issued a ticket.
+
+        Args:
+            ssl_object (ssl.SSLSocket or ssl.SSLObject): The connection, or None for a plain one.
+        """
+        session = getattr(ssl_object, 'session', None)
+        if session is not None and session.has_ticket:
+            self.session = session
+
+
+def create_client_context(ca_file: str = None) -> ResumingContext:
+    """
+    Creates the TLS context of a heartbeat client. The server certificate and host name
+    are verified.
+
+    Args:
+        ca_file (str, optional): The CA certificates to trust, e.g. a self-signed server
+            certificate. Defaults to the system trust store.
+
+    Returns:
+        ResumingContext: The context.
+    """
+    context = ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    if ca_file:
+        context.load_verify_locations(ca_file)
+    else:
+        context.load_default_certs()
+    return context
+
+
+def create_server_context(cert_file: str, key_file: str = None) -> ssl.SSLContext:
+    """
+    Creates the TLS context of the heartbeat server. Session tickets are issued, so that
+    clients can resume their sessions. Must be created before heartbeat workers are
+    forked, so that all workers share the ticket key and resume each other's sessions.
+
+    Args:
+        cert_file (str): The server certificate chain in PEM format.
+        key_file (str, optional): The private key, if not in the certificate file.
+
+    Returns:
+        ssl.SSLContext: The context.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(cert_file, key_file)
+    return context
@@ -0,0 +1,91 @@
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from admission import ConnectionLimiter, SourceLimiter
+
+
+class TestConnectionLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_waiting_connection_gets_released_slot(self):
+        # Arrange
+        limiter = ConnectionLimiter(1, wait=1.0)
+        await limiter.acquire()
+
+        # Act
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        limiter.release()
+        admitted = await waiting
+
+        # Assert
+        self.assertTrue(admitted)
+        self.assertEqual(limiter.active, 1)
+        self.assertEqual(len(limiter.waiters), 0)
+
+    async def test_refuses_when_queue_is_full_or_wait_runs_out(self):
+        # Arrange
+        limiter = ConnectionLimiter(1, wait=0.05, max_waiting=1)
+        await limiter.acquire()
+
+        # Act
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        overflow = await limiter.acquire()
+        timed_out = await waiting
+        limiter.release()
+
+        # Assert
+        self.assertFalse(overflow)
+        self.assertFalse(timed_out)
+        self.assertEqual(limiter.active, 0)
+        self.assertEqual(len(limiter.waiters), 0)
+
+    async def test_cancelled_waiter_does_not_leak_a_slot(self):
+        # Arrange
+        limiter = ConnectionLimiter(1, wait=1.0)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+
+        # Act
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        limiter.release()
+
+        # Assert
+        self.assertEqual(limiter.active, 0)
+        self.assertTrue(await limiter.acquire())
+
+
+class TestSourceLimiter(unittest.TestCase):
+
+    def test_drops_source_over_its_rate(self):
+        # Arrange
+        limiter = SourceLimiter(rate=1.0, burst=3)
+
+        # Act
+        burst = [limiter.allow('10.0.0.1', now=0.0) for _ in range(4)]
+        other = limiter.allow('10.0.0.2', now=0.0)
+        refilled = limiter.allow('10.0.0.1', now=1.0)
+
+        # Assert
+        self.assertEqual(burst, [True, True, True, False])
+        self.assertTrue(other)
+        self.assertTrue(refilled)
+
+    def test_forgets_least_recently_seen_sources(self):
+        # Arrange
+        limiter = SourceLimiter(rate=1.0, burst=1, max_sources=2)
+        limiter.allow('10.0.0.1', now=0.0)
+        limiter.allow('10.0.0.2', now=0.0)
+
+        # Act
+        limiter.allow('10.0.0.1', now=0.0)
+        limiter.allow('10.0.0.3', now=0.0)
+
+        # Assert
+        self.assertEqual(list(limiter.buckets), ['10.0.0.1', '10.0.0.3'])
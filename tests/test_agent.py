@@ -0,0 +1,172 @@
+import os
+import sys
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from agent import Identity, OneshotSender, ReconnectBackoff, StreamSender, load_identities, parse_identity, \
+    run_identity
+from protocol import decode_binary_heartbeat, read_frame
+
+
+class RecordingSender:
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.times = []
+        self.messages = []
+
+    async def send(self, data):
+        self.times.append(self.loop.time())
+        self.messages.append(data)
+        await asyncio.sleep(0.02)  # A slow send must not delay later heartbeats
+        return True
+
+    def close(self):
+        pass
+
+
+class TestIdentities(unittest.TestCase):
+
+    def test_parse_identity(self):
+        # Act
+        plain = parse_identity('web1', b'default')
+        service = parse_identity('db1 key=other check=tcp:127.0.0.1:5432', b'default')
+
+        # Assert
+        self.assertEqual(plain, Identity('web1', b'default'))
+        self.assertEqual(service, Identity('db1', b'other', ('127.0.0.1', 5432)))
+
+    def test_parse_identity_rejects_bad_specs(self):
+        for spec in ('', 'a:b', 'web1 bogus', 'web1 port=1', 'web1 check=udp:host:1', 'web1 check=tcp:host'):
+            with self.assertRaises(ValueError, msg=spec):
+                parse_identity(spec, b'default')
+
+    def test_load_identities_skips_comments(self):
+        # Arrange
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as identities_file:
+            identities_file.write("# edge box\nweb1\n\ndb1 check=tcp:localhost:5432\n")
+
+        # Act
+        identities = load_identities(identities_file.name, b'default')
+        os.unlink(identities_file.name)
+
+        # Assert
+        self.assertEqual([identity.host_id for identity in identities], ['web1', 'db1'])
+
+
+class TestReconnectBackoff(unittest.TestCase):
+
+    def test_delay_doubles_up_to_maximum_and_resets(self):
+        # Arrange
+        backoff = ReconnectBackoff(1.0, 4.0)
+
+        # Act
+        waits = [backoff.failed(now=0.0) for _ in range(4)]
+        blocked = backoff.ready(now=1.0)
+        backoff.reset()
+
+        # Assert
+        for wait, delay in zip(waits, (1.0, 2.0, 4.0, 4.0)):
+            self.assertTrue(delay / 2 <= wait <= delay)
+        self.assertFalse(blocked)
+        self.assertTrue(backoff.ready(now=0.0))
+        self.assertEqual(backoff.delay, 1.0)
+
+
+class TestRunIdentity(unittest.IsolatedAsyncioTestCase):
+
+    async def test_schedule_is_fixed_rate(self):
+        # Arrange
+        loop = asyncio.get_running_loop()
+        sender = RecordingSender(loop)
+
+        # Act
+        with patch('agent.random.uniform', side_effect=lambda low, high: 0.0):
+            sent = await run_identity(Identity('web1', b'key'), sender, 0.05, iterations=6)
+
+        # Assert
+        self.assertEqual(sent, 6)
+        offsets = [when - sender.times[0] for when in sender.times]
+        for slot, offset in enumerate(offsets):
+            self.assertAlmostEqual(offset, slot * 0.05, delta=0.015)
+
+    async def test_binary_heartbeats_use_increasing_sequence_numbers(self):
+        # Arrange
+        sender = RecordingSender(asyncio.get_running_loop())
+
+        # Act
+        await run_identity(Identity('web1', b'key'), sender, 0.05, heartbeat_format='binary', iterations=3)
+
+        # Assert
+        heartbeats = [decode_binary_heartbeat(message) for message in sender.messages]
+        self.assertEqual({heartbeat.host_id for heartbeat in heartbeats}, {b'web1'})
+        self.assertEqual([heartbeat.sequence - heartbeats[0].sequence for heartbeat in heartbeats], [0, 1, 2])
+
+    async def test_heartbeats_skipped_while_service_is_down(self):
+        # Arrange
+        sender = RecordingSender(asyncio.get_running_loop())
+        probe = await asyncio.start_server(lambda reader, writer: writer.close(), '127.0.0.1', 0)
+        port = probe.sockets[0].getsockname()[1]
+        probe.close()
+        await probe.wait_closed()
+
+        # Act
+        sent = await run_identity(Identity('db1', b'key', ('127.0.0.1', port)), sender, 0.01,
+                                  timeout=0.5, iterations=3)
+
+        # Assert
+        self.assertEqual(sent, 0)
+
+
+class TestSenders(unittest.IsolatedAsyncioTestCase):
+
+    async def test_stream_sender_shares_one_connection(self):
+        # Arrange
+        frames = []
+        connections = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            while (frame := await read_frame(reader)) is not None:
+                frames.append(frame)
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        sender = StreamSender('127.0.0.1', port, 1.0, ReconnectBackoff())
+
+        # Act
+        results = [await sender.send(f'beat{index}'.encode()) for index in range(3)]
+        for _ in range(100):
+            if len(frames) == 3:
+                break
+            await asyncio.sleep(0.01)
+        sender.close()
+        server.close()
+        await server.wait_closed()
+
+        # Assert
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual(frames, [b'beat0', b'beat1', b'beat2'])
+        self.assertEqual(len(connections), 1)
+
+    async def test_unreachable_server_backs_off(self):
+        # Arrange
+        probe = await asyncio.start_server(lambda reader, writer: writer.close(), '127.0.0.1', 0)
+        port = probe.sockets[0].getsockname()[1]
+        probe.close()
+        await probe.wait_closed()
+        backoff = ReconnectBackoff(10.0, 60.0)
+        sender = OneshotSender('127.0.0.1', port, 1.0, backoff)
+
+        # Act
+        first = await sender.send(b'beat')
+        second = await sender.send(b'beat')
+
+        # Assert
+        self.assertFalse(first)
+        self.assertFalse(second)
+        self.assertEqual(backoff.delay, 20.0)
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from alerts import AlertAggregator, alert_group_of
+from ratelimit import TokenBucket
+
+
+class TestAlertGroups(unittest.TestCase):
+
+    def test_tagged_host_grouped_by_tag(self):
+        self.assertEqual(alert_group_of('paris/web01', ('10.0.0.5', 4000)), 'paris')
+
+    def test_untagged_host_grouped_by_subnet(self):
+        self.assertEqual(alert_group_of('web01', ('10.0.7.5', 4000), 'subnet'), '10.0.7.0/24')
+        self.assertEqual(alert_group_of('web01', ('10.0.7.5', 4000), 'tag'), '')
+        self.assertEqual(alert_group_of('web01', None, 'subnet'), '')
+
+
+class TestAlertAggregator(unittest.IsolatedAsyncioTestCase):
+
+    async def test_single_host_keeps_its_message(self):
+        # Arrange
+        send = MagicMock()
+        aggregator = AlertAggregator(send, window=0.01)
+
+        # Act
+        aggregator.add('down', '', 'alpha', "alpha is down!", "Downtime: 0:01:00", "0:01:00")
+        await asyncio.sleep(0.05)
+
+        # Assert
+        send.assert_called_once_with("alpha is down!", "Downtime: 0:01:00")
+
+    async def test_mass_outage_sent_as_one_digest_per_group(self):
+        # Arrange
+        send = MagicMock()
+        aggregator = AlertAggregator(send, window=0.01, list_limit=2)
+
+        # Act
+        for index in range(3):
+            aggregator.add('down', 'paris', f'paris/web{index}', "t", "b", "0:01:00")
+        aggregator.add('down', 'lyon', 'lyon/db', "lyon/db is down!", "Downtime: 0:01:00", "0:01:00")
+        await asyncio.sleep(0.05)
+
+        # Assert
+        self.assertEqual(send.call_count, 2)
+        send.assert_any_call("3 hosts in paris are down!",
+                             "paris/web0 (0:01:00), paris/web1 (0:01:00) and 1 more.")
+        send.assert_any_call("lyon/db is down!", "Downtime: 0:01:00")
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_bucket_limits_burst_and_refills(self):
+        # Arrange
+        bucket = TokenBucket(rate=2, capacity=2, now=0.0)
+
+        # Act / Assert
+        self.assertTrue(bucket.consume(now=0.0))
+        self.assertTrue(bucket.consume(now=0.0))
+        self.assertFalse(bucket.consume(now=0.0))
+        self.assertAlmostEqual(bucket.delay(now=0.0), 0.5)
+        self.assertTrue(bucket.consume(now=0.5))
+        self.assertFalse(bucket.consume(now=0.5))
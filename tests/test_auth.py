@@ -0,0 +1,75 @@
+import os
+import sys
+import hmac
+import hashlib
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from auth import REPLAY_WINDOW, Keyring, ReplayGuard
+
+
+def sign(key: bytes, message: bytes) -> bytes:
+    return hmac.new(key, message, hashlib.sha256).digest()
+
+
+class TestKeyring(unittest.TestCase):
+
+    def test_unknown_host_uses_default_key(self):
+        # Arrange
+        keyring = Keyring(b'defaultkey')
+
+        # Act / Assert
+        self.assertTrue(keyring.verify('alpha', b'message', sign(b'defaultkey', b'message')))
+        self.assertFalse(keyring.verify('alpha', b'message', sign(b'otherkey', b'message')))
+
+    def test_rotation_accepts_old_and_new_key(self):
+        # Arrange
+        keyring = Keyring(b'defaultkey')
+
+        # Act
+        keyring.set_keys('alpha', [b'newkey', b'oldkey'])
+
+        # Assert
+        self.assertTrue(keyring.verify('alpha', b'message', sign(b'newkey', b'message')))
+        self.assertTrue(keyring.verify('alpha', b'message', sign(b'oldkey', b'message')))
+        self.assertFalse(keyring.verify('alpha', b'message', sign(b'defaultkey', b'message')))
+
+    def test_load_keyring_file(self):
+        # Arrange
+        with tempfile.NamedTemporaryFile('w', suffix='.keys', delete=False) as keyring_file:
+            keyring_file.write("# host keys\nalpha alphakey\n\nbeta betakey betaold\n")
+        self.addCleanup(os.remove, keyring_file.name)
+        keyring = Keyring()
+
+        # Act
+        keyring.load(keyring_file.name)
+
+        # Assert
+        self.assertEqual(len(keyring), 2)
+        self.assertTrue(keyring.verify('beta', b'message', sign(b'betaold', b'message')))
+        self.assertFalse(keyring.verify('gamma', b'message', sign(b'alphakey', b'message')))
+
+
+class TestReplayGuard(unittest.TestCase):
+
+    def setUp(self):
+        self.guard = ReplayGuard()
+
+    def test_duplicate_sequence_rejected(self):
+        self.assertTrue(self.guard.accept('alpha', 100))
+        self.assertFalse(self.guard.accept('alpha', 100))
+        self.assertTrue(self.guard.accept('beta', 100))
+
+    def test_reordered_sequence_within_window_accepted_once(self):
+        self.assertTrue(self.guard.accept('alpha', 100))
+        self.assertTrue(self.guard.accept('alpha', 98))
+        self.assertFalse(self.guard.accept('alpha', 98))
+        self.assertTrue(self.guard.accept('alpha', 99))
+
+    def test_sequence_older_than_window_rejected(self):
+        self.assertTrue(self.guard.accept('alpha', 1000))
+        self.assertFalse(self.guard.accept('alpha', 1000 - REPLAY_WINDOW))
+        self.assertTrue(self.guard.accept('alpha', 1000 + 10 * REPLAY_WINDOW))
+        self.assertFalse(self.guard.accept('alpha', 1000))
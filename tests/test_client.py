@@ -1,18 +1,39 @@
 import os
 import socket
+import subprocess
 import sys
 import hmac
 import hashlib
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch, MagicMock
 
 sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '../src')))
-from client import generate_heartbeat, send_heartbeat_periodically
+from client import generate_heartbeat, initialize_heartbeat_client, send_heartbeat_periodically, send_heartbeat_datagrams
+from protocol import GAUGE_NAMES, decode_binary_heartbeat, decode_gauges
+from tls import create_client_context, create_server_context
+from test_tls import make_self_signed_certificate
 
 
 class TestClient(unittest.TestCase):
 
+    @patch('client.secret_key', b'supersecretkey')
+    @patch('client.heartbeat_format', 'binary')
+    @patch('client.telemetry_gauges', ['load', 'disk'])
+    def test_generate_heartbeat_with_telemetry(self):
+        # Act
+        heartbeat = decode_binary_heartbeat(generate_heartbeat())
+
+        # Assert
+        gauges = dict(decode_gauges(heartbeat.gauges))
+        self.assertIn(GAUGE_NAMES.index('disk'), gauges)
+        self.assertTrue(0 <= gauges[GAUGE_NAMES.index('disk')] <= 100)
+        self.assertTrue(set(gauges) <= {GAUGE_NAMES.index('load'), GAUGE_NAMES.index('disk')})
+        expected = hmac.new(b'supersecretkey', heartbeat.signed, hashlib.sha256).digest()
+        self.assertEqual(bytes(heartbeat.digest), expected)
+
     @patch('client.secret_key', b'supersecretkey')  # Mock secret key
     @patch('time.time', return_value=1234567890)  # Fixed timestamp for predictability
     def test_generate_heartbeat(self, mock_time):
@@ -81,3 +102,77 @@ class TestClient(unittest.TestCase):
         # Assert
         self.assertIn("Connection timed out. Retrying...", log.output[0], "Should log timeout error")
         
+
+
+    @patch('client.generate_heartbeat', return_value=b'heartbeat:message')
+    @patch('socket.socket')
+    def test_send_heartbeat_datagrams(self, mock_socket, mock_generate_heartbeat):
+        # Arrange
+        mock_socket_instance = mock_socket.return_value.__enter__.return_value
+
+        # Act
+        send_heartbeat_datagrams(0, iterations=2)
+
+        # Assert
+        self.assertEqual(mock_socket_instance.sendto.call_count, 2)
+        self.assertEqual(mock_socket_instance.sendto.call_args[0][0], b'heartbeat:message')
+
+
+class TestClientTls(unittest.TestCase):
+
+    def test_send_heartbeat_periodically_resumes_tls_session(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory:
+            cert_file, key_file = make_self_signed_certificate(directory)
+            server_context = create_server_context(cert_file, key_file)
+            client_context = create_client_context(cert_file)
+        listener = socket.create_server(('127.0.0.1', 0))
+        received = []
+
+        def serve():
+            for _ in range(2):
+                connection, _ = listener.accept()
+                with server_context.wrap_socket(connection, server_side=True) as tls_connection:
+                    received.append((tls_connection.recv(1024), tls_connection.session_reused))
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+
+        # Act
+        with patch('client.tls_context', client_context), patch('client.server_ip', '127.0.0.1'), \
+                patch('client.server_port', listener.getsockname()[1]), \
+                patch('client.generate_heartbeat', return_value=b'heartbeat:message'):
+            send_heartbeat_periodically(0, iterations=2)
+        thread.join(5)
+        listener.close()
+
+        # Assert
+        self.assertEqual(received, [(b'heartbeat:message', False), (b'heartbeat:message', True)])
+
+
+class TestClientStartup(unittest.TestCase):
+
+    def test_import_needs_no_settings(self):
+        # Arrange
+        env = {key: value for key, value in os.environ.items()
+               if key not in ('SERVER_IP', 'SERVER_PORT', 'SECRET_KEY', 'UDP_PORT')}
+        env['PYTHONPATH'] = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+
+        # Act
+        with tempfile.TemporaryDirectory() as directory:
+            result = subprocess.run([sys.executable, '-c', 'import client, agent'], env=env, cwd=directory,
+                                    capture_output=True, text=True, timeout=30)
+            created = os.listdir(directory)
+
+        # Assert
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(created, [])
+
+    def test_startup_rejects_missing_settings(self):
+        # Act
+        with patch.dict(os.environ, {'SECRET_KEY': ''}), patch('sys.stderr'), \
+                self.assertRaises(SystemExit) as raised:
+            initialize_heartbeat_client([])
+
+        # Assert
+        self.assertEqual(raised.exception.code, 2)
@@ -0,0 +1,107 @@
+import os
+import sys
+import asyncio
+import socket
+import unittest
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from cluster import EXPIRE, GAUGES, HEARTBEAT, MAX_BATCH_SIZE, Update, UpdateBatcher, decode_updates, encode_update, \
+    receive_updates, reuseport_socket, start_workers
+
+
+def send_greeting(index, connection, suffix):
+    connection.send_bytes(encode_update(HEARTBEAT, f'worker{index}{suffix}', None, 0.0, index))
+    connection.close()
+
+
+class TestUpdates(unittest.TestCase):
+
+    def test_round_trip(self):
+        # Arrange
+        batch = (encode_update(HEARTBEAT, 'alpha', ('10.0.0.1', 4000), 12.5, 7)
+                 + encode_update(GAUGES, 'alpha', None, 12.5, 7, b'\x02\xff\xc0')
+                 + encode_update(EXPIRE, 'beta', None, 99.0))
+
+        # Act
+        updates = list(decode_updates(batch))
+
+        # Assert
+        self.assertEqual(updates, [Update(HEARTBEAT, 'alpha', ('10.0.0.1', 4000), 12.5, 7),
+                                   Update(GAUGES, 'alpha', None, 12.5, 7, b'\x02\xff\xc0'),
+                                   Update(EXPIRE, 'beta', None, 99.0, 0)])
+
+
+class TestUpdateBatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_updates_are_sent_once_per_loop_iteration(self):
+        # Arrange
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        batcher = UpdateBatcher(sender)
+
+        # Act
+        for index in range(3):
+            batcher.add(HEARTBEAT, f'host{index}', None, 1.0, index)
+        pending = receiver.poll()
+        await asyncio.sleep(0)
+
+        # Assert
+        self.assertFalse(pending)
+        self.assertEqual([update.host_id for update in decode_updates(receiver.recv_bytes())],
+                         ['host0', 'host1', 'host2'])
+        self.assertFalse(receiver.poll())
+
+    async def test_large_batches_are_sent_immediately(self):
+        # Arrange
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        batcher = UpdateBatcher(sender)
+        count = MAX_BATCH_SIZE // len(encode_update(HEARTBEAT, 'host', None, 1.0)) + 1
+
+        # Act
+        for _ in range(count):
+            batcher.add(HEARTBEAT, 'host', None, 1.0)
+
+        # Assert
+        self.assertEqual(len(list(decode_updates(receiver.recv_bytes()))), count)
+
+    async def test_closed_pipe_marks_batcher_broken(self):
+        # Arrange
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        batcher = UpdateBatcher(sender)
+        receiver.close()
+
+        # Act
+        batcher.add(HEARTBEAT, 'host', None, 1.0)
+        await asyncio.wait_for(batcher.broken.wait(), 1)
+
+        # Assert
+        self.assertTrue(batcher.broken.is_set())
+
+
+class TestWorkers(unittest.IsolatedAsyncioTestCase):
+
+    async def test_updates_from_forked_workers_are_received(self):
+        # Arrange
+        connections = start_workers(2, send_greeting, ('!',))
+        received = []
+
+        # Act
+        await asyncio.wait_for(receive_updates(connections, lambda batch: received.extend(decode_updates(batch))), 5)
+
+        # Assert
+        self.assertEqual(sorted(update.host_id for update in received), ['worker0!', 'worker1!'])
+
+    def test_reuseport_sockets_share_a_port(self):
+        # Arrange
+        first = reuseport_socket('127.0.0.1', 0)
+        port = first.getsockname()[1]
+
+        # Act
+        second = reuseport_socket('127.0.0.1', port)
+
+        # Assert
+        self.assertEqual(second.getsockname()[1], port)
+        self.assertEqual(second.type, socket.SOCK_STREAM)
+        first.close()
+        second.close()
@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from deadlines import DeadlineQueue
+
+
+class TestDeadlineQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = DeadlineQueue()
+
+    def test_pop_due_returns_expired_slots_in_order(self):
+        # Arrange
+        self.queue.schedule(0, 30.0)
+        self.queue.schedule(1, 10.0)
+        self.queue.schedule(2, 20.0)
+
+        # Act / Assert
+        self.assertEqual(self.queue.pop_due(25.0), [1, 2])
+        self.assertEqual(self.queue.next_deadline(), 30.0)
+
+    def test_pushed_back_deadline_does_not_fire(self):
+        # Arrange
+        self.queue.schedule(0, 10.0)
+
+        # Act
+        self.queue.schedule(0, 40.0)
+
+        # Assert
+        self.assertEqual(self.queue.pop_due(15.0), [])
+        self.assertEqual(len(self.queue), 1)  # Entry re-queued, not duplicated
+        self.assertEqual(self.queue.pop_due(40.0), [0])
+
+    def test_earlier_deadline_wakes_watchdog(self):
+        # Arrange
+        on_earlier = MagicMock()
+        self.queue.on_earlier = on_earlier
+        self.queue.schedule(0, 50.0)
+        on_earlier.reset_mock()
+
+        # Act
+        self.queue.schedule(0, 20.0)
+
+        # Assert
+        on_earlier.assert_called_once()
+        self.assertEqual(self.queue.pop_due(20.0), [0])
+        self.assertEqual(self.queue.pop_due(60.0), [])
+
+    def test_cancelled_slot_never_fires(self):
+        # Arrange
+        self.queue.schedule(0, 10.0)
+
+        # Act
+        self.queue.cancel(0)
+
+        # Assert
+        self.assertEqual(self.queue.pop_due(100.0), [])
+        self.assertIsNone(self.queue.next_deadline())
@@ -0,0 +1,129 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from history import DAY, GROW_HOSTS, SNAPSHOT_FILE, TRANSITIONS_FILE, HistoryStore
+
+START = 1000 * DAY
+
+
+class TestHistoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.store = HistoryStore(self.path)
+        self.store.open()
+
+    def tearDown(self):
+        if self.store.arrivals is not None:
+            self.store.close()
+        self.directory.cleanup()
+
+    def test_uptime_over_ranges(self):
+        # Arrange
+        self.store.record_up('web1', START)
+        self.store.record_down('web1', START + 100)
+        self.store.record_up('web1', START + 200)
+        self.store.record_down('web1', START + 1000)
+        self.store.record_up('web1', START + 1600)
+
+        # Act
+        whole = self.store.uptime('web1', 0, START + 2000, now=START + 2000)
+        inside = self.store.uptime('web1', START + 150, START + 1100, now=START + 2000)
+        before = self.store.uptime('web1', 0, START - 1, now=START + 2000)
+
+        # Assert
+        self.assertEqual((whole.observed, whole.downtime, whole.outages, whole.longest_outage),
+                         (2000, 700, 2, 600))
+        self.assertAlmostEqual(whole.uptime_percent, 65.0)
+        self.assertEqual((inside.observed, inside.downtime, inside.outages, inside.longest_outage),
+                         (950, 150, 2, 100))
+        self.assertEqual(before.observed, 0)
+        self.assertIsNone(self.store.uptime('unknown', 0, START))
+
+    def test_ongoing_outage_counts_until_now(self):
+        # Arrange
+        self.store.record_up('web1', START)
+        self.store.record_down('web1', START + 100)
+        self.store.record_down('web1', START + 150)  # Already down
+
+        # Act
+        uptime = self.store.uptime('web1', START, START + 10 * DAY, now=START + 400)
+
+        # Assert
+        self.assertEqual((uptime.observed, uptime.downtime, uptime.outages), (400, 300, 1))
+
+    def test_arrival_rollups(self):
+        # Arrange
+        previous = START
+        for offset in (0, 30, 60, 150):
+            self.store.record_arrival('web1', START + offset, previous)
+            previous = START + offset
+        self.store.record_arrival('web1', START + DAY + 10, START + 150)
+        self.store.record_arrival('web1', START + 400 * DAY, START + DAY + 10)
+
+        # Act
+        first_day = self.store.uptime('web1', START, START + DAY - 1, now=START + 500 * DAY)
+        both_days = self.store.uptime('web1', START, START + 2 * DAY - 1, now=START + 500 * DAY)
+        year_later = self.store.uptime('web1', START + 399 * DAY, START + 401 * DAY, now=START + 500 * DAY)
+
+        # Assert
+        self.assertEqual((first_day.heartbeats, first_day.longest_gap), (4, 90))
+        self.assertEqual(both_days.heartbeats, 5)
+        self.assertEqual((year_later.heartbeats, year_later.longest_gap), (1, 0xFFFF))
+
+    def test_history_survives_reopen_and_torn_tail(self):
+        # Arrange
+        for index in range(GROW_HOSTS + 5):
+            self.store.record_up(f'host{index}', START)
+            self.store.record_arrival(f'host{index}', START + 10, START)
+        self.store.record_down('host3', START + 100)
+        self.store.write(*self.store.prepare())
+        self.store.record_up('host3', START + 400)
+        self.store.close()
+        with open(os.path.join(self.path, TRANSITIONS_FILE), 'ab') as transitions_file:
+            transitions_file.write(b'\x00\x00\x00\x20torn')
+
+        # Act
+        self.store = HistoryStore(self.path)
+        self.store.open()
+        uptime = self.store.uptime('host3', START, START + 1000, now=START + 1000)
+        self.store.record_down('host4', START + 500)
+        self.store.close()
+        self.store = HistoryStore(self.path)
+        self.store.open()
+
+        # Assert
+        self.assertEqual(len(self.store), GROW_HOSTS + 5)
+        self.assertEqual((uptime.downtime, uptime.outages, uptime.heartbeats), (300, 1, 1))
+        self.assertEqual(self.store.uptime(f'host{GROW_HOSTS + 4}', START, START + 20, now=START + 20).heartbeats, 1)
+        self.assertEqual(self.store.uptime('host4', START, START + 1000, now=START + 1000).downtime, 500)
+
+    def test_log_compacted_into_snapshot(self):
+        # Arrange
+        store = HistoryStore(self.path, min_compact_bytes=0)
+        store.open()
+        for index in range(100):
+            store.record_up(f'host{index}', START)
+            store.record_down(f'host{index}', START + index)
+        store.write(*store.prepare())
+
+        # Act
+        record, compact = store.prepare()
+        store.write(record, compact)
+        store.record_up('host7', START + 500)
+        store.close()
+        reopened = HistoryStore(self.path)
+        reopened.open()
+        uptime = reopened.uptime('host7', START, START + 1000, now=START + 1000)
+        reopened.close()
+
+        # Assert
+        self.assertTrue(compact)
+        self.assertTrue(os.path.exists(os.path.join(self.path, SNAPSHOT_FILE)))
+        self.assertEqual(len(reopened), 100)
+        self.assertEqual((uptime.downtime, uptime.outages), (493, 1))
@@ -0,0 +1,102 @@
+import atexit
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from logtail import EventRing, tail_lines
+from logsetup import LogSampler, configure_logging
+
+
+class TestTailLines(unittest.TestCase):
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as log_file:
+            log_file.writelines(f"line {index}\n" for index in range(1000))
+        self.path = log_file.name
+        self.addCleanup(os.remove, self.path)
+
+    def test_returns_last_lines_across_blocks(self):
+        # Act
+        lines = tail_lines(self.path, 50, block_size=64)
+
+        # Assert
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(lines[0], "line 950\n")
+        self.assertEqual(lines[-1], "line 999\n")
+
+    def test_short_file_and_zero_count(self):
+        self.assertEqual(len(tail_lines(self.path, 5000)), 1000)
+        self.assertEqual(tail_lines(self.path, 0), [])
+
+
+class TestEventRing(unittest.TestCase):
+
+    def test_ring_keeps_newest_and_filters(self):
+        # Arrange
+        ring = EventRing(size=3)
+
+        # Act
+        ring.record('down', 'alpha is down', 'alpha')
+        ring.record('down', 'beta is down', 'beta')
+        ring.record('up', 'alpha is up', 'alpha')
+        ring.record('invalid', 'bad heartbeat', 'gamma')
+
+        # Assert
+        self.assertEqual(len(ring), 3)
+        self.assertEqual([event.message for event in ring.recent(10)],
+                         ['beta is down', 'alpha is up', 'bad heartbeat'])
+        self.assertEqual([event.message for event in ring.recent(10, host_id='alpha')], ['alpha is up'])
+        self.assertEqual([event.message for event in ring.recent(1, kind='down')], ['beta is down'])
+
+
+class TestLogSampler(unittest.TestCase):
+
+    def test_one_line_per_key_per_interval(self):
+        # Arrange
+        sampler = LogSampler(interval=60)
+
+        # Act / Assert
+        self.assertEqual(sampler.sample('10.0.0.1', now=0.0), 0)
+        self.assertIsNone(sampler.sample('10.0.0.1', now=1.0))
+        self.assertIsNone(sampler.sample('10.0.0.1', now=2.0))
+        self.assertEqual(sampler.sample('10.0.0.2', now=2.0), 0)
+        self.assertEqual(sampler.sample('10.0.0.1', now=61.0), 2)
+
+    def test_table_size_is_bounded(self):
+        # Arrange
+        sampler = LogSampler(interval=60, max_keys=10)
+
+        # Act
+        for index in range(25):
+            sampler.sample(index, now=0.0)
+
+        # Assert
+        self.assertLessEqual(len(sampler._next), 10)
+
+
+class TestConfigureLogging(unittest.TestCase):
+
+    def test_async_logging_writes_from_listener_and_rotates(self):
+        # Arrange
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'test_log.txt')
+        logger = logging.getLogger()
+        handlers = list(logger.handlers)
+        self.addCleanup(setattr, logger, 'handlers', handlers)
+
+        # Act
+        listener = configure_logging(path, 'async', max_bytes=2000, backup_count=2)
+        for index in range(200):
+            logging.warning(f"record {index}")
+        listener.stop()
+        atexit.unregister(listener.stop)
+        logger.removeHandler(logger.handlers[-1])
+
+        # Assert
+        self.assertTrue(os.path.exists(path + '.1'))
+        self.assertIn("record 199", ''.join(tail_lines(path, 1)))
+        self.assertLessEqual(os.path.getsize(path), 2000)
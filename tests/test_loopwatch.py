@@ -0,0 +1,101 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from loopwatch import LoopWatchdog, format_profile, sample_stacks, summarize_profile
+
+
+def hog_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+def spin(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestLoopWatchdog(unittest.IsolatedAsyncioTestCase):
+
+    async def test_blocking_callback_reported_with_task_and_stack(self):
+        # Arrange
+        stalls = []
+        watchdog = LoopWatchdog(0.05, stalls.append)
+        watchdog.start()
+
+        async def slow_handler():
+            hog_the_loop(0.3)
+
+        # Act
+        await asyncio.create_task(slow_handler(), name='slow-handler')
+        for _ in range(100):
+            if stalls:
+                break
+            await asyncio.sleep(0.01)
+        watchdog.stop()
+
+        # Assert
+        self.assertEqual(len(stalls), 1)
+        self.assertGreaterEqual(stalls[0].duration, 0.25)
+        self.assertIn('slow-handler', stalls[0].task)
+        self.assertIn('slow_handler', stalls[0].task)
+        self.assertIn('hog_the_loop', stalls[0].stack)
+
+    async def test_responsive_loop_reports_no_stall_but_measures_lag(self):
+        # Arrange
+        stalls = []
+        watchdog = LoopWatchdog(0.05, stalls.append)
+
+        # Act
+        watchdog.start()
+        await asyncio.sleep(0.3)
+        watchdog.stop()
+
+        # Assert
+        self.assertEqual(stalls, [])
+        self.assertLess(watchdog.take_max_lag(), 0.05)
+        self.assertEqual(watchdog.take_max_lag(), 0.0)
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_busy_function_is_on_top(self):
+        # Arrange
+        stop = threading.Event()
+        thread = threading.Thread(target=spin, args=(stop,))
+        thread.start()
+
+        # Act
+        samples, own, total = sample_stacks(thread.ident, 0.3, 0.002)
+        stop.set()
+        thread.join()
+        entries = summarize_profile(samples, own, total, 3)
+        report = format_profile(entries, samples, 0.3)
+
+        # Assert
+        self.assertGreater(samples, 10)
+        self.assertEqual([entry.function.split()[0] for entry in entries][:1], ['spin'])
+        self.assertTrue(all(0 < entry.own <= entry.total <= 1 for entry in entries))
+        self.assertTrue(report.startswith(f'{samples} samples over 0.3s.'))
+        self.assertIn('spin (tests/test_loopwatch.py:17)', report)
+
+    def test_finished_thread_gives_empty_profile(self):
+        # Arrange
+        thread = threading.Thread(target=lambda: None)
+        thread.start()
+        thread.join()
+
+        # Act
+        samples, own, total = sample_stacks(thread.ident, 0.1)
+
+        # Assert
+        self.assertEqual(samples, 0)
+        self.assertEqual(summarize_profile(samples, own, total, 5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
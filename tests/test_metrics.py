@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from metrics import MetricsRegistry
+from httpd import HttpResponse, start_http_server
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_with_labels(self):
+        # Arrange
+        counter = self.registry.counter('heartbeats_total', 'Heartbeats.', ['result'])
+
+        # Act
+        counter.inc(labels=('accepted',))
+        counter.inc(labels=('accepted',))
+        counter.inc(labels=('stale',))
+
+        # Assert
+        text = self.registry.render()
+        self.assertIn('# TYPE heartbeats_total counter', text)
+        self.assertIn('heartbeats_total{result="accepted"} 2', text)
+        self.assertIn('heartbeats_total{result="stale"} 1', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        # Arrange
+        histogram = self.registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+
+        # Act
+        for value in (0.05, 0.5, 0.7, 5.0):
+            histogram.observe(value)
+
+        # Assert
+        text = self.registry.render()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_count 4', text)
+
+    def test_gauge_callback_evaluated_on_render(self):
+        # Arrange
+        depth = {'telegram': 3}
+        self.registry.gauge('queue_depth', 'Depth.', ['channel'],
+                            callback=lambda: {(name,): size for name, size in depth.items()})
+
+        # Act
+        depth['telegram'] = 5
+
+        # Assert
+        self.assertIn('queue_depth{channel="telegram"} 5', self.registry.render())
+
+
+class TestHttpServer(unittest.IsolatedAsyncioTestCase):
+
+    async def test_metrics_route_served(self):
+        # Arrange
+        async def serve(request):
+            return HttpResponse(200, b'up 1\n')
+        server = await start_http_server({('GET', '/metrics'): serve}, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+
+        # Act
+        responses = []
+        for path in ('/metrics', '/missing'):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            responses.append(await reader.read())
+            writer.close()
+        server.close()
+        await server.wait_closed()
+
+        # Assert
+        self.assertTrue(responses[0].startswith(b'HTTP/1.1 200 OK'))
+        self.assertTrue(responses[0].endswith(b'up 1\n'))
+        self.assertTrue(responses[1].startswith(b'HTTP/1.1 404'))
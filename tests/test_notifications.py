@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import types
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import AsyncMock, patch
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from notifications import NotificationChannel, NotificationDispatcher, load_channel
+from telegram_channel import TelegramChannel
+
+
+class StandInTelegramHandler(BaseHTTPRequestHandler):
+    """
+    Answers the Bot API calls made by TelegramChannel and records every sent message.
+    """
+    messages = []
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode()
+        method = self.path.rsplit('/', 1)[-1]
+        if method == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "Avanguard", "username": "avanguard_bot"}
+        else:
+            fields = {key: values[0] for key, values in parse_qs(body).items()}
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                fields = json.loads(body)
+            self.messages.append(fields.get('text'))
+            result = {"message_id": len(self.messages), "date": 0,
+                      "chat": {"id": int(fields.get('chat_id', 1)), "type": "private"},
+                      "text": fields.get('text')}
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FlakyChannel(NotificationChannel):
+    name = 'flaky'
+
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.sent = []
+
+    async def send(self, title: str, body: str) -> None:
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("service unavailable")
+        self.sent.append((title, body))
+
+
+class TestNotificationDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_failed_send_is_retried_with_backoff(self):
+        # Arrange
+        channel = FlakyChannel(failures=2)
+        dispatcher = NotificationDispatcher([channel], backoff=0.01)
+        await dispatcher.start()
+
+        # Act
+        dispatcher.submit("Title", "Body")
+        await asyncio.wait_for(dispatcher.join(), 5)
+        await dispatcher.stop()
+
+        # Assert
+        self.assertEqual(channel.sent, [("Title", "Body")])
+
+    async def test_message_dropped_after_max_attempts(self):
+        # Arrange
+        channel = FlakyChannel(failures=10)
+        dispatcher = NotificationDispatcher([channel], max_attempts=3, backoff=0.01)
+        await dispatcher.start()
+
+        # Act
+        with self.assertLogs(level='ERROR') as log:
+            dispatcher.submit("Title", "Body")
+            await asyncio.wait_for(dispatcher.join(), 5)
+        await dispatcher.stop()
+
+        # Assert
+        self.assertEqual(channel.sent, [])
+        self.assertEqual(channel.failures, 7)
+        self.assertIn("after 3 attempts", log.output[0])
+
+    async def test_sends_are_paced_by_channel_rate(self):
+        # Arrange
+        channel = FlakyChannel(failures=0)
+        channel.rate = 20
+        channel.burst = 1
+        dispatcher = NotificationDispatcher([channel])
+        await dispatcher.start()
+        started = asyncio.get_running_loop().time()
+
+        # Act
+        for index in range(3):
+            dispatcher.submit("Title", str(index))
+        await asyncio.wait_for(dispatcher.join(), 5)
+        elapsed = asyncio.get_running_loop().time() - started
+        await dispatcher.stop()
+
+        # Assert
+        self.assertEqual(len(channel.sent), 3)
+        self.assertGreaterEqual(elapsed, 0.09)
+
+    async def test_slow_channel_does_not_block_others(self):
+        # Arrange
+        slow = FlakyChannel(failures=0)
+        slow.name = 'slow'
+        slow.send = AsyncMock(side_effect=lambda title, body: asyncio.sleep(10))
+        fast = FlakyChannel(failures=0)
+        dispatcher = NotificationDispatcher([slow, fast])
+        await dispatcher.start()
+
+        # Act
+        dispatcher.submit("Title", "Body")
+        await asyncio.wait_for(dispatcher.queues['flaky'].join(), 1)
+        await dispatcher.stop()
+
+        # Assert
+        self.assertEqual(fast.sent, [("Title", "Body")])
+
+
+class TestLoadChannel(unittest.TestCase):
+
+    def test_plugin_module_creates_channel(self):
+        # Arrange
+        plugin = types.ModuleType('flaky_plugin')
+        plugin.create_channel = lambda env: FlakyChannel(int(env['FLAKY_FAILURES']))
+
+        # Act
+        with patch.dict(sys.modules, {'flaky_plugin': plugin}):
+            channel = load_channel('flaky_plugin', {'FLAKY_FAILURES': '3'})
+
+        # Assert
+        self.assertIsInstance(channel, FlakyChannel)
+        self.assertEqual(channel.failures, 3)
+
+    def test_builtin_channel_requires_settings(self):
+        with self.assertRaises(ValueError):
+            load_channel('telegram', {'TELEGRAM_BOT_TOKEN': '123:token'})
+
+    def test_missing_plugin_raises_import_error(self):
+        with self.assertRaises(ImportError):
+            load_channel('no_such_channel_plugin', {})
+
+
+class TestTelegramChannel(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        StandInTelegramHandler.messages = []
+        self.http_server = ThreadingHTTPServer(('127.0.0.1', 0), StandInTelegramHandler)
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.http_server.server_port}/bot'
+
+    async def asyncTearDown(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+    async def test_messages_reuse_one_bot(self):
+        # Arrange
+        channel = TelegramChannel('123:token', '42', base_url=self.base_url)
+        dispatcher = NotificationDispatcher([channel])
+        await dispatcher.start()
+
+        # Act
+        dispatcher.submit("alpha is down!", "Downtime: 0:01:00")
+        dispatcher.submit("alpha is up!", "alpha back online after 0:01:00.")
+        await asyncio.wait_for(dispatcher.join(), 5)
+        await dispatcher.stop()
+
+        # Assert
+        self.assertEqual(StandInTelegramHandler.messages,
+                         ["alpha is down! Downtime: 0:01:00", "alpha is up! alpha back online after 0:01:00."])
@@ -0,0 +1,133 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from phi import PhiAccrualDetector
+from registry import HostRegistry
+
+
+class TestPhiAccrualDetector(unittest.TestCase):
+
+    def test_no_estimate_before_min_samples(self):
+        # Arrange
+        detector = PhiAccrualDetector(threshold=8, window=10, min_samples=3)
+
+        # Act
+        detector.record(0, 10.0)
+        detector.record(0, 10.0)
+
+        # Assert
+        self.assertIsNone(detector.timeout(0))
+        self.assertIsNone(detector.phi(0, 100.0))
+        self.assertIsNone(detector.timeout(5))
+
+    def test_phi_reaches_threshold_at_timeout(self):
+        # Arrange
+        detector = PhiAccrualDetector(threshold=8, window=50, min_std=0.1)
+        rng = random.Random(1)
+        for _ in range(50):
+            detector.record(0, rng.gauss(10.0, 1.0))
+
+        # Act
+        timeout = detector.timeout(0)
+
+        # Assert
+        self.assertAlmostEqual(detector.phi(0, timeout), 8.0, places=6)
+        self.assertLess(detector.phi(0, 10.0), 1.0)
+        self.assertGreater(timeout, 12.0)
+        self.assertLess(timeout, 20.0)
+
+    def test_jittery_hosts_get_longer_timeouts(self):
+        # Arrange
+        detector = PhiAccrualDetector(threshold=8, window=20, min_std=0.1)
+        rng = random.Random(2)
+        for _ in range(20):
+            detector.record(0, 10.0 + rng.uniform(-0.1, 0.1))
+            detector.record(1, 10.0 + rng.uniform(-5.0, 5.0))
+
+        # Act
+        stable, flaky = detector.timeout(0), detector.timeout(1)
+
+        # Assert
+        self.assertLess(stable, 12.0)
+        self.assertGreater(flaky, stable + 5.0)
+
+    def test_window_evicts_oldest_intervals(self):
+        # Arrange
+        detector = PhiAccrualDetector(threshold=8, window=5, min_samples=5, min_std=0.5)
+        for _ in range(5):
+            detector.record(0, 100.0)
+
+        # Act
+        for _ in range(5):
+            detector.record(0, 10.0)
+
+        # Assert
+        self.assertAlmostEqual(detector.timeout(0), 10.0 + detector._z * 0.5, places=3)
+
+    def test_reset_forgets_history(self):
+        # Arrange
+        detector = PhiAccrualDetector(threshold=8, window=5, min_samples=2)
+        detector.record(0, 10.0)
+        detector.record(0, 10.0)
+
+        # Act
+        detector.reset(0)
+
+        # Assert
+        self.assertIsNone(detector.timeout(0))
+
+    def test_rejects_invalid_settings(self):
+        for kwargs in ({'threshold': 0}, {'window': 1, 'min_samples': 1}, {'window': 4, 'min_samples': 5}):
+            with self.assertRaises(ValueError, msg=kwargs):
+                PhiAccrualDetector(**kwargs)
+
+
+class TestRegistryWithDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = HostRegistry(60, PhiAccrualDetector(threshold=8, window=10, min_samples=3, min_std=0.5))
+
+    def test_expiry_follows_detector_once_warmed_up(self):
+        # Arrange
+        for now in (1000.0, 1010.0, 1020.0):
+            self.registry.touch("alpha", now=now)
+        first_expiry = self.registry.deadlines.deadlines[0]
+
+        # Act
+        self.registry.touch("alpha", now=1030.0)
+        expiry = self.registry.deadlines.deadlines[0]
+
+        # Assert
+        self.assertEqual(first_expiry, 1080.0)
+        self.assertLess(expiry, 1045.0)
+        self.assertEqual(self.registry.pop_expired(now=1040.0), [])
+        self.assertEqual(self.registry.pop_expired(now=1045.0), [0])
+
+    def test_own_threshold_overrides_detector(self):
+        # Arrange
+        for now in (1000.0, 1010.0, 1020.0, 1030.0):
+            self.registry.touch("alpha", now=now)
+
+        # Act
+        self.registry.set_threshold(0, 300)
+
+        # Assert
+        self.assertEqual(self.registry.deadlines.deadlines[0], 1330.0)
+
+    def test_outage_is_not_recorded_as_interval(self):
+        # Arrange
+        for now in (1000.0, 1010.0, 1020.0, 1030.0):
+            self.registry.touch("alpha", now=now)
+        self.registry.mark_offline(0)
+
+        # Act
+        self.registry.touch("alpha", now=5000.0)
+
+        # Assert
+        self.assertIsNone(self.registry.detector.timeout(0))
+        self.assertEqual(self.registry.deadlines.deadlines[0], 5060.0)
+        self.assertIsNone(self.registry.phi_of(0, 5010.0))
@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import hmac
+import itertools
+import os
+import sys
+import time
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from protocol import BINARY_V1, BINARY_V2, GAUGE_ENTRY, MAX_FRAME_SIZE, MAX_RELAY_DIGEST_BODY, \
+    RELAY_DIGEST_HEADER, RELAY_DIGEST_V1, STREAM_MARKER, decode_binary_heartbeat, decode_gauges, \
+    decode_relay_digest, encode_binary_heartbeat, encode_frame, encode_relay_digests, expand_relay_digest, \
+    read_frame, sequence_counter
+
+
+class TestFraming(unittest.IsolatedAsyncioTestCase):
+
+    def make_reader(self, data: bytes, eof: bool = True) -> asyncio.StreamReader:
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        if eof:
+            reader.feed_eof()
+        return reader
+
+    async def test_frames_round_trip(self):
+        # Arrange
+        reader = self.make_reader(encode_frame(b'first') + encode_frame(b'second'))
+
+        # Act / Assert
+        self.assertEqual(await read_frame(reader), b'first')
+        self.assertEqual(await read_frame(reader), b'second')
+        self.assertIsNone(await read_frame(reader))
+
+    async def test_stream_starts_with_marker(self):
+        # Arrange
+        frame = encode_frame(b'heartbeat')
+        reader = self.make_reader(frame[1:])
+
+        # Act / Assert
+        self.assertEqual(frame[:1], STREAM_MARKER)
+        self.assertEqual(await read_frame(reader, frame[:1]), b'heartbeat')
+
+    async def test_truncated_frame_raises(self):
+        # Arrange
+        reader = self.make_reader(encode_frame(b'heartbeat')[:-2])
+
+        # Act / Assert
+        with self.assertRaises(asyncio.IncompleteReadError):
+            await read_frame(reader)
+
+    async def test_oversized_frame_rejected(self):
+        # Arrange
+        reader = self.make_reader((MAX_FRAME_SIZE + 1).to_bytes(4, 'big'))
+
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            await read_frame(reader)
+        with self.assertRaises(ValueError):
+            encode_frame(bytes(MAX_FRAME_SIZE + 1))
+
+
+class TestBinaryHeartbeat(unittest.TestCase):
+
+    def test_binary_heartbeat_round_trip(self):
+        # Arrange
+        data = encode_binary_heartbeat(b'alpha', 1234567890123456789, 42, b'supersecretkey')
+
+        # Act
+        heartbeat = decode_binary_heartbeat(data)
+
+        # Assert
+        self.assertEqual(data[0], BINARY_V1)
+        self.assertEqual(heartbeat.host_id, b'alpha')
+        self.assertEqual(heartbeat.timestamp_ns, 1234567890123456789)
+        self.assertEqual(heartbeat.sequence, 42)
+        expected = hmac.new(b'supersecretkey', heartbeat.signed, hashlib.sha256).digest()
+        self.assertEqual(bytes(heartbeat.digest), expected)
+
+    def test_heartbeat_with_gauges_round_trip(self):
+        # Arrange
+        data = encode_binary_heartbeat(b'alpha', 1, 42, b'supersecretkey', [(0, 1.5), (2, 87.25)])
+
+        # Act
+        heartbeat = decode_binary_heartbeat(data)
+
+        # Assert
+        self.assertEqual(data[0], BINARY_V2)
+        self.assertEqual(heartbeat.host_id, b'alpha')
+        self.assertEqual(heartbeat.sequence, 42)
+        self.assertEqual(decode_gauges(heartbeat.gauges), [(0, 1.5), (2, 87.25)])
+        expected = hmac.new(b'supersecretkey', heartbeat.signed, hashlib.sha256).digest()
+        self.assertEqual(bytes(heartbeat.digest), expected)
+        self.assertEqual(bytes(heartbeat.signed), data[:-32])
+        with self.assertRaises(ValueError):
+            decode_binary_heartbeat(data[:-1])
+
+    def test_sequence_numbers_continue_after_a_restart(self):
+        # Arrange
+        before = sequence_counter()
+        next(before)
+        last_before_restart = next(before)
+        time.sleep(0.001)
+
+        # Act
+        after = sequence_counter()
+
+        # Assert
+        self.assertGreater(next(after), last_before_restart)
+
+    def test_heartbeat_with_too_many_gauges_rejected(self):
+        # Arrange
+        # Encoded with one gauge, then given 60 in its place, as an encoder without the limit would
+        header = encode_binary_heartbeat(b'alpha', 1, 42, b'key', [(0, 1.0)])[:-32 - 1 - GAUGE_ENTRY.size]
+        signed = header + bytes([60]) + GAUGE_ENTRY.pack(0, 1.0) * 60
+        data = signed + hmac.new(b'key', signed, hashlib.sha256).digest()
+
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            decode_binary_heartbeat(data)
+
+    def test_unknown_version_rejected(self):
+        # Arrange
+        data = bytearray(encode_binary_heartbeat(b'alpha', 1, 1, b'key'))
+        data[0] = 0xB9
+
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            decode_binary_heartbeat(bytes(data))
+
+    def test_length_mismatch_rejected(self):
+        # Arrange
+        data = encode_binary_heartbeat(b'alpha', 1, 1, b'key')
+
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            decode_binary_heartbeat(data[:-1])
+
+
+class TestRelayDigest(unittest.TestCase):
+
+    def test_relay_digest_round_trip(self):
+        # Arrange
+        hosts = [(b'alpha', 0), (b'beta', 1500)]
+
+        # Act
+        digests = encode_relay_digests(b'edge1', hosts, 1234567890123456789, itertools.count(7), b'supersecretkey')
+        digest = decode_relay_digest(digests[0])
+
+        # Assert
+        self.assertEqual(len(digests), 1)
+        self.assertEqual(digests[0][0], RELAY_DIGEST_V1)
+        self.assertEqual(digest.relay_id, b'edge1')
+        self.assertEqual(digest.timestamp_ns, 1234567890123456789)
+        self.assertEqual(digest.sequence, 7)
+        expected = hmac.new(b'supersecretkey', digest.signed, hashlib.sha256).digest()
+        self.assertEqual(bytes(digest.digest), expected)
+        self.assertEqual(expand_relay_digest(digest), [('alpha', 0), ('beta', 1500)])
+
+    def test_empty_digest_still_sent(self):
+        # Act
+        digests = encode_relay_digests(b'edge1', [], 1, itertools.count(), b'key')
+
+        # Assert
+        self.assertEqual(len(digests), 1)
+        self.assertEqual(expand_relay_digest(decode_relay_digest(digests[0])), [])
+
+    def test_large_host_set_split_into_frames(self):
+        # Arrange
+        hosts = [(f'site{index % 50}/host{index}'.encode(), index % 5000) for index in range(20000)]
+
+        # Act
+        digests = encode_relay_digests(b'edge1', hosts, 1, itertools.count(), b'key')
+        decoded = [decode_relay_digest(data) for data in digests]
+
+        # Assert
+        self.assertGreater(len(digests), 1)
+        self.assertTrue(all(len(encode_frame(data)) <= MAX_FRAME_SIZE + 4 for data in digests))
+        self.assertEqual(len({digest.sequence for digest in decoded}), len(digests))
+        expanded = [host for digest in decoded for host in expand_relay_digest(digest)]
+        self.assertEqual(expanded, [(host_id.decode(), age_ms) for host_id, age_ms in hosts])
+
+    def test_oversized_or_corrupt_entries_rejected(self):
+        # Arrange
+        header = RELAY_DIGEST_HEADER.pack(RELAY_DIGEST_V1, 0, 1, 1, 1)
+        bomb = header + zlib.compress(bytes(MAX_RELAY_DIGEST_BODY + 1)) + bytes(32)
+        corrupt = header + b'not zlib' + bytes(32)
+        miscounted = encode_relay_digests(b'edge1', [(b'alpha', 0), (b'beta', 0)], 1, itertools.count(), b'key')[0]
+        miscounted = miscounted[:RELAY_DIGEST_HEADER.size - 2] + (1).to_bytes(2, 'big') \
+            + miscounted[RELAY_DIGEST_HEADER.size:]
+
+        # Act / Assert
+        for data in (bomb, corrupt, miscounted):
+            with self.assertRaises(ValueError):
+                expand_relay_digest(decode_relay_digest(data))
+        with self.assertRaises(ValueError):
+            decode_relay_digest(header[:-1])
@@ -0,0 +1,81 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from registry import HostRegistry
+
+
+class TestHostRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = HostRegistry(default_threshold=60)
+
+    def test_touch_adds_new_host_online(self):
+        # Act
+        downtime = self.registry.touch("alpha", now=1000.0)
+
+        # Assert
+        self.assertIsNone(downtime)
+        self.assertIn("alpha", self.registry)
+        status = self.registry.status(self.registry.lookup("alpha"))
+        self.assertFalse(status.offline)
+        self.assertEqual(status.threshold, 60)
+
+    def test_expired_hosts_are_tracked_separately(self):
+        # Arrange
+        self.registry.touch("alpha", now=1000.0)
+        self.registry.touch("beta", now=1050.0)
+
+        # Act
+        expired = self.registry.pop_expired(now=1070.0)
+
+        # Assert
+        self.assertEqual(expired, [self.registry.lookup("alpha")])
+        self.assertEqual(self.registry.pop_expired(now=1070.0), [])
+
+    def test_touch_after_offline_returns_downtime(self):
+        # Arrange
+        self.registry.touch("alpha", now=1000.0)
+        slot = self.registry.lookup("alpha")
+        self.registry.mark_offline(slot)
+
+        # Act
+        downtime = self.registry.touch("alpha", now=1400.0)
+
+        # Assert
+        self.assertEqual(downtime, 400.0)
+        self.assertEqual(self.registry.offline_count(), 0)
+
+    def test_per_host_threshold_overrides_default(self):
+        # Arrange
+        self.registry.touch("alpha", now=1000.0)
+        slot = self.registry.lookup("alpha")
+
+        # Act
+        self.registry.set_threshold(slot, 600)
+        self.registry.set_default_threshold(30)
+
+        # Assert
+        self.assertEqual(self.registry.threshold_of(slot), 600)
+        self.assertEqual(self.registry.pop_expired(now=1100.0), [])
+        self.assertEqual(self.registry.pop_expired(now=1600.0), [slot])
+
+    def test_each_consumer_takes_every_change(self):
+        # Arrange
+        self.registry.touch("alpha", now=1000.0)
+        self.registry.touch("beta", now=1000.0)
+        other = self.registry.track_changes()
+        self.registry.take_changes()
+
+        # Act
+        self.registry.touch("beta", now=1010.0)
+        saved = self.registry.take_changes()
+        self.registry.mark_offline(self.registry.lookup("alpha"))
+
+        # Assert
+        self.assertEqual(saved, [1])
+        self.assertEqual(self.registry.take_changes(other), [0, 1])
+        self.assertEqual(self.registry.take_changes(), [0])
+        self.assertEqual(self.registry.take_changes(other), [])
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from relay import RelayBuffer, RelayForwarder
+from protocol import decode_relay_digest, expand_relay_digest
+
+
+class RecordingSender:
+    """
+    Stands in for the upstream connection, keeping what was sent.
+    """
+
+    def __init__(self, connected: bool = True) -> None:
+        self.connected = connected
+        self.sent = []
+        self.closed = False
+
+    async def send(self, data: bytes) -> bool:
+        if self.connected:
+            self.sent.append(data)
+        return self.connected
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class TestRelayBuffer(unittest.TestCase):
+
+    def test_hosts_reported_once_with_latest_heartbeat(self):
+        # Arrange
+        buffer = RelayBuffer()
+
+        # Act
+        buffer.add('alpha', 100.0)
+        buffer.add('alpha', 105.0)
+        buffer.add('alpha', 103.0)
+        buffer.add('beta', 101.0)
+        seen = buffer.take()
+
+        # Assert
+        self.assertEqual(seen, {'alpha': 105.0, 'beta': 101.0})
+        self.assertEqual(len(buffer), 0)
+
+    def test_put_back_keeps_newer_and_drops_old(self):
+        # Arrange
+        buffer = RelayBuffer()
+        buffer.add('alpha', 120.0)
+
+        # Act
+        buffer.put_back({'alpha': 110.0, 'beta': 111.0, 'gamma': 50.0}, oldest=100.0)
+
+        # Assert
+        self.assertEqual(buffer.take(), {'alpha': 120.0, 'beta': 111.0})
+
+
+class TestRelayForwarder(unittest.IsolatedAsyncioTestCase):
+
+    async def test_forward_sends_signed_digest(self):
+        # Arrange
+        buffer = RelayBuffer()
+        sender = RecordingSender()
+        forwarder = RelayForwarder(buffer, sender, 'edge1', b'key', 5.0)
+        buffer.add('alpha')
+        buffer.add('beta')
+
+        # Act
+        forwarded = await forwarder.forward()
+        await forwarder.forward()
+
+        # Assert
+        self.assertTrue(forwarded)
+        first, second = (decode_relay_digest(data) for data in sender.sent)
+        self.assertEqual(first.relay_id, b'edge1')
+        self.assertEqual(sorted(host for host, _ in expand_relay_digest(first)), ['alpha', 'beta'])
+        self.assertEqual(expand_relay_digest(second), [])
+        self.assertGreater(second.sequence, first.sequence)
+
+    async def test_undelivered_hosts_go_out_with_next_digest(self):
+        # Arrange
+        buffer = RelayBuffer()
+        sender = RecordingSender(connected=False)
+        forwarder = RelayForwarder(buffer, sender, 'edge1', b'key', 5.0)
+        buffer.add('alpha')
+        buffer.add('stale', 0.0)
+
+        # Act
+        forwarded = await forwarder.forward()
+        sender.connected = True
+        await forwarder.forward()
+
+        # Assert
+        self.assertFalse(forwarded)
+        self.assertEqual([host for host, _ in expand_relay_digest(decode_relay_digest(sender.sent[0]))], ['alpha'])
+
+    async def test_run_forwards_every_interval(self):
+        # Arrange
+        sender = RecordingSender()
+        forwarder = RelayForwarder(RelayBuffer(), sender, 'edge1', b'key', 0.02)
+
+        # Act
+        task = asyncio.create_task(forwarder.run())
+        await asyncio.sleep(0.11)
+        task.cancel()
+        forwarder.close()
+
+        # Assert
+        self.assertGreaterEqual(len(sender.sent), 3)
+        self.assertTrue(sender.closed)
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from registry import HostRegistry
+from replication import ReplicaFollower, ReplicationSource, decode_hello, encode_hello
+from state import Settings, StateStore
+
+
+class TestHello(unittest.TestCase):
+
+    def test_hello_checked_against_key_and_clock(self):
+        # Arrange
+        now = time.time_ns()
+        hello = encode_hello(b'key', b'n' * 16, now)
+
+        # Act / Assert
+        self.assertEqual(decode_hello(hello, b'key', now), b'n' * 16)
+        with self.assertRaises(ValueError):
+            decode_hello(hello, b'other key', now)
+        with self.assertRaises(ValueError):
+            decode_hello(hello, b'key', now + 60 * 1_000_000_000)
+
+
+class TestReplication(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.registry = HostRegistry(60)
+        self.settings = Settings(60, None, 0)
+        self.source = ReplicationSource(self.registry, lambda: self.settings, b'key', 0.05)
+        self.listener = await asyncio.start_server(self.source.handle, '127.0.0.1', 0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+        self.ticker = asyncio.create_task(self.source.run())
+
+    async def asyncTearDown(self):
+        self.ticker.cancel()
+        self.source.close()
+        self.listener.close()
+        await self.listener.wait_closed()
+
+    async def wait_for(self, condition) -> None:
+        for _ in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+
+    async def test_standby_follows_full_state_then_deltas(self):
+        # Arrange
+        now = time.time()
+        self.registry.add('alpha', now)
+        self.registry.add('beta', now)
+        follower = ReplicaFollower('127.0.0.1', self.port, b'key', 0.5)
+        following = asyncio.create_task(follower.follow())
+        await self.wait_for(lambda: follower.state is not None)
+
+        # Act
+        self.registry.mark_offline(self.registry.lookup('beta'))
+        self.registry.add('gamma', now + 1)
+        self.registry.set_threshold(self.registry.lookup('alpha'), 300)
+        self.settings = Settings(90, now, 600)
+        await self.wait_for(lambda: len(follower.state.names) == 3 and follower.state.settings == self.settings)
+        silent_since = time.monotonic()
+        self.ticker.cancel()
+        state = await following
+
+        # Assert
+        self.assertGreaterEqual(time.monotonic() - silent_since, 0.4)
+        self.assertEqual(state.names, ['alpha', 'beta', 'gamma'])
+        self.assertEqual(list(state.offline), [0, 1, 0])
+        self.assertEqual(state.last_seen[2], now + 1)
+        self.assertEqual(state.thresholds[0], 300)
+        self.assertEqual(state.settings, Settings(90, now, 600))
+        self.assertEqual(self.registry.take_changes(), [0, 1, 2])
+
+    async def test_state_saves_and_replication_both_get_every_change(self):
+        # Arrange
+        now = time.time()
+        self.registry.add('alpha', now)
+        self.registry.add('beta', now)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = StateStore(directory.name)
+        store.save(self.registry, self.settings)
+        follower = ReplicaFollower('127.0.0.1', self.port, b'key', 2.0)
+        following = asyncio.create_task(follower.follow())
+        await self.wait_for(lambda: follower.state is not None)
+
+        # Act
+        self.registry.touch('alpha', now + 5)
+        store.save(self.registry, self.settings)
+        self.registry.touch('beta', now + 7)
+        await self.wait_for(lambda: list(follower.state.last_seen) == [now + 5, now + 7])
+        store.save(self.registry, self.settings)
+        following.cancel()
+
+        # Assert
+        self.assertEqual(list(follower.state.last_seen), [now + 5, now + 7])
+        self.assertEqual(list(StateStore(directory.name).load().last_seen), [now + 5, now + 7])
+
+    async def test_standby_with_wrong_key_gets_nothing(self):
+        # Arrange
+        self.registry.add('alpha', time.time())
+        follower = ReplicaFollower('127.0.0.1', self.port, b'wrong key', 0.3)
+
+        # Act
+        with self.assertLogs(level='WARNING'):
+            state = await follower.follow()
+
+        # Assert
+        self.assertIsNone(state)
+        self.assertEqual(self.source.links, [])
+
+    async def test_reconnected_standby_gets_full_state_again(self):
+        # Arrange
+        self.registry.add('alpha', time.time())
+        follower = ReplicaFollower('127.0.0.1', self.port, b'key', 2.0)
+        following = asyncio.create_task(follower.follow())
+        await self.wait_for(lambda: len(self.source.links) == 1)
+
+        # Act
+        for link in self.source.links:
+            link.writer.transport.abort()
+        self.registry.add('beta', time.time())
+        await self.wait_for(lambda: follower.state is not None and len(follower.state.names) == 2)
+        following.cancel()
+
+        # Assert
+        self.assertEqual(follower.state.names, ['alpha', 'beta'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,39 @@ import os
 import sys
 import hmac
 import hashlib
+import json
+import threading
+import asyncio
+import socket
+import subprocess
 import unittest
+import tempfile
 import time
-from unittest.mock import patch, AsyncMock
+import itertools
+import signal
+import struct
+from unittest.mock import patch, AsyncMock, MagicMock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
 
 sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '../src')))
-from server import try_notify_channels, is_heartbeat_valid
+import server
+from server import try_notify_channels, is_heartbeat_valid, validate_heartbeat, process_heartbeat_from_client, \
+    start_datagram_listener
+from registry import HostRegistry
+from auth import Keyring, ReplayGuard
+from admission import SourceLimiter
+from logtail import EventRing
+from protocol import GAUGE_NAMES, encode_binary_heartbeat, encode_frame, encode_relay_digests
+from cluster import EXPIRE, GAUGES, HEARTBEAT, TLS_HANDSHAKE, encode_update
+from relay import RelayBuffer, RelayForwarder
+from agent import OneshotSender, ReconnectBackoff, StreamSender
+from state import StateStore
+from history import HistoryStore
+from telemetry import TelemetryStore
+from tls import create_client_context, create_server_context
+from test_tls import make_self_signed_certificate
 
 
 class TestServer(unittest.TestCase):
@@ -58,6 +84,41 @@ class TestServer(unittest.TestCase):
         mock_log_info.assert_called_once_with('Notification "Test Title Test Body" snoozed, not sent.')
 
 
+class TestAlertDigest(unittest.TestCase):
+
+    @patch('server.notify_channels')
+    @patch('server.is_notification_allowed', return_value=False)
+    def test_snoozed_digest_not_sent(self, mock_allowed, mock_notify):
+        # Act
+        server.alert_aggregator.pending[('down', 'paris')] = [
+            ('paris/web0', 't', 'b', '0:01:00'), ('paris/web1', 't', 'b', '0:01:00')]
+        server.alert_aggregator.flush()
+
+        # Assert
+        mock_allowed.assert_called_once()
+        mock_notify.assert_not_called()
+
+
+class TestViewLogs(unittest.IsolatedAsyncioTestCase):
+
+    @patch('server.events', new_callable=lambda: EventRing(10))
+    async def test_view_logs_serves_filtered_events(self, mock_events):
+        # Arrange
+        mock_events.record('down', 'alpha is down', 'alpha')
+        mock_events.record('down', 'beta is down', 'beta')
+        update = MagicMock()
+        update.message.reply_text = AsyncMock()
+        context = MagicMock(args=['events', '5', 'host=beta'])
+
+        # Act
+        await server.telegram_command_view_logs(update, context)
+
+        # Assert
+        reply = update.message.reply_text.await_args[0][0]
+        self.assertIn('beta is down', reply)
+        self.assertNotIn('alpha is down', reply)
+
+
 class TestValidateHeartbeat(unittest.TestCase):
     
     def setUp(self):
@@ -70,3 +131,1136 @@ class TestValidateHeartbeat(unittest.TestCase):
     def test_validate_heartbeat(self):
         self.assertTrue(is_heartbeat_valid(self.valid_data))
 
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    def test_validate_heartbeat_with_host_id(self, mock_replay_guard):
+        # Arrange
+        message = f'heartbeat:alpha:{self.valid_timestamp}'.encode()
+        digest = hmac.new(self.test_secret_key, message, hashlib.sha256).hexdigest()
+        data = f'heartbeat:alpha:{self.valid_timestamp}:{digest}'.encode()
+
+        # Act / Assert
+        self.assertEqual(validate_heartbeat(data), "alpha")
+        self.assertIsNone(validate_heartbeat(data.replace(b'alpha', b'gamma')))
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    def test_validate_binary_heartbeat(self, mock_replay_guard):
+        # Arrange
+        data = encode_binary_heartbeat(b'alpha', time.time_ns(), 1, self.test_secret_key)
+        stale = encode_binary_heartbeat(b'alpha', time.time_ns() - 60 * 10**9, 2, self.test_secret_key)
+        forged = encode_binary_heartbeat(b'alpha', time.time_ns(), 3, b'wrongkey')
+
+        # Act / Assert
+        self.assertEqual(validate_heartbeat(data), "alpha")
+        self.assertIsNone(validate_heartbeat(stale))
+        self.assertIsNone(validate_heartbeat(forged))
+        self.assertIsNone(validate_heartbeat(data))  # Replay of an accepted heartbeat
+
+    def sign_text_heartbeat(self, timestamp: str) -> bytes:
+        message = f'heartbeat:alpha:{timestamp}'.encode()
+        return message + b':' + hmac.new(self.test_secret_key, message, hashlib.sha256).hexdigest().encode()
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    def test_future_heartbeat_does_not_move_the_replay_window(self, mock_replay_guard):
+        # Arrange
+        ahead = self.sign_text_heartbeat(str(time.time() + 60))
+        ahead_binary = encode_binary_heartbeat(b'alpha', time.time_ns() + 60 * 10**9, 1, self.test_secret_key)
+        current = self.sign_text_heartbeat(str(time.time()))
+
+        # Act
+        with self.assertLogs(level='WARNING'):
+            rejected = [validate_heartbeat(ahead), validate_heartbeat(ahead_binary)]
+
+        # Assert
+        self.assertEqual(rejected, [None, None])
+        self.assertEqual(len(mock_replay_guard), 0)
+        self.assertEqual(validate_heartbeat(current), "alpha")
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    def test_far_future_timestamp_rejected_without_overflow(self, mock_replay_guard):
+        # Arrange
+        data = self.sign_text_heartbeat('1e20')
+
+        # Act
+        with self.assertLogs(level='WARNING'):
+            result = validate_heartbeat(data)
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertEqual(len(mock_replay_guard), 0)
+
+
+class TestHeartbeatStream(unittest.IsolatedAsyncioTestCase):
+
+    def make_heartbeat(self, host_id: str) -> bytes:
+        message = f'heartbeat:{host_id}:{time.time()}'.encode()
+        digest = hmac.new(b'supersecretkey', message, hashlib.sha256).hexdigest()
+        return message + f':{digest}'.encode()
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.stream_close_grace', 2.0)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_stream_frames_and_close_expires_hosts(self, mock_registry, mock_replay_guard):
+        # Arrange
+        server = await asyncio.start_server(process_heartbeat_from_client, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+
+        # Act
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(encode_frame(self.make_heartbeat('alpha')))
+        writer.write(encode_frame(self.make_heartbeat('beta')))
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+        for _ in range(100):
+            if len(mock_registry) == 2 and mock_registry.deadlines.next_deadline() < time.time() + 10:
+                break
+            await asyncio.sleep(0.01)
+        server.close()
+        await server.wait_closed()
+
+        # Assert
+        self.assertIn('alpha', mock_registry)
+        self.assertIn('beta', mock_registry)
+        self.assertEqual(mock_registry.pop_expired(time.time() + 3), [0, 1])
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_datagram_listener_drains_batch(self, mock_registry, mock_replay_guard):
+        # Arrange
+        transport = await start_datagram_listener('127.0.0.1', 0)
+        address = transport.get_extra_info('sockname')
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        # Act
+        for index in range(50):
+            sender.sendto(self.make_heartbeat(f'host{index}'), address)
+        sender.sendto(b'heartbeat:garbage', address)
+        for _ in range(100):
+            if len(mock_registry) == 50:
+                break
+            await asyncio.sleep(0.01)
+        sender.close()
+        transport.close()
+
+        # Assert
+        self.assertEqual(len(mock_registry), 50)
+
+
+    @patch('server.read_timeout', 0.1)
+    @patch('server.connection_limiter', new_callable=lambda: server.ConnectionLimiter(1, wait=0.05))
+    async def test_idle_client_is_disconnected_and_frees_its_slot(self, mock_limiter):
+        # Arrange
+        listener = await asyncio.start_server(process_heartbeat_from_client, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+
+        # Act
+        idle_reader, idle_writer = await asyncio.open_connection('127.0.0.1', port)
+        refused_reader, refused_writer = await asyncio.open_connection('127.0.0.1', port)
+        refused = await asyncio.wait_for(refused_reader.read(), 1)
+        closed = await asyncio.wait_for(idle_reader.read(), 1)
+        idle_writer.close()
+        refused_writer.close()
+        listener.close()
+        await listener.wait_closed()
+
+        # Assert
+        self.assertEqual(refused, b'')
+        self.assertEqual(closed, b'')
+        self.assertEqual(mock_limiter.active, 0)
+
+    @patch('server.source_limiter', new_callable=lambda: server.SourceLimiter(rate=0.001, burst=5))
+    @patch('server.authenticate_heartbeat', return_value=None)
+    async def test_flooding_source_is_dropped_before_validation(self, mock_authenticate, mock_source_limiter):
+        # Arrange
+        transport = await start_datagram_listener('127.0.0.1', 0)
+        address = transport.get_extra_info('sockname')
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        # Act
+        for index in range(50):
+            sender.sendto(self.make_heartbeat(f'host{index}'), address)
+        await asyncio.sleep(0.2)
+        sender.close()
+        transport.close()
+
+        # Assert
+        self.assertEqual(mock_authenticate.call_count, 5)
+
+
+class TestWorkerMode(unittest.TestCase):
+
+    def make_heartbeat(self, host_id: str) -> bytes:
+        message = f'heartbeat:{host_id}:{time.time()}'.encode()
+        digest = hmac.new(b'supersecretkey', message, hashlib.sha256).hexdigest()
+        return message + f':{digest}'.encode()
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    @patch('server.update_sink')
+    def test_worker_forwards_authenticated_heartbeats(self, mock_sink, mock_registry, mock_replay_guard):
+        # Arrange
+        data = self.make_heartbeat('alpha')
+
+        # Act
+        host_id = server.accept_heartbeat(data, ('10.0.0.1', 4000))
+        server.accept_heartbeat(data.replace(b'alpha', b'gamma'), ('10.0.0.1', 4000))
+
+        # Assert
+        self.assertEqual(host_id, 'alpha')
+        self.assertEqual(mock_sink.add.call_count, 1)
+        self.assertEqual(mock_sink.add.call_args.args[:3], (HEARTBEAT, 'alpha', ('10.0.0.1', 4000)))
+        self.assertEqual(len(mock_registry), 0)
+        self.assertEqual(len(mock_replay_guard), 0)
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.update_sink')
+    def test_worker_rejects_host_ids_too_long_to_forward(self, mock_sink):
+        # Arrange
+        longest = self.make_heartbeat('a' * 255)
+        too_long = self.make_heartbeat('a' * 256)
+
+        # Act
+        with self.assertLogs(level='ERROR'):
+            rejected = server.accept_heartbeat(too_long, ('10.0.0.1', 4000))
+        accepted = server.accept_heartbeat(longest, ('10.0.0.1', 4000))
+
+        # Assert
+        self.assertIsNone(rejected)
+        self.assertEqual(accepted, 'a' * 255)
+        self.assertEqual(mock_sink.add.call_count, 1)
+
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    def test_coordinator_applies_updates_and_rejects_replays(self, mock_registry, mock_replay_guard):
+        # Arrange
+        now = time.time()
+        batch = (encode_update(HEARTBEAT, 'alpha', ('10.0.0.1', 4000), now, 5)
+                 + encode_update(HEARTBEAT, 'beta', ('10.0.0.2', 4000), now, 5)
+                 + encode_update(HEARTBEAT, 'alpha', ('10.0.0.1', 4000), now, 5)
+                 + encode_update(EXPIRE, 'beta', ('10.0.0.2', 4000), now + 1))
+
+        # Act
+        with patch('server.HEARTBEATS') as mock_heartbeats:
+            server.apply_worker_updates(batch)
+
+        # Assert
+        self.assertIn('alpha', mock_registry)
+        self.assertIn('beta', mock_registry)
+        labels = [call.kwargs['labels'] for call in mock_heartbeats.inc.call_args_list]
+        self.assertEqual(labels, [('accepted',), ('accepted',), ('replayed',)])
+        self.assertEqual(mock_registry.pop_expired(now + 2), [mock_registry.lookup('beta')])
+
+
+class TestTelemetry(unittest.IsolatedAsyncioTestCase):
+
+    def make_heartbeat(self, host_id: str, sequence: int, disk: float) -> bytes:
+        return encode_binary_heartbeat(host_id.encode(), time.time_ns(), sequence, b'supersecretkey',
+                                       [(GAUGE_NAMES.index('disk'), disk), (GAUGE_NAMES.index('load'), 0.5)])
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    @patch('server.telemetry_store', new_callable=lambda: TelemetryStore(limits={'disk': 90}))
+    @patch('server.alert_aggregator')
+    async def test_gauges_shown_in_status_and_alerted(self, mock_alert_aggregator, mock_telemetry_store,
+                                                      mock_registry, mock_replay_guard):
+        # Arrange
+        update = MagicMock()
+        update.message.reply_text = AsyncMock()
+
+        # Act
+        server.accept_heartbeat(self.make_heartbeat('alpha', 1, 80.0), ('10.0.0.1', 4000))
+        server.accept_heartbeat(self.make_heartbeat('alpha', 2, 95.0), ('10.0.0.1', 4000))
+        server.accept_heartbeat(self.make_heartbeat('alpha', 2, 50.0), ('10.0.0.1', 4000))  # Replayed
+        server.accept_heartbeat(self.make_heartbeat('beta', 1, 10.0), ('10.0.0.2', 4000))
+        await server.telegram_command_check_status(update, MagicMock(args=['alpha']))
+        await server.telegram_command_check_status(update, MagicMock(args=[]))
+
+        # Assert
+        self.assertEqual(mock_alert_aggregator.add.call_count, 1)
+        self.assertEqual(mock_alert_aggregator.add.call_args.args[:4],
+                         ('over the disk limit', '', 'alpha', 'alpha is over the disk limit!'))
+        replies = [call.args[0] for call in update.message.reply_text.await_args_list]
+        self.assertIn('disk: 95.0% (min 80.0%, avg 87.5%, max 95.0%), over the limit of 90.0%', replies[0])
+        self.assertIn('load: 0.50', replies[0])
+        self.assertIn('Over gauge limits: alpha (disk).', replies[1])
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    @patch('server.telemetry_store', new_callable=TelemetryStore)
+    def test_gauge_heartbeat_decoded_once(self, mock_telemetry_store, mock_registry, mock_replay_guard):
+        # Arrange
+        data = self.make_heartbeat('alpha', 1, 42.0)
+
+        # Act
+        with patch('server.decode_binary_heartbeat', wraps=server.decode_binary_heartbeat) as mock_decode:
+            host_id = server.accept_heartbeat(data, ('10.0.0.1', 4000))
+
+        # Assert
+        self.assertEqual(host_id, 'alpha')
+        self.assertEqual(mock_decode.call_count, 1)
+        self.assertEqual(mock_telemetry_store.latest_values('alpha'), {'disk': 42.0, 'load': 0.5})
+
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    @patch('server.telemetry_store', new_callable=TelemetryStore)
+    def test_coordinator_records_gauges_of_fresh_heartbeats_only(self, mock_telemetry_store, mock_registry,
+                                                                 mock_replay_guard):
+        # Arrange
+        now = time.time()
+        gauges = bytes([GAUGE_NAMES.index('disk')]) + struct.pack('!f', 42.0)
+        replayed = bytes([GAUGE_NAMES.index('disk')]) + struct.pack('!f', 99.0)
+        batch = (encode_update(HEARTBEAT, 'alpha', ('10.0.0.1', 4000), now, 5)
+                 + encode_update(GAUGES, 'alpha', None, now, 5, gauges)
+                 + encode_update(HEARTBEAT, 'alpha', ('10.0.0.1', 4000), now, 5)
+                 + encode_update(GAUGES, 'alpha', None, now, 5, replayed))
+
+        # Act
+        server.apply_worker_updates(batch)
+
+        # Assert
+        self.assertEqual(mock_telemetry_store.latest_values('alpha'), {'disk': 42.0})
+        self.assertEqual(mock_telemetry_store.rollup('alpha', 'disk', now).count, 1)
+
+
+class TestRelayDigests(unittest.IsolatedAsyncioTestCase):
+
+    def make_digest(self, hosts, sequence: int = 1, key: bytes = b'supersecretkey') -> bytes:
+        return encode_relay_digests(b'edge1', hosts, time.time_ns(), itertools.count(sequence), key)[0]
+
+    @patch('server.trusted_relays', {'edge1'})
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_digest_records_relay_and_its_hosts(self, mock_registry, mock_replay_guard):
+        # Arrange
+        data = self.make_digest([(b'alpha', 0), (b'beta', 2000)])
+        forged = self.make_digest([(b'gamma', 0)], sequence=2, key=b'wrongkey')
+
+        # Act
+        relay = server.accept_heartbeat(data, ('10.0.0.1', 4000))
+        replayed = server.accept_heartbeat(data, ('10.0.0.1', 4000))
+        rejected = server.accept_heartbeat(forged, ('10.0.0.1', 4000))
+
+        # Assert
+        self.assertEqual(relay, 'edge1')
+        self.assertIsNone(replayed)
+        self.assertIsNone(rejected)
+        self.assertEqual(sorted(mock_registry.names), ['alpha', 'beta', 'edge1'])
+        self.assertAlmostEqual(mock_registry.last_seen[mock_registry.lookup('beta')], time.time() - 2, delta=1)
+
+    @patch('server.trusted_relays', {'edge1'})
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(60))
+    async def test_relayed_heartbeat_older_than_threshold_ignored(self, mock_registry, mock_replay_guard):
+        # Arrange
+        mock_registry.mark_offline(mock_registry.add('alpha', time.time() - 300))
+
+        # Act
+        server.accept_heartbeat(self.make_digest([(b'alpha', 120_000)]), ('10.0.0.1', 4000))
+
+        # Assert
+        self.assertTrue(mock_registry.offline[mock_registry.lookup('alpha')])
+
+    @patch('server.trusted_relays', {'edge1'})
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_worker_forwards_digest_and_coordinator_drops_replays(self, mock_registry, mock_replay_guard):
+        # Arrange
+        data = self.make_digest([(b'alpha', 0), (b'beta', 0)])
+        sink = MagicMock()
+
+        # Act
+        with patch('server.update_sink', sink):
+            server.accept_heartbeat(data, ('10.0.0.1', 4000))
+        batch = sink.extend.call_args.args[0]
+        with patch('server.HEARTBEATS') as mock_heartbeats:
+            server.apply_worker_updates(batch + batch)
+
+        # Assert
+        labels = [call.kwargs['labels'] for call in mock_heartbeats.inc.call_args_list]
+        self.assertEqual(labels, [('accepted',), ('relayed',), ('relayed',), ('replayed',)])
+        self.assertEqual(sorted(mock_registry.names), ['alpha', 'beta', 'edge1'])
+
+    @patch('server.trusted_relays', {'edge1'})
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_digest_from_an_ordinary_host_refused(self, mock_registry, mock_replay_guard):
+        # Arrange
+        server.keyring.set_keys('alpha', [b'alphakey'])
+        data = encode_relay_digests(b'alpha', [(b'beta', 0)], time.time_ns(), itertools.count(1), b'alphakey')[0]
+
+        # Act
+        with patch('server.HEARTBEATS') as mock_heartbeats:
+            relay = server.accept_heartbeat(data, ('10.0.0.1', 4000))
+
+        # Assert
+        self.assertIsNone(relay)
+        self.assertEqual(len(mock_registry), 0)
+        self.assertEqual(mock_heartbeats.inc.call_args.kwargs['labels'], ('untrusted_relay',))
+
+    @patch('server.relay_buffer', new_callable=RelayBuffer)
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_relay_queues_heartbeats_instead_of_recording(self, mock_registry, mock_replay_guard,
+                                                                mock_relay_buffer):
+        # Arrange
+        data = encode_binary_heartbeat(b'alpha', time.time_ns(), 1, b'supersecretkey')
+
+        # Act
+        host_id = server.accept_heartbeat(data, ('10.0.0.1', 4000))
+
+        # Assert
+        self.assertEqual(host_id, 'alpha')
+        self.assertEqual(list(mock_relay_buffer.take()), ['alpha'])
+        self.assertEqual(len(mock_registry), 0)
+
+    @patch('server.trusted_relays', {'edge1'})
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_forwarder_reports_hosts_upstream(self, mock_registry, mock_replay_guard):
+        # Arrange
+        listener = await asyncio.start_server(process_heartbeat_from_client, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        buffer = RelayBuffer()
+        sender = StreamSender('127.0.0.1', port, 1.0, ReconnectBackoff())
+        forwarder = RelayForwarder(buffer, sender, 'edge1', b'supersecretkey', 5.0)
+        for index in range(1000):
+            buffer.add(f'host{index}')
+
+        # Act
+        forwarded = await forwarder.forward()
+        for _ in range(100):
+            if len(mock_registry) == 1001:
+                break
+            await asyncio.sleep(0.01)
+        forwarder.close()
+        listener.close()
+        await listener.wait_closed()
+
+        # Assert
+        self.assertTrue(forwarded)
+        self.assertEqual(len(mock_registry), 1001)
+        self.assertIn('edge1', mock_registry)
+
+
+class TestUptimeHistory(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.history = HistoryStore(self.directory.name)
+        self.history.open()
+
+    def tearDown(self):
+        self.history.close()
+        self.directory.cleanup()
+
+    @patch('server.alert_aggregator')
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_outages_recorded_and_reported(self, mock_registry, mock_alert_aggregator):
+        # Arrange
+        update = MagicMock()
+        update.message.reply_text = AsyncMock()
+        mock_registry.add('alpha', time.time() - 700)
+
+        # Act
+        with patch('server.history_store', self.history):
+            server.record_heartbeat('beta', ('10.0.0.1', 4000))
+            watchdog = asyncio.create_task(server.monitor_heartbeat_status())
+            await asyncio.sleep(0.05)
+            watchdog.cancel()
+            server.record_heartbeat('alpha', ('10.0.0.1', 4000))
+            await server.telegram_command_uptime(update, MagicMock(args=['alpha', '7']))
+            await server.telegram_command_uptime(update, MagicMock(args=['gamma']))
+
+        # Assert
+        self.assertEqual(sorted(self.history.index), ['alpha', 'beta'])
+        uptime = self.history.uptime('alpha', 0, time.time())
+        self.assertEqual(uptime.outages, 1)
+        self.assertAlmostEqual(uptime.downtime, 700, delta=5)
+        replies = [call.args[0] for call in update.message.reply_text.await_args_list]
+        self.assertIn('alpha over the last 7 days', replies[0])
+        self.assertIn('1 outages', replies[0])
+        self.assertIn('No history has been recorded for gamma', replies[1])
+
+    @patch('server.history_interval', 0.01)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_shutdown_waits_for_a_write_in_progress(self, mock_registry):
+        # Arrange
+        steps = []
+        started = threading.Event()
+        write = self.history.write
+
+        def slow_write(record, compact):
+            steps.append('write started')
+            started.set()
+            time.sleep(0.2)
+            write(record, compact)
+            steps.append('write finished')
+
+        # Act
+        with patch('server.history_store', self.history), patch.object(self.history, 'write', slow_write):
+            server.record_heartbeat('alpha', ('10.0.0.1', 4000))
+            writer = asyncio.create_task(server.run_history_writer())
+            await asyncio.to_thread(started.wait, 5)
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+            await server.wait_for_pending_writes()
+            steps.append('closing')
+
+        # Assert
+        self.assertEqual(steps, ['write started', 'write finished', 'closing'])
+
+    @patch('server.history_store', None)
+    async def test_uptime_needs_history(self):
+        # Arrange
+        update = MagicMock()
+        update.message.reply_text = AsyncMock()
+
+        # Act
+        await server.telegram_command_uptime(update, MagicMock(args=['alpha']))
+
+        # Assert
+        self.assertIn('HISTORY_DIR', update.message.reply_text.await_args.args[0])
+
+
+class TestWarmRestart(unittest.IsolatedAsyncioTestCase):
+
+    async def test_saved_state_is_restored(self):
+        # Arrange
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        before = HostRegistry(600)
+        before.add('alpha', now=time.time())
+        before.mark_offline(before.add('beta', now=time.time() - 900))
+        with patch('server.state_store', StateStore(directory.name)), patch('server.registry', before), \
+                patch('server.snooze_start_time', 1000), patch('server.snooze_duration', 3600):
+            await server.save_state()
+
+        # Act
+        after = HostRegistry(60)
+        with patch('server.state_store', StateStore(directory.name)), patch('server.registry', after), \
+                patch('server.events', EventRing(10)), patch('server.offline_threshold', 60), \
+                patch('server.snooze_start_time', None), patch('server.snooze_duration', 0):
+            server.restore_state()
+            settings = server.current_settings()
+            threshold = server.offline_threshold
+
+        # Assert
+        self.assertEqual(settings, (600, 1000, 3600))
+        self.assertEqual(threshold, 600)
+        self.assertEqual(after.names, ['alpha', 'beta'])
+        self.assertFalse(after.status(0).offline)
+        self.assertTrue(after.status(1).offline)
+
+
+    @patch('server.state_interval', 0.01)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_final_save_waits_for_a_write_in_progress(self, mock_registry):
+        # Arrange
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = StateStore(directory.name)
+        steps = []
+        started = threading.Event()
+        write = store.write
+
+        def slow_write(record, compact):
+            steps.append('write started')
+            started.set()
+            time.sleep(0.2)
+            write(record, compact)
+            steps.append('write finished')
+
+        # Act
+        with patch('server.state_store', store), patch.object(store, 'write', slow_write):
+            mock_registry.add('alpha', time.time())
+            saver = asyncio.create_task(server.run_state_saver())
+            await asyncio.to_thread(started.wait, 5)
+            saver.cancel()
+            await asyncio.gather(saver, return_exceptions=True)
+            await server.wait_for_pending_writes()
+            steps.append('final save')
+
+        # Assert
+        self.assertEqual(steps, ['write started', 'write finished', 'final save'])
+
+
+class TestTlsHeartbeats(unittest.IsolatedAsyncioTestCase):
+
+    def make_heartbeat(self, host_id: str) -> bytes:
+        message = f'heartbeat:{host_id}:{time.time()}'.encode()
+        digest = hmac.new(b'supersecretkey', message, hashlib.sha256).hexdigest()
+        return message + f':{digest}'.encode()
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    @patch('server.replay_guard', new_callable=ReplayGuard)
+    @patch('server.registry', new_callable=lambda: HostRegistry(600))
+    async def test_resumed_handshakes_are_counted(self, mock_registry, mock_replay_guard):
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory:
+            cert_file, key_file = make_self_signed_certificate(directory)
+            server_context = create_server_context(cert_file, key_file)
+            client_context = create_client_context(cert_file)
+        listener = await asyncio.start_server(process_heartbeat_from_client, '127.0.0.1', 0)
+        sender = OneshotSender('127.0.0.1', listener.sockets[0].getsockname()[1], 5, ReconnectBackoff(),
+                               client_context)
+
+        # Act
+        with patch('server.tls_context', server_context), patch.dict(server.TLS_HANDSHAKES.values, clear=True):
+            for host_id in ('alpha', 'beta', 'gamma', 'delta'):
+                self.assertTrue(await sender.send(self.make_heartbeat(host_id)))
+            handshakes = dict(server.TLS_HANDSHAKES.values)
+            ratio = server.TLS_RESUMPTION_RATIO.samples()
+        listener.close()
+        await listener.wait_closed()
+
+        # Assert
+        self.assertEqual(len(mock_registry), 4)
+        self.assertEqual(handshakes, {('full',): 1, ('resumed',): 3})
+        self.assertEqual(ratio, ['avanguard_tls_resumption_ratio 0.75'])
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    async def test_worker_forwards_handshakes(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory:
+            cert_file, key_file = make_self_signed_certificate(directory)
+            server_context = create_server_context(cert_file, key_file)
+            client_context = create_client_context(cert_file)
+        listener = await asyncio.start_server(process_heartbeat_from_client, '127.0.0.1', 0)
+        sender = OneshotSender('127.0.0.1', listener.sockets[0].getsockname()[1], 5, ReconnectBackoff(),
+                               client_context)
+        sink = MagicMock()
+
+        # Act
+        with patch('server.tls_context', server_context), patch('server.update_sink', sink), \
+                patch.dict(server.TLS_HANDSHAKES.values, clear=True):
+            for host_id in ('alpha', 'beta'):
+                self.assertTrue(await sender.send(self.make_heartbeat(host_id)))
+            handshakes = dict(server.TLS_HANDSHAKES.values)
+        listener.close()
+        await listener.wait_closed()
+
+        # Assert
+        forwarded = [call.args for call in sink.add.call_args_list if call.args[0] == TLS_HANDSHAKE]
+        self.assertEqual([args[4] for args in forwarded], [0, 1])
+        self.assertEqual(handshakes, {})
+
+    @patch('server.keyring', Keyring(b'supersecretkey'))
+    async def test_refused_connections_get_no_handshake(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory:
+            cert_file, key_file = make_self_signed_certificate(directory)
+            server_context = create_server_context(cert_file, key_file)
+            client_context = create_client_context(cert_file)
+        listener = await asyncio.start_server(process_heartbeat_from_client, '127.0.0.1', 0)
+        sender = OneshotSender('127.0.0.1', listener.sockets[0].getsockname()[1], 5, ReconnectBackoff(),
+                               client_context)
+
+        # Act
+        with patch('server.tls_context', server_context), patch('server.source_limiter', SourceLimiter(0.001, 1)), \
+                patch.object(server_context, 'wrap_bio', wraps=server_context.wrap_bio) as wrap, \
+                patch.dict(server.TLS_HANDSHAKES.values, clear=True):
+            sent = [await sender.send(self.make_heartbeat(host_id)) for host_id in ('alpha', 'beta', 'gamma')]
+            handshakes = dict(server.TLS_HANDSHAKES.values)
+        listener.close()
+        await listener.wait_closed()
+
+        # Assert
+        self.assertEqual(sent, [True, False, False])
+        self.assertEqual(wrap.call_count, 1)
+        self.assertEqual(handshakes, {('full',): 1})
+
+    def test_coordinator_counts_worker_handshakes(self):
+        # Arrange
+        batch = b''.join(encode_update(TLS_HANDSHAKE, '', None, 0.0, resumed) for resumed in (0, 1, 1, 1))
+
+        # Act
+        with patch.dict(server.TLS_HANDSHAKES.values, clear=True):
+            server.apply_worker_updates(batch)
+            handshakes = dict(server.TLS_HANDSHAKES.values)
+            ratio = server.TLS_RESUMPTION_RATIO.samples()
+
+        # Assert
+        self.assertEqual(handshakes, {('full',): 1, ('resumed',): 3})
+        self.assertEqual(ratio, ['avanguard_tls_resumption_ratio 0.75'])
+
+    @patch('server.server_ip', '127.0.0.1')
+    @patch('server.server_port', 0)
+    @patch('server.udp_port', 0)
+    async def test_listener_starts_without_tls(self):
+        # Act
+        with patch('server.tls_context', None), self.assertLogs(level='INFO') as log:
+            listener = asyncio.create_task(server.run_heartbeat_server())
+            await asyncio.sleep(0.05)
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+        # Assert
+        self.assertIn('Server started and is listening for heartbeats...', log.output[-1])
+
+
+def busy_wait(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestLoopInstrumentation(unittest.IsolatedAsyncioTestCase):
+
+    @patch('server.events', new_callable=lambda: EventRing(10))
+    @patch('server.slow_callback_threshold', 0.05)
+    async def test_blocked_loop_recorded_as_slow_event(self, mock_events):
+        # Arrange
+        instrumentation = asyncio.create_task(server.run_loop_instrumentation())
+        await asyncio.sleep(0.1)
+
+        # Act
+        busy_wait(0.3)
+        for _ in range(100):
+            if len(mock_events):
+                break
+            await asyncio.sleep(0.01)
+        instrumentation.cancel()
+        await asyncio.gather(instrumentation, return_exceptions=True)
+
+        # Assert
+        slow = mock_events.recent(10, kind='slow')
+        self.assertEqual(len(slow), 1)
+        self.assertIn('Event loop blocked for', slow[0].message)
+        self.assertIn('test_blocked_loop_recorded_as_slow_event', slow[0].message)
+
+    @patch('server.instrument', True)
+    @patch('server.profile_top', 5)
+    async def test_profile_command_reports_busy_function(self):
+        # Arrange
+        update = MagicMock()
+        update.message.reply_text = AsyncMock()
+
+        async def keep_busy():
+            while True:
+                busy_wait(0.01)
+                await asyncio.sleep(0)
+
+        busy = asyncio.create_task(keep_busy())
+
+        # Act
+        await server.telegram_command_profile(update, MagicMock(args=['1']))
+        busy.cancel()
+
+        # Assert
+        replies = [call.args[0] for call in update.message.reply_text.await_args_list]
+        self.assertEqual(replies[0], 'Profiling the event loop for 1s...')
+        self.assertTrue(replies[1].startswith('Event loop profile:'))
+        self.assertIn('busy_wait (tests/test_server.py:', replies[1])
+
+    @patch('server.instrument', False)
+    async def test_profile_command_needs_instrument(self):
+        # Arrange
+        update = MagicMock()
+        update.message.reply_text = AsyncMock()
+
+        # Act
+        await server.telegram_command_profile(update, MagicMock(args=[]))
+
+        # Assert
+        update.message.reply_text.assert_awaited_once_with(
+            "Profiling is only available when the server runs with --instrument.")
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server_process(test: unittest.TestCase, directory: str, port: int, **settings) -> subprocess.Popen:
+    env = dict(os.environ, SERVER_IP='127.0.0.1', SERVER_PORT=str(port), OFFLINE_THRESHOLD='60',
+               SECRET_KEY='supersecretkey', **settings)
+    script = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/server.py'))
+    process = subprocess.Popen([sys.executable, script, '--headless'], env=env, cwd=directory,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    test.addCleanup(process.wait, 10)
+    test.addCleanup(process.kill)
+    return process
+
+
+def wait_for_log(directory: str, text: str, timeout: float = 10, count: int = 1) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with open(os.path.join(directory, 'server_log.txt')) as log_file:
+                if log_file.read().count(text) >= count:
+                    return True
+        except FileNotFoundError:
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def send_text_heartbeat(port: int, host_id: str, key: bytes) -> None:
+    message = f'heartbeat:{host_id}:{time.time()}'.encode()
+    digest = hmac.new(key, message, hashlib.sha256).hexdigest()
+    with socket.create_connection(('127.0.0.1', port)) as client:
+        client.sendall(message + f':{digest}'.encode())
+
+
+class TestWorkerKeyring(unittest.TestCase):
+
+    @unittest.skipUnless(hasattr(signal, 'SIGHUP'), 'needs SIGHUP')
+    def test_workers_use_and_reload_per_host_keys(self):
+        # Arrange
+        port = free_port()
+        with tempfile.TemporaryDirectory() as directory:
+            keyring_path = os.path.join(directory, 'keys')
+            with open(keyring_path, 'w') as keyring_file:
+                keyring_file.write("alpha alphakey\n")
+            process = start_server_process(self, directory, port, SERVER_WORKERS='1', KEYRING_FILE=keyring_path,
+                                           LOG_SAMPLE_INTERVAL='0')
+            self.assertTrue(wait_for_log(directory, 'Heartbeat worker 0'))
+
+            # Act
+            send_text_heartbeat(port, 'alpha', b'alphakey')
+            accepted = wait_for_log(directory, 'Valid heartbeat received from alpha')
+            with open(keyring_path, 'w') as keyring_file:
+                keyring_file.write("alpha newkey\n")
+            process.send_signal(signal.SIGHUP)
+            reloaded = wait_for_log(directory, 'Loaded keys for 1 clients', count=3)
+            send_text_heartbeat(port, 'alpha', b'newkey')
+            accepted_after_reload = wait_for_log(directory, 'Valid heartbeat received from alpha', count=2)
+            with open(os.path.join(directory, 'server_log.txt')) as log_file:
+                log = log_file.read()
+
+        # Assert
+        self.assertTrue(accepted, log)
+        self.assertTrue(reloaded, log)
+        self.assertTrue(accepted_after_reload, log)
+        self.assertNotIn('Failed HMAC validation', log)
+        self.assertIsNone(process.poll())
+
+
+class TestReplicationFailover(unittest.TestCase):
+
+    def test_standby_takes_over_with_replicated_hosts(self):
+        # Arrange
+        self.port = free_port()
+        replication_port = free_port()
+        with tempfile.TemporaryDirectory() as primary_dir, tempfile.TemporaryDirectory() as standby_dir:
+            primary = start_server_process(self, primary_dir, self.port, REPLICATION_PORT=str(replication_port),
+                                           REPLICATION_INTERVAL='0.1')
+            self.assertTrue(wait_for_log(primary_dir, 'listening for heartbeats'))
+            start_server_process(self, standby_dir, self.port, REPLICATION_PRIMARY=f'127.0.0.1:{replication_port}',
+                                 REPLICATION_TIMEOUT='1')
+            self.assertTrue(wait_for_log(primary_dir, 'connected, sent 0 hosts'))
+
+            # Act
+            for host_id in ('alpha', 'beta'):
+                send_text_heartbeat(self.port, host_id, b'supersecretkey')
+            time.sleep(0.5)
+            primary.kill()
+            primary.wait(10)
+            took_over = wait_for_log(standby_dir, 'taking over with 2 hosts (0 offline)')
+            listening = wait_for_log(standby_dir, 'listening for heartbeats')
+
+        # Assert
+        self.assertTrue(took_over)
+        self.assertTrue(listening)
+
+    def test_standby_started_first_waits_for_the_primary(self):
+        # Arrange
+        port = free_port()
+        replication_port = free_port()
+        with tempfile.TemporaryDirectory() as primary_dir, tempfile.TemporaryDirectory() as standby_dir:
+            start_server_process(self, standby_dir, port, REPLICATION_PRIMARY=f'127.0.0.1:{replication_port}',
+                                 REPLICATION_TIMEOUT='1')
+            waiting = wait_for_log(standby_dir, 'still standing by')
+            time.sleep(1.5)
+            with open(os.path.join(standby_dir, 'server_log.txt')) as log_file:
+                log_before_primary = log_file.read()
+
+            # Act
+            primary = start_server_process(self, primary_dir, port, REPLICATION_PORT=str(replication_port),
+                                           REPLICATION_INTERVAL='0.1')
+            self.assertTrue(wait_for_log(primary_dir, 'connected, sent 0 hosts'))
+            send_text_heartbeat(port, 'alpha', b'supersecretkey')
+            time.sleep(0.5)
+            primary.kill()
+            primary.wait(10)
+            took_over = wait_for_log(standby_dir, 'taking over with 1 hosts (0 offline)')
+
+        # Assert
+        self.assertTrue(waiting, log_before_primary)
+        self.assertNotIn('listening for heartbeats', log_before_primary)
+        self.assertTrue(took_over)
+
+    def test_cold_takeover_only_when_enabled(self):
+        # Arrange
+        port = free_port()
+        with tempfile.TemporaryDirectory() as directory:
+            # Act
+            start_server_process(self, directory, port, REPLICATION_PRIMARY=f'127.0.0.1:{free_port()}',
+                                 REPLICATION_TIMEOUT='1', REPLICATION_COLD_TAKEOVER='1')
+            listening = wait_for_log(directory, 'listening for heartbeats')
+            notified = wait_for_log(directory, 'Sent notification')
+            with open(os.path.join(directory, 'server_log.txt')) as log_file:
+                log = log_file.read()
+
+        # Assert
+        self.assertTrue(listening, log)
+        self.assertTrue(notified, log)
+        self.assertIn('took over from the primary', log)
+        self.assertIn('without its state', log)
+
+    def test_standby_steps_down_when_the_primary_returns(self):
+        # Arrange
+        primary_port = free_port()
+        standby_port = free_port()
+        replication_port = free_port()
+        primary_settings = dict(REPLICATION_PORT=str(replication_port), REPLICATION_INTERVAL='0.1')
+        with tempfile.TemporaryDirectory() as primary_dir, tempfile.TemporaryDirectory() as standby_dir:
+            primary = start_server_process(self, primary_dir, primary_port, **primary_settings)
+            self.assertTrue(wait_for_log(primary_dir, 'listening for heartbeats'))
+            standby = start_server_process(self, standby_dir, standby_port,
+                                           REPLICATION_PRIMARY=f'127.0.0.1:{replication_port}', REPLICATION_TIMEOUT='1')
+            self.assertTrue(wait_for_log(primary_dir, 'connected, sent 0 hosts'))
+            primary.kill()
+            primary.wait(10)
+            self.assertTrue(wait_for_log(standby_dir, 'listening for heartbeats'))
+
+            # Act
+            start_server_process(self, primary_dir, primary_port, **primary_settings)
+            stepped_down = wait_for_log(standby_dir, 'is serving again, stepping down')
+            exit_code = standby.wait(10)
+
+        # Assert
+        self.assertTrue(stepped_down)
+        self.assertEqual(exit_code, 1)
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_import_needs_no_settings_or_notification_libraries(self):
+        # Arrange
+        env = {key: value for key, value in os.environ.items()
+               if key not in ('SERVER_PORT', 'OFFLINE_THRESHOLD', 'SECRET_KEY')}
+        env['PYTHONPATH'] = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+        probe = "import sys, server; print(sorted({'telegram', 'pushbullet'} & set(sys.modules)))"
+
+        # Act
+        with tempfile.TemporaryDirectory() as directory:
+            result = subprocess.run([sys.executable, '-c', probe], env=env, cwd=directory,
+                                    capture_output=True, text=True, timeout=30)
+            created = os.listdir(directory)
+
+        # Assert
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '[]')
+        self.assertEqual(created, [])
+
+    def test_log_max_bytes_of_zero_disables_size_rotation(self):
+        # Arrange
+        env = dict(os.environ, PYTHONPATH=os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+        probe = "import server; print(server.log_max_bytes)"
+        results = []
+
+        # Act
+        with tempfile.TemporaryDirectory() as directory:
+            for value in ('0', '', None):
+                env.pop('LOG_MAX_BYTES', None)
+                if value is not None:
+                    env['LOG_MAX_BYTES'] = value
+                results.append(subprocess.run([sys.executable, '-c', probe], env=env, cwd=directory,
+                                              capture_output=True, text=True, timeout=30).stdout.strip())
+
+        # Assert
+        self.assertEqual(results, ['0', str(10 * 1024 * 1024), str(10 * 1024 * 1024)])
+
+    def test_main_rejects_missing_settings(self):
+        # Act
+        with patch.dict(os.environ, {'SERVER_PORT': ''}), patch('sys.stderr'), \
+                self.assertRaises(SystemExit) as raised:
+            server.main([])
+
+        # Assert
+        self.assertEqual(raised.exception.code, 2)
+
+    @patch('server.tls_cert_file', '/nonexistent/cert.pem')
+    def test_main_rejects_unreadable_certificate(self):
+        # Act
+        with patch('sys.stderr'), self.assertRaises(SystemExit) as raised:
+            server.main([])
+
+        # Assert
+        self.assertEqual(raised.exception.code, 2)
+        self.assertIsNone(server.tls_context)
+
+    @patch('server.telemetry_alerts', 'cpu>90')
+    def test_main_rejects_unknown_gauge_limit(self):
+        # Act
+        with patch('sys.stderr'), self.assertRaises(SystemExit) as raised:
+            server.main([])
+
+        # Assert
+        self.assertEqual(raised.exception.code, 2)
+
+    @patch('server.telegram_bot_token', 'token')
+    @patch('server.telegram_id_to_notify', '42')
+    @patch('server.pushbullet_use', 'True')
+    @patch('server.notification_channels', None)
+    def test_enabled_channels(self):
+        # Act
+        configured = server.enabled_channels()
+        with patch('server.notification_channels', 'pushbullet, my_channel'):
+            explicit = server.enabled_channels()
+        with patch('server.headless', True):
+            headless = server.enabled_channels()
+
+        # Assert
+        self.assertEqual(configured, ['telegram', 'pushbullet'])
+        self.assertEqual(explicit, ['pushbullet', 'my_channel'])
+        self.assertEqual(headless, [])
+
+
+STATUS_UPDATE = {
+    "update_id": 1001,
+    "message": {
+        "message_id": 7, "date": 1700000000, "text": "/status alpha",
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Ops"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": 7}],
+    },
+}
+
+
+class StandInBotApi(BaseHTTPRequestHandler):
+    """
+    Answers the Bot API calls made while handling commands and records the replies.
+    """
+    replies = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        method = self.path.rsplit('/', 1)[-1]
+        if method == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "Avanguard", "username": "avanguard_bot"}
+        else:
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                fields = json.loads(body)
+            else:
+                fields = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+            self.replies.append(fields.get('text'))
+            result = {"message_id": len(self.replies), "date": 0, "chat": {"id": 42, "type": "private"},
+                      "text": fields.get('text')}
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestTelegramWebhook(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        StandInBotApi.replies = []
+        self.bot_api = ThreadingHTTPServer(('127.0.0.1', 0), StandInBotApi)
+        threading.Thread(target=self.bot_api.serve_forever, daemon=True).start()
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        registry = HostRegistry(600)
+        registry.add('alpha')
+        self.patches = [
+            patch('server.registry', registry),
+            patch('server.telegram_bot_token', '123:token'),
+            patch('server.telegram_api_url', f'http://127.0.0.1:{self.bot_api.server_port}/bot'),
+            patch('server.telegram_mode', 'webhook'),
+            patch('server.telegram_webhook_url', None),
+            patch('server.telegram_webhook_port', self.port),
+            patch('server.telegram_webhook_secret', 'hook-secret'),
+        ]
+        for active in self.patches:
+            active.start()
+        self.bot = asyncio.create_task(server.initialize_telegram_bot())
+        for _ in range(200):
+            if server.telegram_application is not None:
+                try:
+                    _, writer = await asyncio.open_connection('127.0.0.1', self.port)
+                    writer.close()
+                    break
+                except OSError:
+                    pass
+            await asyncio.sleep(0.01)
+
+    async def asyncTearDown(self):
+        self.bot.cancel()
+        await asyncio.gather(self.bot, return_exceptions=True)
+        for active in self.patches:
+            active.stop()
+        self.bot_api.shutdown()
+        self.bot_api.server_close()
+
+    async def post_update(self, update: dict, secret: str) -> int:
+        body = json.dumps(update).encode()
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(f"POST /telegram HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                     f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\nContent-Length: {len(body)}\r\n\r\n"
+                     .encode() + body)
+        response = await reader.read()
+        writer.close()
+        return int(response.split()[1])
+
+    async def test_posted_command_is_answered(self):
+        # Act
+        status = await self.post_update(STATUS_UPDATE, 'hook-secret')
+        for _ in range(200):
+            if StandInBotApi.replies:
+                break
+            await asyncio.sleep(0.01)
+
+        # Assert
+        self.assertEqual(status, 200)
+        self.assertEqual(len(StandInBotApi.replies), 1)
+        self.assertTrue(StandInBotApi.replies[0].startswith("alpha is currently Online"))
+
+    async def test_wrong_secret_and_bad_payload_are_rejected(self):
+        # Act
+        forbidden = await self.post_update(STATUS_UPDATE, 'guess')
+        malformed = await self.post_update({"message": "not an update"}, 'hook-secret')
+        await asyncio.sleep(0.05)
+
+        # Assert
+        self.assertEqual(forbidden, 403)
+        self.assertEqual(malformed, 400)
+        self.assertEqual(StandInBotApi.replies, [])
+
+    async def test_help_lists_only_registered_commands(self):
+        # Arrange
+        update = MagicMock()
+        update.message.reply_text = AsyncMock()
+        registered = {command for handler in server.telegram_application.handlers[0] for command in handler.commands}
+
+        # Act
+        await server.telegram_command_show_help(update, MagicMock(args=[]))
+
+        # Assert
+        help_text = update.message.reply_text.await_args[0][0]
+        advertised = {line.split()[0][1:] for line in help_text.splitlines() if line.startswith('/')}
+        self.assertEqual(advertised, registered)
@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from registry import HostRegistry
+from state import LOG_FILE, SNAPSHOT_FILE, Settings, StateStore
+
+SETTINGS = Settings(60, None, 0)
+
+
+def restore(saved, not_before=0.0):
+    registry = HostRegistry(saved.settings.default_threshold)
+    registry.restore(saved.names, saved.group_names, saved.last_seen, saved.down_since, saved.thresholds,
+                     saved.offline, saved.groups, not_before=not_before)
+    return registry
+
+
+class TestStateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_nothing_saved(self):
+        # Act
+        saved = StateStore(self.path).load()
+
+        # Assert
+        self.assertIsNone(saved)
+
+    def test_snapshot_and_changes_round_trip(self):
+        # Arrange
+        registry = HostRegistry(60)
+        store = StateStore(self.path)
+        registry.add('web1', now=100.0, group='site-a')
+        registry.add('web2', now=100.0)
+        store.save(registry, SETTINGS)
+        registry.touch('web1', now=130.0)
+        registry.mark_offline(registry.lookup('web2'))
+        registry.add('db1', now=140.0, group='site-b')
+        registry.set_threshold(registry.lookup('db1'), 300)
+        store.save(registry, Settings(60, 120.0, 600))
+
+        # Act
+        saved = StateStore(self.path).load()
+        restored = restore(saved)
+
+        # Assert
+        self.assertGreater(os.path.getsize(os.path.join(self.path, LOG_FILE)), 0)
+        self.assertEqual(saved.settings, Settings(60, 120.0, 600))
+        self.assertEqual(restored.names, ['web1', 'web2', 'db1'])
+        self.assertEqual(restored.status(0), registry.status(0))
+        self.assertEqual(restored.status(1), registry.status(1))
+        self.assertEqual(restored.status(2), registry.status(2))
+        self.assertEqual(restored.group_of(2), 'site-b')
+        self.assertEqual(restored.lookup('db1'), 2)
+
+    def test_unchanged_hosts_are_not_rewritten(self):
+        # Arrange
+        registry = HostRegistry(60)
+        store = StateStore(self.path)
+        for index in range(1000):
+            registry.add(f'host{index}', now=100.0)
+        store.save(registry, SETTINGS)
+        snapshot_size = os.path.getsize(os.path.join(self.path, SNAPSHOT_FILE))
+
+        # Act
+        registry.touch('host7', now=150.0)
+        store.save(registry, SETTINGS)
+
+        # Assert
+        log_size = os.path.getsize(os.path.join(self.path, LOG_FILE))
+        self.assertLess(log_size, snapshot_size // 100)
+        self.assertEqual(restore(StateStore(self.path).load()).last_seen[7], 150.0)
+
+    def test_changes_taken_by_another_consumer_are_still_saved(self):
+        # Arrange
+        registry = HostRegistry(60)
+        store = StateStore(self.path)
+        registry.add('web1', now=100.0)
+        registry.add('web2', now=100.0)
+        other = registry.track_changes()
+        store.save(registry, SETTINGS)
+
+        # Act
+        registry.touch('web2', now=150.0)
+        registry.take_changes(other)
+        registry.touch('web1', now=160.0)
+        store.save(registry, SETTINGS)
+
+        # Assert
+        self.assertEqual(list(restore(StateStore(self.path).load()).last_seen), [160.0, 150.0])
+
+    def test_torn_tail_is_ignored_and_truncated(self):
+        # Arrange
+        registry = HostRegistry(60)
+        store = StateStore(self.path)
+        registry.add('web1', now=100.0)
+        store.save(registry, SETTINGS)
+        registry.touch('web1', now=110.0)
+        store.save(registry, SETTINGS)
+        log_path = os.path.join(self.path, LOG_FILE)
+        valid_size = os.path.getsize(log_path)
+        registry.touch('web1', now=120.0)
+        record, _ = store.prepare(registry, SETTINGS)
+        with open(log_path, 'ab') as log_file:
+            log_file.write(record[:-3])  # Crash in the middle of an append
+
+        # Act
+        reopened = StateStore(self.path)
+        saved = reopened.load()
+        registry.touch('web1', now=130.0)
+        reopened.save(registry, SETTINGS)
+
+        # Assert
+        self.assertEqual(saved.last_seen[0], 110.0)
+        self.assertGreater(os.path.getsize(log_path), valid_size)
+        self.assertEqual(StateStore(self.path).load().last_seen[0], 130.0)
+
+    def test_log_records_older_than_the_snapshot_are_skipped(self):
+        # Arrange
+        registry = HostRegistry(60)
+        store = StateStore(self.path, min_compact_bytes=0)
+        registry.add('web1', now=100.0)
+        store.save(registry, SETTINGS)
+        for now in (105.0, 110.0):
+            registry.touch('web1', now=now)
+            store.save(registry, SETTINGS)
+        with open(os.path.join(self.path, LOG_FILE), 'rb') as log_file:
+            stale_log = log_file.read()
+        registry.touch('web1', now=120.0)
+        store.save(registry, SETTINGS)  # The log is larger than the snapshot, so it is compacted
+        with open(os.path.join(self.path, LOG_FILE), 'wb') as log_file:
+            log_file.write(stale_log)  # Crash after the rename, before the log was emptied
+
+        # Act
+        saved = StateStore(self.path).load()
+
+        # Assert
+        self.assertEqual(saved.last_seen[0], 120.0)
+
+    def test_restore_keeps_offline_hosts_offline(self):
+        # Arrange
+        registry = HostRegistry(60)
+        store = StateStore(self.path)
+        registry.add('web1', now=100.0)
+        registry.add('web2', now=100.0)
+        registry.mark_offline(registry.pop_expired(now=170.0)[0])
+        registry.touch('web2', now=165.0)
+        store.save(registry, SETTINGS)
+
+        # Act
+        restored = restore(StateStore(self.path).load(), not_before=400.0)
+
+        # Assert
+        self.assertTrue(restored.status(0).offline)
+        self.assertEqual(restored.status(0).down_since, 100.0)
+        self.assertEqual(restored.pop_expired(now=399.0), [])
+        self.assertEqual(restored.pop_expired(now=400.0), [1])
+        self.assertEqual(restored.touch('web1', now=500.0), 400.0)
+
+    def test_large_registry_saves_and_restores_quickly(self):
+        # Arrange
+        registry = HostRegistry(60)
+        store = StateStore(self.path)
+        for index in range(100_000):
+            registry.add(f'host{index}', now=100.0, group=f'site{index % 10}')
+        store.save(registry, SETTINGS)
+        for index in range(0, 100_000, 100):
+            registry.touch(f'host{index}', now=150.0)
+
+        # Act
+        started = time.perf_counter()
+        store.save(registry, SETTINGS)
+        saved_in = time.perf_counter() - started
+        started = time.perf_counter()
+        restored = restore(StateStore(self.path).load())
+        restored_in = time.perf_counter() - started
+
+        # Assert
+        self.assertEqual(len(restored), 100_000)
+        self.assertEqual(restored.last_seen[99_900], 150.0)
+        self.assertEqual(restored.group_of(99_999), 'site9')
+        self.assertLess(saved_in, 0.5)
+        self.assertLess(restored_in, 2.0)
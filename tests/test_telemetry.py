@@ -0,0 +1,100 @@
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from protocol import GAUGE_NAMES
+from telemetry import GaugeAlert, Rollup, TelemetryStore, parse_limits, read_gauges
+
+LOAD = GAUGE_NAMES.index('load')
+DISK = GAUGE_NAMES.index('disk')
+
+
+class TestTelemetryStore(unittest.TestCase):
+
+    def test_rollup_over_buckets(self):
+        # Arrange
+        store = TelemetryStore(buckets=4, bucket_seconds=60)
+
+        # Act
+        store.record('alpha', 1000, [(LOAD, 1.0), (DISK, 50.0)])
+        store.record('alpha', 1010, [(LOAD, 3.0)])
+        store.record('alpha', 1070, [(LOAD, 2.0), (DISK, 60.0)])
+
+        # Assert
+        self.assertEqual(store.rollup('alpha', 'load', 1070), Rollup(1.0, 3.0, 2.0, 3))
+        self.assertEqual(store.rollup('alpha', 'disk', 1070), Rollup(50.0, 60.0, 55.0, 2))
+        self.assertIsNone(store.rollup('alpha', 'swap', 1070))
+        self.assertIsNone(store.rollup('beta', 'load', 1070))
+        self.assertEqual(store.latest_values('alpha'), {'load': 2.0, 'disk': 60.0})
+
+    def test_old_buckets_age_out_and_are_reused(self):
+        # Arrange
+        store = TelemetryStore(buckets=4, bucket_seconds=60)
+        store.record('alpha', 0, [(LOAD, 9.0)])
+
+        # Act
+        store.record('alpha', 4 * 60, [(LOAD, 1.0)])  # Same ring position, four periods later
+        store.record('alpha', 5 * 60, [(LOAD, 2.0)])
+
+        # Assert
+        self.assertEqual(store.rollup('alpha', 'load', 5 * 60), Rollup(1.0, 2.0, 1.5, 2))
+        self.assertEqual(store.rollup('alpha', 'load', 7 * 60 + 59), Rollup(1.0, 2.0, 1.5, 2))
+        self.assertEqual(store.rollup('alpha', 'load', 8 * 60), Rollup(2.0, 2.0, 2.0, 1))
+        self.assertIsNone(store.rollup('alpha', 'load', 9 * 60))
+
+    def test_alerts_when_crossing_limits(self):
+        # Arrange
+        store = TelemetryStore(limits={'disk': 90})
+
+        # Act
+        alerts = [store.record('alpha', 0, [(DISK, value)]) for value in (80.0, 95.0, 97.0, 85.0)]
+
+        # Assert
+        self.assertEqual(alerts, [[], [GaugeAlert('disk', 95.0, 90, True)], [],
+                                  [GaugeAlert('disk', 85.0, 90, False)]])
+        self.assertEqual(store.over_limits(), {})
+        store.record('alpha', 1, [(DISK, 91.0), (LOAD, math.nan), (200, 1.0)])
+        self.assertEqual(store.over_limits(), {'alpha': ['disk']})
+        self.assertEqual(store.latest_values('alpha'), {'disk': 91.0})
+
+    def test_memory_does_not_grow_with_heartbeats(self):
+        # Arrange
+        store = TelemetryStore(buckets=12, bucket_seconds=300)
+        for host in range(100):
+            store.record(f'host{host}', 0, [(LOAD, 1.0)])
+        sizes = [len(column) for column in (store.periods, store.minimum, store.count, store.latest)]
+
+        # Act
+        for second in range(0, 86400, 30):
+            store.record('host0', second, [(LOAD, second % 7), (DISK, 40.0)])
+
+        # Assert
+        self.assertEqual([len(column) for column in (store.periods, store.minimum, store.count, store.latest)],
+                         sizes)
+        self.assertEqual(store.rollup('host0', 'load', 86399).count, 12 * 10)
+
+
+class TestLimitsAndGauges(unittest.TestCase):
+
+    def test_parse_limits(self):
+        # Act / Assert
+        self.assertEqual(parse_limits('disk>90, load>8'), {'disk': 90.0, 'load': 8.0})
+        self.assertEqual(parse_limits(''), {})
+        for text in ('disk=90', 'cpu>5', 'disk>full'):
+            with self.assertRaises(ValueError):
+                parse_limits(text)
+
+    def test_read_gauges(self):
+        # Act
+        gauges = dict(read_gauges(GAUGE_NAMES, os.path.dirname(__file__)))
+
+        # Assert
+        self.assertIn(DISK, gauges)
+        self.assertTrue(all(math.isfinite(value) for value in gauges.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
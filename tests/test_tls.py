@@ -0,0 +1,149 @@
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '../src')))
+from tls import create_client_context, create_server_context
+from agent import OneshotSender, ReconnectBackoff, StreamSender
+
+
+def make_self_signed_certificate(directory: str):
+    """
+    Generates a certificate for 127.0.0.1 and localhost with the openssl command, or skips
+    the test if it is not installed.
+
+    Returns:
+        Tuple[str, str]: The certificate and key files.
+    """
+    if shutil.which('openssl') is None:
+        raise unittest.SkipTest('openssl is not installed')
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    result = subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                             '-keyout', key_file, '-out', cert_file, '-subj', '/CN=localhost',
+                             '-addext', 'subjectAltName=IP:127.0.0.1,DNS:localhost'],
+                            capture_output=True, timeout=60)
+    if result.returncode != 0:
+        raise unittest.SkipTest(f'openssl failed: {result.stderr.decode(errors="replace")}')
+    return cert_file, key_file
+
+
+class TestSessionResumption(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cert_file, self.key_file = make_self_signed_certificate(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def serve(self, listener: socket.socket, connections: int, received: list) -> None:
+        context = create_server_context(self.cert_file, self.key_file)
+        for _ in range(connections):
+            connection, _ = listener.accept()
+            with context.wrap_socket(connection, server_side=True) as tls_connection:
+                received.append((tls_connection.recv(1024), tls_connection.session_reused))
+
+    def test_client_resumes_remembered_session(self):
+        # Arrange
+        listener = socket.create_server(('127.0.0.1', 0))
+        port = listener.getsockname()[1]
+        received = []
+        thread = threading.Thread(target=self.serve, args=(listener, 3, received))
+        thread.start()
+        context = create_client_context(self.cert_file)
+
+        # Act
+        for index in range(3):
+            with context.wrap_socket(socket.create_connection(('127.0.0.1', port), 5),
+                                     server_hostname='127.0.0.1') as client_socket:
+                client_socket.sendall(b'heartbeat %d' % index)
+                while client_socket.recv(1024):
+                    pass
+                context.remember(client_socket)
+        thread.join(5)
+        listener.close()
+
+        # Assert
+        self.assertEqual(received, [(b'heartbeat 0', False), (b'heartbeat 1', True), (b'heartbeat 2', True)])
+
+    def test_client_rejects_untrusted_certificate(self):
+        # Arrange
+        listener = socket.create_server(('127.0.0.1', 0))
+        port = listener.getsockname()[1]
+        thread = threading.Thread(target=lambda: listener.accept()[0].close())
+        thread.start()
+        with tempfile.TemporaryDirectory() as other_directory:
+            other_cert_file, _ = make_self_signed_certificate(other_directory)
+            context = create_client_context(other_cert_file)
+
+        # Act / Assert
+        with self.assertRaises(OSError):
+            context.wrap_socket(socket.create_connection(('127.0.0.1', port), 5), server_hostname='127.0.0.1')
+        thread.join(5)
+        listener.close()
+
+
+class TestAgentTls(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        cert_file, key_file = make_self_signed_certificate(self.directory.name)
+        self.received = []
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0,
+                                                 ssl=create_server_context(cert_file, key_file))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.client_context = create_client_context(cert_file)
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.directory.cleanup()
+
+    async def handle(self, reader, writer):
+        data = await reader.read(1024)
+        self.received.append((data, writer.get_extra_info('ssl_object').session_reused))
+        writer.close()
+
+    async def test_oneshot_sender_resumes_session(self):
+        # Arrange
+        sender = OneshotSender('127.0.0.1', self.port, 5, ReconnectBackoff(), self.client_context)
+
+        # Act
+        results = [await sender.send(b'one'), await sender.send(b'two')]
+
+        # Assert
+        self.assertEqual(results, [True, True])
+        self.assertEqual(self.received, [(b'one', False), (b'two', True)])
+
+    async def test_stream_sender_resumes_session_on_reconnect(self):
+        # Arrange
+        sender = StreamSender('127.0.0.1', self.port, 5, ReconnectBackoff(), self.client_context)
+
+        # Act
+        self.assertTrue(await sender.send(b'one'))
+        for _ in range(100):
+            if self.received:
+                break
+            await asyncio.sleep(0.01)
+        sender.close()
+        self.assertTrue(await sender.send(b'two'))
+        for _ in range(100):
+            if len(self.received) == 2:
+                break
+            await asyncio.sleep(0.01)
+        sender.close()
+
+        # Assert
+        self.assertEqual([reused for _, reused in self.received], [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()